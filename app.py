@@ -1,12 +1,19 @@
 import streamlit as st
 from langgraph_client import LangGraphLocalClient
+from metrics import start_metrics_server
+from jobs import TERMINAL, JobConfig, get_job_queue
+from checkpointer import CheckpointConfig
 import pandas as pd
 import logging
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Prometheus /metrics when METRICS_PORT is set
+start_metrics_server()
+
 st.set_page_config(
     page_title="AI Research Assistant v1.0 (Mini)",
     page_icon="📋",
@@ -22,11 +29,13 @@ if not st.session_state.api_key_entered:
         st.header("API Configuration")
         google_api_key = st.text_input("Enter your Google API Key:", type="password", key="google_api_key_input", value="")
         tavily_api_key = st.text_input("Enter your Tavily API Key:", type="password", key="tavily_api_key_input", value="")
+        resume_thread_id = st.text_input("Resume thread (optional):", key="resume_thread_input", value="")
         if st.button("Set API Key"):
             if google_api_key and tavily_api_key:
                 logger.info("Initializing LangGraphLocalClient...")
-                st.session_state["client"] = LangGraphLocalClient(google_api_key, tavily_api_key)
-                st.session_state["response"] = None
+                st.session_state["client"] = LangGraphLocalClient(google_api_key, tavily_api_key, thread_id=resume_thread_id or None)
+                # A checkpointed thread picks up where it stopped
+                st.session_state["response"] = st.session_state["client"].get_state() if resume_thread_id else None
                 st.session_state.api_key_entered = True
                 st.success("API Key set successfully!") 
                 st.rerun()
@@ -93,6 +102,7 @@ if not st.session_state.api_key_entered:
     st.stop() 
 
 st.title("AI Research Assistant v1.0")
+st.sidebar.caption(f"Thread: {st.session_state['client'].thread_id}")
 
 if not st.session_state["response"]:
     with st.sidebar:
@@ -107,7 +117,7 @@ if not st.session_state["response"]:
     
     # User inputs
     topic = st.text_area("Enter your research topic:", height=100, value="Renewable Energy Solutions for a Sustainable Future")
-    max_analysts = st.number_input("Number of analysts:", min_value=1, max_value=3, value=3)
+    max_analysts = st.number_input("Number of analysts:", min_value=1, max_value=50, value=3)
 
     if st.button("Generate Analysts"):
         logger.info("Generating analysts...")
@@ -198,16 +208,56 @@ if st.session_state["response"]:
         st.dataframe(data_final, use_container_width=True)
 
         if st.button("Start Research"):
-            logger.info("Starting research...")
-            with st.spinner("Conducting research..."):
-                input_data = {}
-                with st.container(height=300):
-                    st.write_stream(st.session_state["client"].run_graph_stream(input_data=input_data))
-            
+            client = st.session_state["client"]
+            if CheckpointConfig.BACKEND == "sqlite":
+                logger.info("Queueing research job...")
+                configurable = {key: value for key, value in client.config["configurable"].items() if key != "thread_id"}
+                # A worker process runs the research on this thread; the page only watches its progress
+                st.session_state["job_id"] = get_job_queue().submit(config=configurable, thread_id=client.thread_id)
+            else:
+                # Workers can only resume a thread they can read, so without a durable checkpointer research runs here
+                logger.info("Starting research...")
+                with st.spinner("Conducting research..."):
+                    with st.container(height=300):
+                        st.write_stream(client.run_graph_stream(input_data={}))
+                st.session_state["result"] = client.get_state()
+
+        if st.session_state.get("job_id"):
+            job_queue = get_job_queue()
+            job = job_queue.get(st.session_state["job_id"])
+            with st.container(height=300):
+                st.write("".join(event["text"] for event in job_queue.events(st.session_state["job_id"]) if event.get("text")))
+            if job["status"] not in TERMINAL:
+                # Poll with a rerun rather than blocking the script thread until the job finishes
+                with st.spinner("Conducting research..."):
+                    time.sleep(JobConfig.POLL_SECONDS)
+                st.rerun()
+            if job["status"] != "completed":
+                st.error(f"Research {job['status']}: {job['error']}")
+                st.stop()
+            st.session_state["result"] = job["result"]
+
+        if st.session_state.get("result"):
             logger.info("Research completed, updating final report...")
-            client_state = st.session_state["client"].get_state()
-            logger.debug(f"Client state: {client_state}")
-            final_report = client_state["final_report"]
+            final_report = st.session_state["result"]["final_report"]
             st.header("Final Report")
             st.markdown(final_report)
+
+            run_metrics = st.session_state["result"].get("run_metrics")
+            if run_metrics:
+                st.header("Cost and Latency")
+                totals = run_metrics["totals"]
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("Node time", f"{totals['wall_seconds']:.1f}s")
+                col2.metric("Throttled", f"{totals['throttled_seconds']:.1f}s")
+                col3.metric("Tokens in / out", f"{totals['input_tokens']:,} / {totals['output_tokens']:,}")
+                col4.metric("Est. cost", f"${totals['cost_usd']:.4f}")
+                columns = ["runs", "wall_seconds", "throttled_seconds", "llm_calls", "input_tokens", "output_tokens",
+                           "search_calls", "search_results", "search_bytes", "cost_usd"]
+                st.subheader("By node")
+                st.dataframe(pd.DataFrame.from_dict(run_metrics["by_node"], orient="index")[columns]
+                             .sort_values("wall_seconds", ascending=False), use_container_width=True)
+                st.subheader("By analyst")
+                st.dataframe(pd.DataFrame.from_dict(run_metrics["by_analyst"], orient="index")[columns],
+                             use_container_width=True)
                 
\ No newline at end of file
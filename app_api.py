@@ -40,7 +40,7 @@ st.title("AI Research Assistant v1.0")
 if not st.session_state["response"]:
     # User inputs
     topic = st.text_area("Enter research topic:", height=100, value="Climate change")
-    max_analysts = st.number_input("Number of analysts:", min_value=1, max_value=3, value=3)
+    max_analysts = st.number_input("Number of analysts:", min_value=1, max_value=50, value=3)
 
     if st.button("Generate Analysts"):
         logger.info("Generating analysts...")
@@ -0,0 +1,165 @@
+"""
+Headless batch research over a file of topics.
+
+    python batch.py topics.csv --output reports/ --concurrency 4 --analysts 3
+
+Topics come from a CSV file with a "topic" column (optional "id" and "analysts" columns), a JSONL file of
+{"topic": ..., "id": ..., "analysts": ...} objects or plain strings, or a text file with one topic per line.
+Analyst selection is auto-approved. Topics run concurrently on the graph_memory pipeline and share the
+process-wide rate limiters, so the free-tier budgets hold for the whole batch. Each finished topic writes
+<slug>.md and <slug>.metrics.json to the output directory and a line to manifest.jsonl.
+
+Re-running the same command skips completed topics. Each topic's thread id is derived from the output directory
+and the topic, so with the SQLite checkpointer a topic that was cut off resumes from its last checkpoint.
+API keys are read from GOOGLE_API_KEY and TAVILY_API_KEY.
+"""
+import os
+import re
+import csv
+import json
+import time
+import uuid
+import hashlib
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+
+def read_topics(path, default_analysts=3):
+    """ [{"id", "topic", "analysts"}] from a CSV, JSONL or text file """
+    rows = []
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    rows.append(item if isinstance(item, dict) else {"topic": item})
+        elif path.endswith(".csv"):
+            reader = csv.DictReader(f)
+            if not reader.fieldnames:
+                raise ValueError(f"{path} is empty or has no header row; expected a 'topic' column")
+            column = "topic" if "topic" in (reader.fieldnames or []) else reader.fieldnames[0]
+            rows = [dict(row, topic=row[column]) for row in reader]
+        else:
+            rows = [{"topic": line.strip()} for line in f if line.strip()]
+    topics = []
+    for row in rows:
+        topic = (row.get("topic") or "").strip()
+        if not topic:
+            continue
+        topics.append({"id": safe_id(row.get("id")) if row.get("id") else slugify(topic), "topic": topic,
+                       "analysts": int(row.get("analysts") or default_analysts)})
+    return topics
+
+
+def slugify(topic):
+    slug = re.sub(r"[^a-z0-9]+", "-", topic.lower()).strip("-")[:60]
+    return f"{slug}-{hashlib.sha256(topic.encode('utf-8')).hexdigest()[:8]}"
+
+
+def safe_id(topic_id):
+    """ The topic id as a file name: kept if it is one, else slugified so it cannot leave the output directory """
+    topic_id = str(topic_id).strip()
+    return topic_id if re.fullmatch(r"[A-Za-z0-9][A-Za-z0-9_.-]*", topic_id) else slugify(topic_id)
+
+
+class Manifest:
+    """ Append-only record of finished topics in the output directory """
+    def __init__(self, output):
+        self.path = os.path.join(output, "manifest.jsonl")
+        self._lock = threading.Lock()
+
+    def completed(self):
+        done = set()
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line cut off by a kill
+                    if entry["status"] == "completed":
+                        done.add(entry["id"])
+        return done
+
+    def append(self, entry):
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def _write_atomic(path, text):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def run_one(item, output, configurable):
+    """ Research one topic to its final report and write the report and metrics """
+    from graph import graph_memory
+    from jobs import run_research
+
+    thread_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{os.path.abspath(output)}|{item['id']}"))
+    config = {"configurable": dict(configurable, thread_id=thread_id)}
+    started = time.perf_counter()
+    values = run_research(graph_memory, config, item["topic"], item["analysts"])
+    elapsed = time.perf_counter() - started
+    _write_atomic(os.path.join(output, f"{item['id']}.md"), values["final_report"])
+    metrics = dict(values.get("run_metrics") or {}, topic=item["topic"], seconds=elapsed)
+    _write_atomic(os.path.join(output, f"{item['id']}.metrics.json"), json.dumps(metrics, indent=2))
+    return thread_id, elapsed
+
+
+def run_batch(topics, output, concurrency=4, configurable=None):
+    """ Run every topic not yet completed in `output`; returns (completed, failed) counts """
+    os.makedirs(output, exist_ok=True)
+    manifest = Manifest(output)
+    done = manifest.completed()
+    pending = [item for item in topics if item["id"] not in done]
+    logger.info(f"{len(topics)} topics, {len(topics) - len(pending)} already done, {len(pending)} to run")
+    completed = failed = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(run_one, item, output, configurable or {}): item for item in pending}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                thread_id, elapsed = future.result()
+            except Exception as e:
+                failed += 1
+                logger.error(f"Topic {item['id']} failed: {e}")
+                manifest.append({"id": item["id"], "topic": item["topic"], "status": "failed", "error": f"{type(e).__name__}: {e}"})
+                continue
+            completed += 1
+            manifest.append({"id": item["id"], "topic": item["topic"], "status": "completed", "thread_id": thread_id,
+                             "report": f"{item['id']}.md", "seconds": round(elapsed, 2)})
+            logger.info(f"[{completed + failed}/{len(pending)}] {item['topic']} done in {elapsed:.1f}s")
+    return completed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("topics", help="CSV, JSONL or text file of topics")
+    parser.add_argument("--output", default="reports", help="directory for reports, metrics and the manifest")
+    parser.add_argument("--concurrency", type=int, default=4, help="topics researched at once")
+    parser.add_argument("--analysts", type=int, default=3, help="analysts per topic unless the file sets them")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra configurable option for every topic, e.g. synthesis_mode=single")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    configurable = {"google_api_key": os.environ.get("GOOGLE_API_KEY", ""),
+                    "tavily_api_key": os.environ.get("TAVILY_API_KEY", "")}
+    for option in args.set:
+        key, _, value = option.partition("=")
+        configurable[key] = value
+    topics = read_topics(args.topics, args.analysts)
+    completed, failed = run_batch(topics, args.output, args.concurrency, configurable)
+    print(f"{completed} completed, {failed} failed; reports in {args.output}")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Checkpoint size and write latency of the research graph per checkpointer and serializer.
+
+Runs the full flow on the offline fake backends for each variant and reports the bytes stored, the number of
+checkpoint and pending-write calls, their mean and p95 latency, and the time to load the final state:
+
+    python -m benchmarks.bench_checkpoint --topics 2 --analysts 3
+    python -m benchmarks.bench_checkpoint --compact --response-words 600
+
+"memory" is the previous in-process MemorySaver with the default JSON-plus/msgpack serializer; the sqlite
+variants add compression and content-addressed texts one at a time.
+"""
+import os
+import argparse
+import tempfile
+import time
+import uuid
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from benchmarks.bench_e2e import TOPICS, percentile
+from checkpointer import CheckpointSerializer, SQLiteSaver, zstandard
+from fake_backends import configure_fakes
+from llm_model import LLMConfig, SearchConfig, client_pool
+from rate_limiter import configure_rate_limit, reset_rate_limits
+from cache import configure_retrieval_cache, configure_response_cache
+from cassette import configure_cassette
+
+# name -> (compression, text_min_bytes); None is the stock serializer
+VARIANTS = {
+    "sqlite": None,
+    "sqlite+zlib": ("zlib", 0),
+    "sqlite+cas": ("none", 256),
+    "sqlite+cas+zlib": ("zlib", 256),
+    "sqlite+cas+zstd": ("zstd", 256),
+}
+
+
+def timed(calls, fn):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            calls.append(time.perf_counter() - started)
+    return wrapper
+
+
+def memory_bytes(saver):
+    size = 0
+    for namespaces in saver.storage.values():
+        for checkpoints in namespaces.values():
+            for checkpoint, metadata, _ in checkpoints.values():
+                size += len(checkpoint[1]) + len(metadata[1])
+    size += sum(len(blob[1]) for blob in saver.blobs.values())
+    size += sum(len(write[2][1]) for writes in saver.writes.values() for write in writes.values())
+    return size
+
+
+def sqlite_bytes(saver):
+    return sum(saver._conn.execute(query).fetchone()[0] or 0 for query in (
+        "SELECT SUM(LENGTH(checkpoint) + LENGTH(metadata)) FROM checkpoints",
+        "SELECT SUM(LENGTH(value)) FROM blobs",
+        "SELECT SUM(LENGTH(value)) FROM writes",
+        "SELECT SUM(LENGTH(data)) FROM texts"))
+
+
+def make_saver(name, directory, compact):
+    if name == "memory":
+        return MemorySaver()
+    path = os.path.join(directory, f"{name}.sqlite")
+    saver = SQLiteSaver(path, keep_history=not compact, serde=JsonPlusSerializer())
+    if VARIANTS[name] is not None:
+        compression, text_min_bytes = VARIANTS[name]
+        saver.serde = CheckpointSerializer(store=saver, compression=compression, text_min_bytes=text_min_bytes)
+    return saver
+
+
+def run_variant(name, topics, analysts, directory, compact):
+    from graph import builder
+
+    saver = make_saver(name, directory, compact)
+    puts, writes = [], []
+    saver.put = timed(puts, saver.put)
+    saver.put_writes = timed(writes, saver.put_writes)
+    graph = builder.compile(interrupt_before=["human_feedback", "human_conduct_interview"], checkpointer=saver)
+    configs = []
+    started = time.perf_counter()
+    for topic in topics:
+        config = {"configurable": {"thread_id": str(uuid.uuid4()), "google_api_key": "fake", "tavily_api_key": "fake"}}
+        graph.invoke({"topic": topic, "max_analysts": analysts}, config)
+        graph.update_state(config, {"human_analyst_feedback": ["approved"]})
+        graph.invoke(None, config)
+        graph.invoke(None, config)
+        configs.append(config)
+    elapsed = time.perf_counter() - started
+    loaded = time.perf_counter()
+    for config in configs:
+        graph.get_state(config)
+    load_ms = (time.perf_counter() - loaded) / len(configs) * 1000
+    size = memory_bytes(saver) if name == "memory" else sqlite_bytes(saver)
+    return {"name": name, "bytes": size, "puts": puts, "writes": writes, "elapsed": elapsed, "load_ms": load_ms}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topics", type=int, default=2)
+    parser.add_argument("--analysts", type=int, default=3)
+    parser.add_argument("--response-words", type=int, default=400, help="words per fake answer and search document")
+    parser.add_argument("--compact", action="store_true", help="keep only the latest checkpoint per thread (sqlite)")
+    parser.add_argument("--variants", nargs="*", default=None, help="subset of: memory " + " ".join(VARIANTS))
+    args = parser.parse_args()
+
+    LLMConfig.BACKEND = "fake"
+    SearchConfig.BACKEND = "fake"
+    configure_cassette("off")
+    client_pool.clear()
+    configure_fakes(llm_latency=0, search_latency=0, error_rate=0, response_words=args.response_words)
+    reset_rate_limits()
+    for provider, model in (("google", None), ("google", LLMConfig.DEFAULT), ("google", LLMConfig.VERSATILE),
+                            ("google", LLMConfig.CREATIVE), ("tavily", None), ("wikipedia", None)):
+        configure_rate_limit(provider, model)
+    configure_retrieval_cache("none")
+    configure_response_cache("none")
+
+    variants = args.variants or ["memory", *VARIANTS]
+    if zstandard is None and "sqlite+cas+zstd" in variants:
+        variants.remove("sqlite+cas+zstd")
+        print("zstandard is not installed; skipping sqlite+cas+zstd")
+    topics = [TOPICS[i % len(TOPICS)] for i in range(args.topics)]
+
+    print(f"{'variant':<18} {'KiB':>9} {'ratio':>6} {'puts':>5} {'put ms':>7} {'p95':>7} "
+          f"{'writes':>6} {'write ms':>8} {'p95':>7} {'load ms':>8}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as directory:
+        for name in variants:
+            result = run_variant(name, topics, args.analysts, directory, args.compact)
+            baseline = baseline or result["bytes"]
+            puts, writes = result["puts"], result["writes"]
+            print(f"{name:<18} {result['bytes'] / 1024:>9.1f} {result['bytes'] / baseline:>6.2f} {len(puts):>5} "
+                  f"{sum(puts) / len(puts) * 1000:>7.2f} {percentile(puts, 0.95) * 1000:>7.2f} {len(writes):>6} "
+                  f"{sum(writes) / len(writes) * 1000:>8.2f} {percentile(writes, 0.95) * 1000:>7.2f} "
+                  f"{result['load_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
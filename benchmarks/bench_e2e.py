@@ -0,0 +1,212 @@
+"""
+End-to-end benchmark of the research graph on the offline fake LLM and search backends.
+
+Drives the full flow (create_analysts -> human_feedback -> select_analysts -> interviews -> report) for
+N topics x M analysts, auto-approving the analysts, and reports p50/p95 latency per node, wall time and
+peak memory. No API keys are needed and runs are reproducible for a given seed:
+
+    python -m benchmarks.bench_e2e --topics 4 --analysts 3 --llm-latency 0.2 --search-latency 0.3
+    python -m benchmarks.bench_e2e --async --concurrency 4 --error-rate 0.05
+    python -m benchmarks.bench_e2e --analysts 8 --max-inflight 2 --llm-latency 0.2 --synthesis-mode incremental
+
+Record a live run once, then replay the identical traffic offline to profile orchestration on its own:
+
+    GOOGLE_API_KEY=... TAVILY_API_KEY=... python -m benchmarks.bench_e2e --live --record run.jsonl.gz
+    python -m benchmarks.bench_e2e --replay run.jsonl.gz --replay-latency none
+"""
+import os
+import argparse
+import asyncio
+import resource
+import threading
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from fake_backends import configure_fakes
+from llm_model import LLMConfig, SearchConfig, client_pool, resilience_metrics
+from rate_limiter import configure_rate_limit, reset_rate_limits
+from cache import configure_retrieval_cache, configure_response_cache
+from cassette import configure_cassette
+from interview_scheduler import configure_interview_scheduler
+from retrieval import RetrievalMode
+from generate_report import SynthesisMode
+
+TOPICS = ["Renewable energy storage", "Urban air mobility", "Quantum-safe cryptography", "Precision agriculture",
+          "Solid-state batteries", "Remote patient monitoring", "Carbon capture markets", "Edge AI hardware"]
+
+
+class NodeTimer(BaseCallbackHandler):
+    """ Wall time of every graph node run, including the interview sub-graph nodes """
+    def __init__(self):
+        self.durations = {}
+        self.last_finished = {}  # (thread_id, node) -> when its last run ended
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        # Nested runnables inherit the node metadata; only the node's own run carries its name
+        if node and kwargs.get("name") == node:
+            with self._lock:
+                self._started[run_id] = (node, metadata.get("thread_id"), time.perf_counter())
+
+    def _finish(self, run_id):
+        with self._lock:
+            started = self._started.pop(run_id, None)
+            if started is not None:
+                node, thread_id, start = started
+                now = time.perf_counter()
+                self.durations.setdefault(node, []).append(now - start)
+                self.last_finished[(thread_id, node)] = max(now, self.last_finished.get((thread_id, node), now))
+
+    def synthesis_tails(self):
+        """ Seconds from the last interview of each thread ending to its finished report """
+        return [finished - self.last_finished[(thread_id, "conduct_interview")]
+                for (thread_id, node), finished in self.last_finished.items()
+                if node == "finalize_report" and (thread_id, "conduct_interview") in self.last_finished]
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _config(timer):
+    return {"configurable": {"thread_id": str(uuid.uuid4()),
+                             "google_api_key": os.environ.get("GOOGLE_API_KEY", "fake"),
+                             "tavily_api_key": os.environ.get("TAVILY_API_KEY", "fake")},
+            "callbacks": [timer]}
+
+
+def run_topic(topic, analysts, timer):
+    """ Full flow for one topic on the sync graph; returns the report length """
+    from graph import graph_memory
+
+    config = _config(timer)
+    graph_memory.invoke({"topic": topic, "max_analysts": analysts}, config)
+    graph_memory.update_state(config, {"human_analyst_feedback": ["approved"]})
+    graph_memory.invoke(None, config)
+    return len(graph_memory.invoke(None, config)["final_report"])
+
+
+async def arun_topic(topic, analysts, timer):
+    """ Full flow for one topic on the async graph """
+    from graph import async_graph_memory
+
+    config = _config(timer)
+    await async_graph_memory.ainvoke({"topic": topic, "max_analysts": analysts}, config)
+    await async_graph_memory.aupdate_state(config, {"human_analyst_feedback": ["approved"]})
+    await async_graph_memory.ainvoke(None, config)
+    return len((await async_graph_memory.ainvoke(None, config))["final_report"])
+
+
+def run_benchmark(topics, analysts, concurrency=1, use_async=False):
+    """ Run every topic and return (wall seconds, NodeTimer, traced peak bytes) """
+    timer = NodeTimer()
+    tracemalloc.start()
+    started = time.perf_counter()
+    if use_async:
+        async def run_all():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def bounded(topic):
+                async with semaphore:
+                    return await arun_topic(topic, analysts, timer)
+            return await asyncio.gather(*(bounded(topic) for topic in topics))
+        asyncio.run(run_all())
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda topic: run_topic(topic, analysts, timer), topics))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, timer, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topics", type=int, default=2, help="N topics, cycled from a fixed list")
+    parser.add_argument("--analysts", type=int, default=3, help="M analysts per topic")
+    parser.add_argument("--concurrency", type=int, default=1, help="topics run at once")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="use the ainvoke-based graph")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per fake LLM call")
+    parser.add_argument("--search-latency", type=float, default=0.0, help="seconds per fake search call")
+    parser.add_argument("--wikipedia-latency", type=float, default=None, help="seconds per fake Wikipedia load (default: --search-latency)")
+    parser.add_argument("--retrieval-mode", choices=RetrievalMode.ALL, default=RetrievalMode.DEFAULT,
+                        help="pipelined answers once the first retriever returns")
+    parser.add_argument("--synthesis-mode", choices=SynthesisMode.ALL, default=SynthesisMode.DEFAULT,
+                        help="incremental folds each section into the report as its interview ends")
+    parser.add_argument("--latency-per-1k", type=float, default=0.0, help="extra fake LLM seconds per 1K prompt tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of an injected 503 per call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-inflight", type=int, default=None,
+                        help="interviews admitted at once (default MAX_INFLIGHT_INTERVIEWS, 0 = unlimited)")
+    parser.add_argument("--rate-limits", action="store_true", help="keep the free-tier rate limits instead of lifting them")
+    parser.add_argument("--cache", action="store_true", help="keep the retrieval and response caches enabled")
+    parser.add_argument("--live", action="store_true", help="call Gemini, Tavily and Wikipedia instead of the fakes")
+    parser.add_argument("--record", metavar="PATH", help="record all provider traffic to a cassette")
+    parser.add_argument("--replay", metavar="PATH", help="replay provider traffic from a cassette")
+    parser.add_argument("--replay-latency", default="recorded", choices=["recorded", "simulated", "none"])
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier for replayed latencies")
+    args = parser.parse_args()
+
+    if args.record and args.replay:
+        parser.error("--record and --replay are mutually exclusive")
+    if not args.live:
+        LLMConfig.BACKEND = "fake"
+        SearchConfig.BACKEND = "fake"
+    if args.record:
+        configure_cassette("record", args.record)
+    elif args.replay:
+        configure_cassette("replay", args.replay, args.replay_latency, args.latency_scale)
+    else:
+        configure_cassette("off")
+    client_pool.clear()
+    configure_fakes(llm_latency=args.llm_latency, search_latency=args.search_latency,
+                    error_rate=args.error_rate, seed=args.seed, llm_latency_per_1k_tokens=args.latency_per_1k,
+                    wikipedia_latency=-1 if args.wikipedia_latency is None else args.wikipedia_latency)
+    RetrievalMode.DEFAULT = args.retrieval_mode
+    SynthesisMode.DEFAULT = args.synthesis_mode
+    scheduler = configure_interview_scheduler(args.max_inflight)
+    reset_rate_limits()
+    if not args.rate_limits:
+        for provider, model in (("google", None), ("google", LLMConfig.DEFAULT), ("google", LLMConfig.VERSATILE),
+                                ("google", LLMConfig.CREATIVE), ("tavily", None), ("wikipedia", None)):
+            configure_rate_limit(provider, model)
+    if not args.cache:
+        configure_retrieval_cache("none")
+        configure_response_cache("none")
+
+    topics = [TOPICS[i % len(TOPICS)] + (f" #{i // len(TOPICS) + 1}" if i >= len(TOPICS) else "") for i in range(args.topics)]
+    elapsed, timer, peak = run_benchmark(topics, args.analysts, args.concurrency, args.use_async)
+    configure_cassette("off")  # flushes a recording
+
+    print(f"{'node':<24} {'runs':>5} {'p50 ms':>9} {'p95 ms':>9} {'total s':>9}")
+    for node, durations in sorted(timer.durations.items(), key=lambda item: -sum(item[1])):
+        print(f"{node:<24} {len(durations):>5} {percentile(durations, 0.5) * 1000:>9.1f} "
+              f"{percentile(durations, 0.95) * 1000:>9.1f} {sum(durations):>9.2f}")
+    retries = sum(stats["retries"] for stats in resilience_metrics().values())
+    print(f"\n{args.topics} topics x {args.analysts} analysts: wall {elapsed:.2f}s, "
+          f"{args.topics / elapsed:.2f} topics/s, retries {retries}")
+    tails = timer.synthesis_tails()
+    print(f"synthesis ({args.synthesis_mode}) after the last interview: p50 {percentile(tails, 0.5):.2f}s, "
+          f"p95 {percentile(tails, 0.95):.2f}s")
+    print(f"interviews: max in flight {scheduler.stats['max_in_flight']}, queued {scheduler.stats['queued']}, "
+          f"queue wait {scheduler.stats['wait_seconds']:.2f}s")
+    print(f"peak traced memory {peak / 2**20:.1f} MiB, max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
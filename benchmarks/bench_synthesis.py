@@ -0,0 +1,144 @@
+"""
+Compare report synthesis modes (fanout, single, from_body, hierarchical) on input tokens, LLM calls and wall time.
+
+Runs the real graph from the conduct_interview join with synthetic section memos, for each section count:
+
+    GOOGLE_API_KEY=... python -m benchmarks.bench_synthesis --sections 3 --repeat 2
+    python -m benchmarks.bench_synthesis --dry-run   # estimated prompt tokens only, no API calls
+    python -m benchmarks.bench_synthesis --fake --sections 3 10 20 50 --modes fanout hierarchical
+
+--fake uses the offline fake LLM, whose latency is --llm-latency per call plus --latency-per-1k per thousand
+prompt tokens, so large prompts cost more as they do with Gemini (output length is not modelled).
+"""
+import argparse
+import os
+import time
+import uuid
+
+from generate_report import (SynthesisMode, ReduceConfig, _report_messages, _intro_conclusion_messages, _synthesis_messages,
+                             _merge_messages, _memo_words, _over_budget, group_sections)
+from rate_limiter import estimate_tokens, rate_limit_metrics, configure_rate_limit, reset_rate_limits
+from llm_model import LLMConfig, client_pool
+from fake_backends import configure_fakes
+from cache import configure_response_cache
+
+TOPIC = "Renewable Energy Solutions for a Sustainable Future"
+WORDS = ("energy grid storage solar wind policy cost efficiency adoption emissions battery "
+         "market investment research deployment capacity transmission demand supply").split()
+
+
+def make_sections(count, words_per_section):
+    sections = []
+    for i in range(count):
+        body = " ".join(WORDS[(i + j) % len(WORDS)] for j in range(words_per_section))
+        sections.append(f"## Sub-topic {i + 1}\n\n### Summary\n\n{body} [{i + 1}]\n\n### Sources\n[{i + 1}] https://example.com/{i + 1}")
+    return sections
+
+
+def estimate_reduce(state):
+    """ Estimated (prompt tokens, calls, merged memos) of the hierarchical reduce, assuming memos of the asked length """
+    memos, tokens, calls, level = state["sections"], 0, 0, 0
+    while _over_budget(memos, ReduceConfig.TOKEN_BUDGET, level):
+        level += 1
+        batches = group_sections(memos, ReduceConfig.TOKEN_BUDGET)
+        words = _memo_words(ReduceConfig.TOKEN_BUDGET, len(batches))
+        tokens += sum(estimate_tokens(_merge_messages(state, batch, words)) for batch in batches)
+        calls += len(batches)
+        # ~4 characters per token and 0.75 words per token, as the merge prompt assumes
+        memos = [" ".join(WORDS[j % len(WORDS)] for j in range(words))[:int(words / 0.75 * 4)] for _ in batches]
+    return tokens, calls, memos
+
+
+def estimate_mode(mode, state, body_words):
+    """ Estimated prompt tokens and LLM calls for one synthesis in `mode` """
+    config = {"configurable": {"synthesis_mode": mode}}
+    if mode == SynthesisMode.SINGLE:
+        return estimate_tokens(_synthesis_messages(state)), 1
+    reduce_tokens, reduce_calls = 0, 0
+    if mode == SynthesisMode.HIERARCHICAL:
+        reduce_tokens, reduce_calls, memos = estimate_reduce(state)
+        state = dict(state, reduced_sections=memos)
+    tokens = reduce_tokens + estimate_tokens(_report_messages(state))
+    if mode in (SynthesisMode.FROM_BODY, SynthesisMode.HIERARCHICAL):
+        state = dict(state, content=" ".join(WORDS[j % len(WORDS)] for j in range(body_words)))
+    tokens += estimate_tokens(_intro_conclusion_messages(state, config, "Write the report introduction"))
+    tokens += estimate_tokens(_intro_conclusion_messages(state, config, "Write the report conclusion"))
+    return tokens, reduce_calls + 3
+
+
+def _google_totals():
+    # The limiter counts estimated input tokens plus the output tokens Gemini reports
+    totals = {"tokens": 0, "calls": 0}
+    for key, stats in rate_limit_metrics().items():
+        if key.startswith("google/"):
+            totals["tokens"] += stats["tokens"]
+            totals["calls"] += stats["acquired"]
+    return totals
+
+
+def run_mode(mode, state, google_api_key):
+    """ Run synthesis through the compiled graph; returns (wall seconds, tokens, calls) """
+    from graph import graph_memory
+
+    config = {"configurable": {"thread_id": str(uuid.uuid4()), "google_api_key": google_api_key,
+                               "tavily_api_key": "", "synthesis_mode": mode}}
+    graph_memory.update_state(config, state, as_node="conduct_interview")
+    before = _google_totals()
+    started = time.perf_counter()
+    graph_memory.invoke(None, config)
+    elapsed = time.perf_counter() - started
+    after = _google_totals()
+    return elapsed, after["tokens"] - before["tokens"], after["calls"] - before["calls"]
+
+
+def use_fakes(llm_latency, latency_per_1k):
+    LLMConfig.BACKEND = "fake"
+    client_pool.clear()
+    configure_fakes(llm_latency=llm_latency, llm_latency_per_1k_tokens=latency_per_1k, error_rate=0)
+    reset_rate_limits()
+    for model in (None, LLMConfig.DEFAULT, LLMConfig.VERSATILE, LLMConfig.CREATIVE):
+        configure_rate_limit("google", model)
+    configure_response_cache("none")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", type=int, nargs="+", default=[3], help="section counts (analysts) to run")
+    parser.add_argument("--section-words", type=int, default=400)
+    parser.add_argument("--body-words", type=int, default=600, help="assumed report body length for --dry-run")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--modes", nargs="+", default=list(SynthesisMode.ALL), choices=SynthesisMode.ALL)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--fake", action="store_true", help="offline fake LLM with a prompt-size latency model")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="--fake: seconds per call")
+    parser.add_argument("--latency-per-1k", type=float, default=0.1, help="--fake: seconds per 1k prompt tokens")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        print(f"{'sections':>8} {'mode':<12} {'calls':>5} {'est. input tokens':>18}")
+        for count in args.sections:
+            state = {"topic": TOPIC, "sections": make_sections(count, args.section_words)}
+            for mode in args.modes:
+                tokens, calls = estimate_mode(mode, state, args.body_words)
+                print(f"{count:>8} {mode:<12} {calls:>5} {tokens:>18}")
+        return
+
+    if args.fake:
+        use_fakes(args.llm_latency, args.latency_per_1k)
+        google_api_key = "fake"
+    else:
+        google_api_key = os.environ.get("GOOGLE_API_KEY")
+        if not google_api_key:
+            parser.error("GOOGLE_API_KEY is required unless --dry-run or --fake is given")
+
+    print(f"{'sections':>8} {'mode':<12} {'run':>3} {'calls':>5} {'tokens':>8} {'wall s':>8}")
+    for count in args.sections:
+        state = {"topic": TOPIC, "sections": make_sections(count, args.section_words)}
+        for mode in args.modes:
+            for run in range(args.repeat):
+                elapsed, tokens, calls = run_mode(mode, state, google_api_key)
+                print(f"{count:>8} {mode:<12} {run + 1:>3} {calls:>5} {tokens:>8} {elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
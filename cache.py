@@ -0,0 +1,339 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import math
+import threading
+from collections import OrderedDict
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+
+logger = logging.getLogger(__name__)
+
+
+class CacheConfig:
+    # "memory", "sqlite" or "none"
+    RETRIEVAL_BACKEND = os.environ.get("RETRIEVAL_CACHE", "memory")
+    RETRIEVAL_TTL = float(os.environ.get("RETRIEVAL_CACHE_TTL", 24 * 3600))  # seconds
+    RETRIEVAL_MAX_ENTRIES = int(os.environ.get("RETRIEVAL_CACHE_MAX_ENTRIES", 1024))
+    # "memory", "sqlite" or "none"
+    RESPONSE_BACKEND = os.environ.get("RESPONSE_CACHE", "memory")
+    RESPONSE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 7 * 24 * 3600))  # seconds
+    RESPONSE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 512))
+    # Sampled (temperature > 0) calls are not cached unless this is set
+    CACHE_NONZERO_TEMPERATURE = os.environ.get("RESPONSE_CACHE_ALL_TEMPERATURES", "").lower() in ("1", "true")
+    SQLITE_PATH = os.environ.get("RESEARCH_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "research_cache.sqlite"))
+
+
+class MemoryCache:
+    """ Thread-safe in-process LRU with a per-entry TTL """
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """ On-disk cache shared across runs and processes; values are stored as JSON """
+    def __init__(self, path=CacheConfig.SQLITE_PATH, table="cache", max_entries=1024, ttl=None):
+        if not re.fullmatch(r"\w+", table):
+            raise ValueError(f"Invalid cache table name: {table}")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS {table} "
+                               "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, stored_at = row
+            if self.ttl is not None and now - stored_at > self.ttl:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                               (key, json.dumps(value), now, now))
+            # Evict least recently used rows beyond the bound
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+                               "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+def create_backend(backend, table, max_entries, ttl):
+    """ Build a cache backend by name, or None when caching is disabled """
+    if backend == "memory":
+        return MemoryCache(max_entries=max_entries, ttl=ttl)
+    if backend == "sqlite":
+        return SQLiteCache(table=table, max_entries=max_entries, ttl=ttl)
+    if backend in ("none", "", None):
+        return None
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+def normalize_query(query):
+    """ Case and whitespace insensitive form of a search query; word order and repeats still distinguish queries """
+    return " ".join(query.lower().split())
+
+
+class RetrievalCache:
+    """ Search results keyed by engine and normalized query, shared by every interview in the process """
+    def __init__(self, backend):
+        self.backend = backend
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(engine, query, **params):
+        params_key = json.dumps(params, sort_keys=True)
+        digest = hashlib.sha256(f"{normalize_query(query)}|{params_key}".encode("utf-8")).hexdigest()
+        return f"{engine}:{digest}"
+
+    def get(self, engine, query, **params):
+        value = self.backend.get(self.make_key(engine, query, **params))
+        with self._lock:
+            self.stats["hits" if value is not None else "misses"] += 1
+        if value is not None:
+            logger.info(f"Retrieval cache hit for {engine} query: {query}")
+        return value
+
+    def set(self, engine, query, value, **params):
+        self.backend.set(self.make_key(engine, query, **params), value)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = len(self.backend)
+        return stats
+
+
+_retrieval_cache = None
+_retrieval_cache_configured = False
+_retrieval_cache_lock = threading.RLock()
+
+
+def configure_retrieval_cache(backend=None, ttl=None, max_entries=None):
+    """ (Re)build the process-wide retrieval cache; backend is "memory", "sqlite" or "none" """
+    global _retrieval_cache, _retrieval_cache_configured
+    backend = backend or CacheConfig.RETRIEVAL_BACKEND
+    store = create_backend(backend, "retrieval",
+                           max_entries or CacheConfig.RETRIEVAL_MAX_ENTRIES,
+                           ttl if ttl is not None else CacheConfig.RETRIEVAL_TTL)
+    with _retrieval_cache_lock:
+        _retrieval_cache = RetrievalCache(store) if store is not None else None
+        _retrieval_cache_configured = True
+    logger.info(f"Retrieval cache backend: {backend}")
+    return _retrieval_cache
+
+
+def get_retrieval_cache():
+    """ The process-wide retrieval cache, or None when disabled """
+    if not _retrieval_cache_configured:
+        with _retrieval_cache_lock:
+            if not _retrieval_cache_configured:
+                configure_retrieval_cache()
+    return _retrieval_cache
+
+
+def hashed_embedding(text, dimensions=256):
+    """ Cheap local bag-of-words embedding (feature hashing); pass a real embedding model for semantic matches """
+    vector = [0.0] * dimensions
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        vector[int.from_bytes(digest[:4], "little") % dimensions] += 1.0 if digest[4] % 2 else -1.0
+    return vector
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _message_key(message):
+    if isinstance(message, str):
+        return ["human", message, None]
+    return [message.type, message.content, getattr(message, "name", None)]
+
+
+def serialize_response(response):
+    """ JSON-safe form of a chat message or structured-output model """
+    if isinstance(response, BaseMessage):
+        return {"kind": "message", "value": message_to_dict(response)}
+    return {"kind": "model", "value": response.model_dump()}
+
+
+def deserialize_response(entry, schema):
+    if entry["kind"] == "message":
+        return messages_from_dict([entry["value"]])[0]
+    return schema.model_validate(entry["value"])
+
+
+class ResponseCache:
+    """ LLM responses keyed by model, temperature, messages and output schema.
+
+    Exact lookups go through the backend. With an embed_fn, a miss falls back to the most similar cached
+    prompt for the same model/temperature/schema above similarity_threshold (that index is in-memory only).
+    """
+    def __init__(self, backend, embed_fn=None, similarity_threshold=0.97, cache_nonzero_temperature=False):
+        self.backend = backend
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.cache_nonzero_temperature = cache_nonzero_temperature
+        self.stats = {}
+        self._vectors = OrderedDict()  # key -> (namespace, vector)
+        self._lock = threading.Lock()
+
+    def accepts(self, llm):
+        return self.cache_nonzero_temperature or not getattr(llm, "temperature", 0)
+
+    @staticmethod
+    def _namespace(llm, schema):
+        schema_key = json.dumps(schema.model_json_schema(), sort_keys=True) if schema is not None else ""
+        return f"{llm.model}|{getattr(llm, 'temperature', None)}|{schema_key}"
+
+    def make_key(self, llm, messages, schema=None):
+        payload = json.dumps([self._namespace(llm, schema), [_message_key(m) for m in messages]], sort_keys=True, default=str)
+        return "llm:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _prompt_text(messages):
+        return "\n".join(str(_message_key(m)[1]) for m in messages)
+
+    def _record(self, node, outcome):
+        with self._lock:
+            stats = self.stats.setdefault(node or "unknown", {"hits": 0, "semantic_hits": 0, "misses": 0})
+            stats[outcome] += 1
+
+    def _similar_key(self, namespace, vector):
+        best_key, best_score = None, self.similarity_threshold
+        with self._lock:
+            candidates = [(key, vec) for key, (ns, vec) in self._vectors.items() if ns == namespace]
+        for key, candidate in candidates:
+            score = _cosine(vector, candidate)
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def get(self, llm, messages, schema=None, node=None):
+        key = self.make_key(llm, messages, schema)
+        entry = self.backend.get(key)
+        if entry is None and self.embed_fn is not None:
+            similar = self._similar_key(self._namespace(llm, schema), self.embed_fn(self._prompt_text(messages)))
+            if similar is not None:
+                entry = self.backend.get(similar)
+                if entry is not None:
+                    self._record(node, "semantic_hits")
+                    logger.info(f"Semantic response cache hit in {node}")
+                    return deserialize_response(entry, schema)
+        if entry is None:
+            self._record(node, "misses")
+            return None
+        self._record(node, "hits")
+        logger.info(f"Response cache hit in {node}")
+        return deserialize_response(entry, schema)
+
+    def set(self, llm, messages, response, schema=None):
+        key = self.make_key(llm, messages, schema)
+        self.backend.set(key, serialize_response(response))
+        if self.embed_fn is not None:
+            vector = self.embed_fn(self._prompt_text(messages))
+            with self._lock:
+                self._vectors[key] = (self._namespace(llm, schema), vector)
+                while len(self._vectors) > getattr(self.backend, "max_entries", len(self._vectors)):
+                    self._vectors.popitem(last=False)
+
+    def metrics(self):
+        """ Hit rate per node """
+        with self._lock:
+            stats = {node: dict(values) for node, values in self.stats.items()}
+        for values in stats.values():
+            lookups = values["hits"] + values["semantic_hits"] + values["misses"]
+            values["hit_rate"] = (values["hits"] + values["semantic_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+_response_cache = None
+_response_cache_configured = False
+_response_cache_lock = threading.RLock()
+
+
+def configure_response_cache(backend=None, ttl=None, max_entries=None, embed_fn=None, similarity_threshold=0.97,
+                             cache_nonzero_temperature=None):
+    """ (Re)build the process-wide LLM response cache; backend is "memory", "sqlite" or "none" """
+    global _response_cache, _response_cache_configured
+    backend = backend or CacheConfig.RESPONSE_BACKEND
+    store = create_backend(backend, "responses",
+                           max_entries or CacheConfig.RESPONSE_MAX_ENTRIES,
+                           ttl if ttl is not None else CacheConfig.RESPONSE_TTL)
+    if cache_nonzero_temperature is None:
+        cache_nonzero_temperature = CacheConfig.CACHE_NONZERO_TEMPERATURE
+    with _response_cache_lock:
+        _response_cache = ResponseCache(store, embed_fn, similarity_threshold, cache_nonzero_temperature) if store is not None else None
+        _response_cache_configured = True
+    logger.info(f"Response cache backend: {backend}")
+    return _response_cache
+
+
+def get_response_cache():
+    """ The process-wide LLM response cache, or None when disabled """
+    if not _response_cache_configured:
+        with _response_cache_lock:
+            if not _response_cache_configured:
+                configure_response_cache()
+    return _response_cache
@@ -0,0 +1,139 @@
+import os
+import gzip
+import json
+import atexit
+import hashlib
+import logging
+import threading
+from collections import Counter
+from fake_backends import simulated_latency
+
+logger = logging.getLogger(__name__)
+
+
+class CassetteConfig:
+    MODE = os.environ.get("CASSETTE_MODE", "off")  # "off", "record" or "replay"
+    PATH = os.environ.get("CASSETTE_PATH", os.path.join(".cache", "cassette.jsonl.gz"))
+    # Replay delay per call: "recorded", "simulated" (FAKE_*_LATENCY, see fake_backends.py) or "none"
+    LATENCY = os.environ.get("CASSETTE_LATENCY", "recorded")
+    LATENCY_SCALE = float(os.environ.get("CASSETTE_LATENCY_SCALE", "1.0"))
+
+
+class CassetteMiss(KeyError):
+    """ Raised in replay mode for a request the cassette has no recording of """
+
+
+class ReplayedError(RuntimeError):
+    """ A provider error captured while recording, raised again at the same point on replay """
+    def __init__(self, message, error_type, status_code=None, retryable=False):
+        super().__init__(f"{error_type}: {message}")
+        self.error_type = error_type
+        self.status_code = status_code
+        self.retryable = retryable
+
+
+def request_key(kind, *parts):
+    """ Stable digest of a provider request """
+    payload = json.dumps([kind, parts], sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+class Cassette:
+    """ LLM and search traffic of a run as gzip-compressed JSON lines.
+
+    Each line holds the request kind and digest, the call latency and either the response or the error.
+    Identical requests are replayed in the order they were recorded, repeating the last one when exhausted.
+    """
+    def __init__(self, path, mode, latency=CassetteConfig.LATENCY, latency_scale=CassetteConfig.LATENCY_SCALE):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.entries = {}
+        self.stats = Counter()
+        self._cursor = Counter()
+        self._lock = threading.Lock()
+        self._file = None
+        if mode == "replay":
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.entries.setdefault((entry["kind"], entry["key"]), []).append(entry)
+            logger.info(f"Loaded {sum(len(v) for v in self.entries.values())} recorded calls from {path}")
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._file = gzip.open(path, "wt", encoding="utf-8")
+            atexit.register(self.close)
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def record(self, kind, key, latency, response=None, error=None):
+        entry = {"kind": kind, "key": key, "latency": round(latency, 4)}
+        if error is not None:
+            entry["error"] = error
+        else:
+            entry["response"] = response
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(json.dumps(entry, separators=(",", ":"), default=str) + "\n")
+            self.stats[f"{kind}_recorded"] += 1
+
+    def replay(self, kind, key):
+        with self._lock:
+            entries = self.entries.get((kind, key))
+            if not entries:
+                self.stats[f"{kind}_missed"] += 1
+                raise CassetteMiss(f"No recorded {kind} call for request {key} in {self.path}")
+            entry = entries[min(self._cursor[(kind, key)], len(entries) - 1)]
+            self._cursor[(kind, key)] += 1
+            self.stats[f"{kind}_replayed"] += 1
+        return entry
+
+    def delay(self, entry):
+        """ Seconds to wait before returning a replayed entry """
+        if self.latency == "none":
+            return 0.0
+        if self.latency == "simulated":
+            return simulated_latency(entry["kind"]) * self.latency_scale
+        return entry["latency"] * self.latency_scale
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                logger.info(f"Cassette written to {self.path}")
+
+
+_cassette = None
+_cassette_configured = False
+_cassette_lock = threading.Lock()
+
+
+def configure_cassette(mode=None, path=None, latency=None, latency_scale=None):
+    """ Start recording to or replaying from a cassette; mode "off" disables it """
+    global _cassette, _cassette_configured
+    mode = mode or CassetteConfig.MODE
+    with _cassette_lock:
+        if _cassette is not None:
+            _cassette.close()
+        _cassette = None
+        if mode != "off":
+            _cassette = Cassette(path or CassetteConfig.PATH, mode,
+                                 latency or CassetteConfig.LATENCY,
+                                 latency_scale if latency_scale is not None else CassetteConfig.LATENCY_SCALE)
+        _cassette_configured = True
+    logger.info(f"Cassette mode: {mode}")
+    return _cassette
+
+
+def get_cassette():
+    """ The active cassette, or None when neither recording nor replaying """
+    if not _cassette_configured:
+        configure_cassette()
+    return _cassette
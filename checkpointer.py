@@ -0,0 +1,564 @@
+import os
+import time
+import random
+import zlib
+import hashlib
+import importlib
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from langgraph.checkpoint.base import (BaseCheckpointSaver, CheckpointTuple, WRITES_IDX_MAP, get_checkpoint_id,
+                                       get_checkpoint_metadata)
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import (JsonPlusSerializer, _msgpack_default, _msgpack_ext_hook,
+                                                 _option as _msgpack_option)
+import ormsgpack
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional, zlib is the fallback
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointConfig:
+    BACKEND = os.environ.get("CHECKPOINTER", "sqlite")  # "sqlite" or "memory"
+    # Resolved from this file so every process finds the same threads regardless of the working directory
+    PATH = os.environ.get("CHECKPOINT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "checkpoints.sqlite"))
+    FINISHED_TTL = float(os.environ.get("CHECKPOINT_TTL", str(24 * 3600)))  # seconds a finished thread is kept
+    IDLE_TTL = float(os.environ.get("CHECKPOINT_IDLE_TTL", str(7 * 24 * 3600)))  # unfinished threads; 0 keeps them
+    PRUNE_INTERVAL = 600  # seconds between automatic prunes
+    BUSY_TIMEOUT = 30.0  # seconds a writer waits for another process holding the database lock
+    KEEP_HISTORY = os.environ.get("CHECKPOINT_KEEP_HISTORY", "0") == "1"  # else compact to the latest snapshot
+    # "auto" (zstd when the zstandard package is installed, else zlib), "zstd", "zlib" or "none"
+    COMPRESSION = os.environ.get("CHECKPOINT_COMPRESSION", "auto")
+    COMPRESS_MIN_BYTES = 1024  # compress serialized values at least this large
+    # Strings at least this long are stored once by content hash and referenced from checkpoints; 0 disables
+    TEXT_MIN_BYTES = int(os.environ.get("CHECKPOINT_TEXT_MIN_BYTES", "256"))
+    TEXT_CACHE_SIZE = 2048  # decoded texts kept in memory
+    FINISH_CHANNEL = "final_report"  # a thread is finished once this channel is written in the root graph
+
+
+EXT_TEXT_REF = 100  # a content-addressed string: the digest
+EXT_MODEL = 101  # a pydantic model whose fields may hold text references
+
+
+_zstd = threading.local()  # zstd contexts are not thread-safe; reuse one per thread
+
+
+def _compress(data, compression):
+    if compression == "zstd":
+        if not hasattr(_zstd, "compressor"):
+            _zstd.compressor = zstandard.ZstdCompressor(level=3)
+        return _zstd.compressor.compress(data)
+    if compression == "zlib":
+        return zlib.compress(data, 6)
+    return data
+
+
+def _decompress(data, compression):
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("Reading zstd-compressed checkpoints requires the zstandard package")
+        if not hasattr(_zstd, "decompressor"):
+            _zstd.decompressor = zstandard.ZstdDecompressor()
+        return _zstd.decompressor.decompress(data)
+    if compression == "zlib":
+        return zlib.decompress(data)
+    return data
+
+
+def resolve_compression(compression=None):
+    compression = compression or CheckpointConfig.COMPRESSION
+    if compression == "auto":
+        return "zstd" if zstandard is not None else "zlib"
+    if compression == "zstd" and zstandard is None:
+        raise ImportError("CHECKPOINT_COMPRESSION=zstd requires the zstandard package")
+    if compression not in ("zstd", "zlib", "none"):
+        raise ValueError(f"Unknown checkpoint compression: {compression}")
+    return compression
+
+
+class MemoryTextStore:
+    """ Content-addressed texts for an in-process checkpointer """
+    def __init__(self):
+        self._texts = {}
+        self._lock = threading.Lock()
+
+    def load_text(self, digest):
+        with self._lock:
+            return self._texts[digest]
+
+    def save_texts(self, texts):
+        with self._lock:
+            for digest, text in texts.items():
+                self._texts.setdefault(digest, text)
+
+
+class CheckpointSerializer:
+    """ msgpack serializer that stores long strings once, by content hash, and compresses large payloads.
+
+    State channels like `context`, `sections` and `messages` are lists that grow by appending, and LangGraph
+    stores every version of a channel, so the same document strings are written again at each step. Here each
+    string of at least text_min_bytes becomes a reference to its digest, and the text itself goes to `store`
+    once. Other values are encoded like JsonPlusSerializer; payloads are tagged "cas" plus the compression used.
+    """
+    def __init__(self, store=None, compression=None, text_min_bytes=CheckpointConfig.TEXT_MIN_BYTES,
+                 compress_min_bytes=CheckpointConfig.COMPRESS_MIN_BYTES, serde=None):
+        self.store = store if store is not None else MemoryTextStore()
+        self.compression = resolve_compression(compression)
+        self.text_min_bytes = text_min_bytes
+        self.compress_min_bytes = compress_min_bytes
+        self.serde = serde or JsonPlusSerializer()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def dumps_with_texts(self, obj):
+        """ ((type, bytes), {digest: (encoding, data)}) for a value; the caller persists the new texts """
+        if obj is None or isinstance(obj, (bytes, bytearray)) or not self.text_min_bytes:
+            type_, data = self.serde.dumps_typed(obj)
+            texts = {}
+        else:
+            texts = {}
+            type_, data = "cas", self._pack(obj, texts)
+        if len(data) >= self.compress_min_bytes and self.compression != "none":
+            return (f"{type_}+{self.compression}", _compress(data, self.compression)), texts
+        return (type_, data), texts
+
+    def dumps_typed(self, obj):
+        (type_, data), texts = self.dumps_with_texts(obj)
+        if texts:
+            self.store.save_texts(texts)
+        return type_, data
+
+    def loads_typed(self, data):
+        type_, payload = data
+        type_, _, compression = type_.partition("+")
+        payload = _decompress(payload, compression or "none")
+        if type_ == "cas":
+            return ormsgpack.unpackb(payload, ext_hook=self._ext_hook, option=ormsgpack.OPT_NON_STR_KEYS)
+        return self.serde.loads_typed((type_, payload))
+
+    def _pack(self, obj, texts):
+        def refs(value):
+            if isinstance(value, str):
+                encoded = value.encode("utf-8")
+                if len(encoded) < self.text_min_bytes:
+                    return value
+                digest = hashlib.blake2b(encoded, digest_size=16).digest()
+                if digest.hex() not in texts:
+                    compressed = len(encoded) >= self.compress_min_bytes and self.compression != "none"
+                    texts[digest.hex()] = ((self.compression, _compress(encoded, self.compression)) if compressed
+                                           else ("none", encoded))
+                return ormsgpack.Ext(EXT_TEXT_REF, digest)
+            if isinstance(value, dict):
+                return {key: refs(item) for key, item in value.items()}
+            if isinstance(value, (list, tuple)):
+                return [refs(item) for item in value]
+            return value
+
+        def default(value):
+            if hasattr(value, "model_dump") and callable(value.model_dump):
+                cls = value.__class__
+                return ormsgpack.Ext(EXT_MODEL, pack((cls.__module__, cls.__name__, value.model_dump())))
+            return _msgpack_default(value)
+
+        def pack(value):
+            return ormsgpack.packb(refs(value), default=default, option=_msgpack_option)
+
+        return pack(obj)
+
+    def _text(self, digest):
+        with self._cache_lock:
+            text = self._cache.get(digest)
+            if text is not None:
+                self._cache.move_to_end(digest)
+                return text
+        encoding, data = self.store.load_text(digest)
+        text = _decompress(data, encoding).decode("utf-8")
+        with self._cache_lock:
+            self._cache[digest] = text
+            while len(self._cache) > CheckpointConfig.TEXT_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return text
+
+    def _ext_hook(self, code, data):
+        if code == EXT_TEXT_REF:
+            return self._text(data.hex())
+        if code == EXT_MODEL:
+            module, name, fields = ormsgpack.unpackb(data, ext_hook=self._ext_hook, option=ormsgpack.OPT_NON_STR_KEYS)
+            cls = getattr(importlib.import_module(module), name)
+            try:
+                return cls(**fields)
+            except Exception:
+                return cls.model_construct(**fields)
+        return _msgpack_ext_hook(code, data)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL,
+    finished INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata_type TEXT NOT NULL,
+    metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB NOT NULL,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS texts (
+    digest TEXT PRIMARY KEY,
+    encoding TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS text_refs (
+    thread_id TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (thread_id, digest)
+);
+"""
+
+
+class SQLiteSaver(BaseCheckpointSaver):
+    """ Checkpointer persisting research threads to a SQLite file.
+
+    Same layout as MemorySaver: a checkpoint row per step, channel values stored once per version in `blobs`, and
+    the pending writes of each task, so a run interrupted mid-superstep only re-runs the tasks that had not
+    finished (e.g. the interviews still in flight). Unless keep_history is set, each new checkpoint replaces the
+    previous one of its namespace, and sub-graph checkpoints are dropped once their parent task has finished.
+    Long strings are stored once in `texts` (see CheckpointSerializer) and freed with the last thread using them.
+    """
+    def __init__(self, path=CheckpointConfig.PATH, keep_history=CheckpointConfig.KEEP_HISTORY,
+                 finished_ttl=CheckpointConfig.FINISHED_TTL, idle_ttl=CheckpointConfig.IDLE_TTL, serde=None):
+        super().__init__(serde=serde or CheckpointSerializer(store=self))
+        self.path = path
+        self.keep_history = keep_history
+        self.finished_ttl = finished_ttl
+        self.idle_ttl = idle_ttl
+        self._connection = None
+        self._lock = threading.RLock()
+        self._last_prune = 0.0
+
+    @property
+    def _conn(self):
+        """ The database connection, opened (and pruned) on first use so importing the graph creates no file """
+        if self._connection is None:
+            with self._lock:
+                if self._connection is None:
+                    self._connection = self._connect()
+                    self.prune()
+        return self._connection
+
+    def _connect(self):
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Job workers share the file: writers wait out each other's locks instead of failing with "database is locked"
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None,
+                               timeout=CheckpointConfig.BUSY_TIMEOUT)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._conn, self._lock)
+
+    def load_text(self, digest):
+        with self._lock:
+            return tuple(self._conn.execute("SELECT encoding, data FROM texts WHERE digest=?", (digest,)).fetchone())
+
+    def save_texts(self, texts):
+        with self._transaction() as conn:
+            self._insert_texts(conn, None, texts)
+
+    def _insert_texts(self, conn, thread_id, texts):
+        conn.executemany("INSERT OR IGNORE INTO texts VALUES (?, ?, ?)",
+                         [(digest, encoding, data) for digest, (encoding, data) in texts.items()])
+        if thread_id is not None:
+            conn.executemany("INSERT OR IGNORE INTO text_refs VALUES (?, ?)", [(thread_id, digest) for digest in texts])
+
+    def _dumps(self, value, texts):
+        """ Serialize a value, collecting the content-addressed texts it references """
+        if not hasattr(self.serde, "dumps_with_texts"):
+            return self.serde.dumps_typed(value)
+        typed, value_texts = self.serde.dumps_with_texts(value)
+        texts.update(value_texts)
+        return typed
+
+    def _load_blobs(self, thread_id, checkpoint_ns, versions):
+        values = {}
+        for channel, version in versions.items():
+            row = self._conn.execute(
+                "SELECT type, value FROM blobs WHERE thread_id=? AND checkpoint_ns=? AND channel=? AND version=?",
+                (thread_id, checkpoint_ns, channel, str(version))).fetchone()
+            if row is not None and row[0] != "empty":
+                values[channel] = self.serde.loads_typed((row[0], row[1]))
+        return values
+
+    def _tuple(self, thread_id, checkpoint_ns, row):
+        checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata = row
+        checkpoint = self.serde.loads_typed((type_, checkpoint))
+        writes = self._conn.execute(
+            "SELECT task_id, channel, type, value FROM writes WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=? "
+            "ORDER BY task_id, idx", (thread_id, checkpoint_ns, checkpoint_id)).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint={**checkpoint, "channel_values": self._load_blobs(thread_id, checkpoint_ns, checkpoint["channel_versions"])},
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                            "checkpoint_id": parent_id}} if parent_id else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes],
+        )
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            if checkpoint_id:
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=?",
+                    (thread_id, checkpoint_ns, checkpoint_id)).fetchone()
+            else:
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? "
+                    f"ORDER BY checkpoint_id DESC LIMIT 1", (thread_id, checkpoint_ns)).fetchone()
+            return self._tuple(thread_id, checkpoint_ns, row) if row else None
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        query = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+                 "metadata_type, metadata FROM checkpoints")
+        where, params = [], []
+        if config is not None:
+            where.append("thread_id=?")
+            params.append(config["configurable"]["thread_id"])
+            checkpoint_ns = config["configurable"].get("checkpoint_ns")
+            if checkpoint_ns is not None:
+                where.append("checkpoint_ns=?")
+                params.append(checkpoint_ns)
+            checkpoint_id = get_checkpoint_id(config)
+            if checkpoint_id:
+                where.append("checkpoint_id=?")
+                params.append(checkpoint_id)
+        if before is not None and get_checkpoint_id(before):
+            where.append("checkpoint_id<?")
+            params.append(get_checkpoint_id(before))
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY checkpoint_id DESC"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+            tuples = []
+            for thread_id, checkpoint_ns, *row in rows:
+                if filter:
+                    metadata = self.serde.loads_typed((row[4], row[5]))
+                    if not all(metadata.get(key) == value for key, value in filter.items()):
+                        continue
+                tuples.append(self._tuple(thread_id, checkpoint_ns, row))
+                if limit is not None and len(tuples) >= limit:
+                    break
+        yield from tuples
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        values = checkpoint.get("channel_values", {})
+        checkpoint_copy = {key: value for key, value in checkpoint.items() if key != "channel_values"}
+        texts = {}
+        type_, serialized = self._dumps(checkpoint_copy, texts)
+        metadata_type, serialized_metadata = self._dumps(get_checkpoint_metadata(config, metadata), texts)
+        blobs = [(channel, str(version), *(self._dumps(values[channel], texts) if channel in values else ("empty", b"")))
+                 for channel, version in new_versions.items()]
+        finished = checkpoint_ns == "" and CheckpointConfig.FINISH_CHANNEL in new_versions
+        with self._transaction() as conn:
+            self._insert_texts(conn, thread_id, texts)
+            conn.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)",
+                             [(thread_id, checkpoint_ns, *blob) for blob in blobs])
+            conn.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                          type_, serialized, metadata_type, serialized_metadata))
+            conn.execute("INSERT INTO threads VALUES (?, ?, ?) ON CONFLICT(thread_id) DO UPDATE SET "
+                         "updated_at=excluded.updated_at, finished=MAX(finished, excluded.finished)",
+                         (thread_id, time.time(), int(finished)))
+            if not self.keep_history:
+                self._compact(conn, thread_id, checkpoint_ns, checkpoint["id"], checkpoint["channel_versions"], finished)
+        self._maybe_prune()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        texts = {}
+        rows = [(WRITES_IDX_MAP.get(channel, idx), channel, *self._dumps(value, texts))
+                for idx, (channel, value) in enumerate(writes)]
+        with self._transaction() as conn:
+            self._insert_texts(conn, thread_id, texts)
+            for idx, channel, type_, serialized in rows:
+                # Special writes (errors, interrupts) are replaced; regular ones are written once
+                verb = "INSERT OR IGNORE" if idx >= 0 else "INSERT OR REPLACE"
+                conn.execute(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type_, serialized, task_path))
+
+    def delete_thread(self, thread_id):
+        with self._transaction() as conn:
+            digests = [row[0] for row in conn.execute("SELECT digest FROM text_refs WHERE thread_id=?", (thread_id,))]
+            for table in ("checkpoints", "blobs", "writes", "threads", "text_refs"):
+                conn.execute(f"DELETE FROM {table} WHERE thread_id=?", (thread_id,))
+            # Only texts this thread used and no other thread still does; texts saved without a thread stay
+            conn.executemany("DELETE FROM texts WHERE digest=? AND NOT EXISTS (SELECT 1 FROM text_refs WHERE digest=?)",
+                             [(digest, digest) for digest in digests])
+
+    def _compact(self, conn, thread_id, checkpoint_ns, checkpoint_id, channel_versions, finished=False):
+        """ Keep only `checkpoint_id` in its namespace, with the blobs it references """
+        if checkpoint_ns == "":
+            # Parent tasks with results written: their sub-graph runs are complete (read before the writes go)
+            done_tasks = {row[0] for row in conn.execute(
+                "SELECT DISTINCT task_id FROM writes WHERE thread_id=? AND checkpoint_ns='' AND idx>=0", (thread_id,))}
+        conn.execute("DELETE FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id!=?",
+                     (thread_id, checkpoint_ns, checkpoint_id))
+        conn.execute("DELETE FROM writes WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id!=?",
+                     (thread_id, checkpoint_ns, checkpoint_id))
+        live = {(channel, str(version)) for channel, version in channel_versions.items()}
+        stale = [row for row in conn.execute("SELECT channel, version FROM blobs WHERE thread_id=? AND checkpoint_ns=?",
+                                             (thread_id, checkpoint_ns)) if tuple(row) not in live]
+        conn.executemany("DELETE FROM blobs WHERE thread_id=? AND checkpoint_ns=? AND channel=? AND version=?",
+                         [(thread_id, checkpoint_ns, channel, version) for channel, version in stale])
+        if checkpoint_ns == "":
+            # Drop the sub-graph namespaces ("<node>:<task id>|...") of finished tasks, or all of them once the
+            # thread is finished; sub-graphs still writing checkpoints are left alone
+            namespaces = [row[0] for row in conn.execute(
+                "SELECT DISTINCT checkpoint_ns FROM checkpoints WHERE thread_id=? AND checkpoint_ns!=''", (thread_id,))]
+            for namespace in namespaces:
+                if finished or namespace.split("|")[0].partition(":")[2] in done_tasks:
+                    for table in ("checkpoints", "blobs", "writes"):
+                        conn.execute(f"DELETE FROM {table} WHERE thread_id=? AND checkpoint_ns=?", (thread_id, namespace))
+
+    def compact(self, thread_id=None):
+        """ Drop every checkpoint but the latest of each namespace, for one thread or all of them """
+        with self._lock:
+            threads = [thread_id] if thread_id else [row[0] for row in self._conn.execute("SELECT thread_id FROM threads")]
+            for thread in threads:
+                latest = self._conn.execute(
+                    "SELECT checkpoint_ns, MAX(checkpoint_id) FROM checkpoints WHERE thread_id=? GROUP BY checkpoint_ns",
+                    (thread,)).fetchall()
+                with self._transaction() as conn:
+                    for checkpoint_ns, checkpoint_id in sorted(latest, reverse=True):
+                        row = conn.execute("SELECT type, checkpoint FROM checkpoints WHERE thread_id=? AND "
+                                           "checkpoint_ns=? AND checkpoint_id=?", (thread, checkpoint_ns, checkpoint_id)).fetchone()
+                        versions = self.serde.loads_typed((row[0], row[1]))["channel_versions"]
+                        self._compact(conn, thread, checkpoint_ns, checkpoint_id, versions)
+            self._conn.execute("VACUUM")
+
+    def prune(self, finished_ttl=None, idle_ttl=None):
+        """ Delete finished threads older than finished_ttl and any thread idle for longer than idle_ttl """
+        finished_ttl = self.finished_ttl if finished_ttl is None else finished_ttl
+        idle_ttl = self.idle_ttl if idle_ttl is None else idle_ttl
+        now = time.time()
+        with self._lock:
+            self._last_prune = now
+            expired = [row[0] for row in self._conn.execute(
+                "SELECT thread_id FROM threads WHERE (finished=1 AND updated_at<?) OR (?>0 AND updated_at<?)",
+                (now - finished_ttl, idle_ttl, now - idle_ttl))]
+            for thread_id in expired:
+                self.delete_thread(thread_id)
+        if expired:
+            logger.info(f"Pruned {len(expired)} expired threads from {self.path}")
+        return len(expired)
+
+    def _maybe_prune(self):
+        if time.time() - self._last_prune >= CheckpointConfig.PRUNE_INTERVAL:
+            self.prune()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    # SQLite calls are short and serialized by the lock; run them off the event loop
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        tuples = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint_tuple in tuples:
+            yield checkpoint_tuple
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current, channel):
+        # Same scheme as MemorySaver: a zero-padded counter, so versions sort as strings
+        current_v = 0 if current is None else current if isinstance(current, int) else int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+
+class _Transaction:
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            # Take the write lock up front: a deferred transaction that reads and then writes can fail to upgrade
+            # while another process writes, and that error bypasses the busy timeout
+            self.conn.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
+
+
+def create_checkpointer(backend=None, path=None):
+    """ Checkpointer for the research graphs: "sqlite" (persistent, the default) or "memory" """
+    backend = backend or CheckpointConfig.BACKEND
+    logger.info(f"Checkpointer: {backend}")
+    if backend == "memory":
+        return MemorySaver(serde=CheckpointSerializer())
+    if backend == "sqlite":
+        return SQLiteSaver(path or CheckpointConfig.PATH)
+    raise ValueError(f"Unknown checkpointer backend: {backend}")
@@ -1,23 +1,29 @@
+import time
+import uuid
 import logging
+import asyncio
 from langgraph.graph import START, END, StateGraph
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-from llm_model import get_versatile_llm
+from llm_model import get_versatile_llm, invoke_llm, ainvoke_llm
 from state import InterviewState, ResearchState, InterviewStateOutput
-from generate_answer import search_web, search_wikipedia, generate_answer, save_interview, write_section, route_messages
-from prompts import load_prompt
+from generate_answer import (search_web, search_wikipedia, generate_answer, save_interview, write_section, route_messages,
+                             asearch_web, asearch_wikipedia, agenerate_answer, awrite_section, retrieve, aretrieve,
+                             route_retrieval, plan_queries, aplan_queries, release_interview)
+from prompts import format_prompt
+from metrics import instrument
+from interview_scheduler import get_interview_scheduler
+from deadline import RunDeadlineExceeded, run_deadline, interviews_deadline, interview_deadline, deadline_scope, remaining
+from generate_report import SynthesisMode, get_synthesis_mode
+from report_draft import add_sections, discard_draft, draft_key
 from langgraph.constants import Send
 
 logger = logging.getLogger(__name__)
 
-def generate_question(state: InterviewState, config: dict):
-    """ Node to generate a question """
-
-    # Get state
-    logger.info("Generating question...")
+def _question_messages(state: InterviewState):
+    """ System prompt plus the conversation so far, ending with a prompt for the next question """
     analyst = state["analyst"]
     messages = state["messages"]
     topic = state["topic"]
-    google_api_key = config["configurable"]["google_api_key"]
 
     # If no messages, start with a system message
     if not messages:
@@ -26,46 +32,165 @@ def generate_question(state: InterviewState, config: dict):
         # If the last message is from the AI, we need to add a human message
         messages.append(HumanMessage(content="Considering your expertise and prior responses, formulate an insightful follow-up question that delves deeper into the topic."))
 
-    question_instructions = load_prompt("question_instructions")
-    # system_message = question_instructions.format(name=analyst["name"], role=analyst["role"], affiliation=analyst["affiliation"], description=analyst["description"])
-    system_message = question_instructions.format(name=analyst.name, role=analyst.role, affiliation=analyst.affiliation, description=analyst.description)
-    question = get_versatile_llm(google_api_key).invoke([SystemMessage(content=system_message)]+messages)
+    system_message = format_prompt("question_instructions", name=analyst.name, role=analyst.role, affiliation=analyst.affiliation, description=analyst.description)
+    return [SystemMessage(content=system_message)]+messages
+
+
+def generate_question(state: InterviewState, config: dict):
+    """ Node to generate a question """
+
+    # Get state
+    logger.info("Generating question...")
+    google_api_key = config["configurable"]["google_api_key"]
+
+    question = invoke_llm(get_versatile_llm(google_api_key), _question_messages(state), node="generate_question")
         
     # Write messages to state
     return {"messages": [question]}
 
 
-def initiate_all_interviews(state: ResearchState):
+async def agenerate_question(state: InterviewState, config: dict):
+    """ Node to generate a question (async) """
+    logger.info("Generating question...")
+    google_api_key = config["configurable"]["google_api_key"]
+    question = await ainvoke_llm(get_versatile_llm(google_api_key), _question_messages(state), node="generate_question")
+    return {"messages": [question]}
+
+
+def start_interviews(state: ResearchState, config: dict):
+    """ Interrupted on before the interviews; once resumed, starts the run's time budget """
+    now = time.time()
+    deadline = interviews_deadline(config, now)
+    if deadline is not None:
+        logger.info(f"Interviews must finish within {deadline - now:.0f}s")
+    return {"interviews_deadline": deadline, "run_deadline": run_deadline(config, now), "run_id": uuid.uuid4().hex}
+
+
+def initiate_all_interviews(state: ResearchState, config: dict):
     """ This is the "map" step where we run each interview sub-graph using Send API """
 
     logger.info(f"Initiating interviews for topic: {state['topic']}")
     logger.debug(f"Final analysts: {state['final_analysts']}")
 
+    # Analysts come ranked from select_analysts; the scheduler admits interviews in that order
     return [Send("conduct_interview", {
                                         "analyst": analyst, 
                                         "topic": state["topic"],
+                                        "interview_id": uuid.uuid4().hex,
+                                        "run_id": draft_key(state, config),
+                                        "priority": priority,
+                                        # The novelty policy can stop an interview before this
+                                        "max_num_turns": int(config["configurable"].get("max_num_turns", 2)),
+                                        "deadline": state.get("interviews_deadline"),
                                         }
-                    ) for analyst in state["final_analysts"]]
-
-
-interview_builder = StateGraph(InterviewState, output=InterviewStateOutput)
-interview_builder.add_node("generate_question", generate_question)
-interview_builder.add_node("search_web", search_web)
-interview_builder.add_node("search_wikipedia", search_wikipedia)
-interview_builder.add_node("generate_answer", generate_answer)
-interview_builder.add_node("save_interview", save_interview)
-interview_builder.add_node("write_section", write_section)
-
-# Flow
-interview_builder.add_edge(START, "generate_question")
-interview_builder.add_edge("generate_question", "search_web")
-interview_builder.add_edge("generate_question", "search_wikipedia")
-interview_builder.add_edge("search_web", "generate_answer")
-interview_builder.add_edge("search_wikipedia", "generate_answer")
-interview_builder.add_conditional_edges("generate_answer", route_messages,['generate_question','save_interview'])
-interview_builder.add_edge("save_interview", "write_section")
-interview_builder.add_edge("write_section", END)
+                    ) for priority, analyst in enumerate(state["final_analysts"])]
+
+
+def _dropped(state, error):
+    """ Output of an interview cut off by its deadline: no section, just the analyst's name for the report """
+    name = state["analyst"].name
+    logger.warning(f"Dropping interview with {name}: {error}")
+    return {"dropped_analysts": [name]}
+
+
+def interview_node(interview_graph, use_async=False):
+    """ Parent-graph node running one interview sub-graph once the interview scheduler admits it.
+
+    An interview still queued or running at its deadline is cancelled and reported in dropped_analysts, so
+    synthesis goes ahead with the sections that did finish.
+    """
+    def inputs(state):
+        return {key: value for key, value in state.items() if key not in ("priority", "deadline", "run_id")}
+
+    def folded(state, config, output):
+        # In incremental synthesis the section joins the running report draft as soon as it is written
+        if output.get("sections") and get_synthesis_mode(config) == SynthesisMode.INCREMENTAL:
+            add_sections(draft_key(state, config), state["topic"], output["sections"], config["configurable"]["google_api_key"])
+        return output
+
+    def failed(state, config):
+        # The run fails with this interview, so its report draft will never be reconciled. Sections of interviews
+        # still finishing may start a new one, which DraftConfig.TTL_SECONDS drops
+        if get_synthesis_mode(config) == SynthesisMode.INCREMENTAL:
+            discard_draft(draft_key(state, config))
+
+    def limits(state, config):
+        # Every turn takes STEPS_PER_TURN sub-graph steps, so deep interviews need more than the default limit
+        steps = STEPS_PER_TURN * state.get("max_num_turns", 2) + 3
+        return {**config, "recursion_limit": max(config.get("recursion_limit", 25), steps)}
+
+    if use_async:
+        async def aconduct_interview(state, config):
+            try:
+                async with get_interview_scheduler().aslot(state.get("priority", 0), state.get("deadline"), state.get("run_id")):
+                    deadline = interview_deadline(state.get("deadline"), config)
+                    with deadline_scope(deadline):
+                        if deadline is None:
+                            output = await interview_graph.ainvoke(inputs(state), limits(state, config))
+                        else:
+                            output = await asyncio.wait_for(interview_graph.ainvoke(inputs(state), limits(state, config)), max(remaining(deadline), 0))
+                return folded(state, config, output)
+            except asyncio.TimeoutError:
+                return _dropped(state, "deadline passed")
+            except RunDeadlineExceeded as e:
+                return _dropped(state, e)
+            except Exception:
+                failed(state, config)
+                raise
+            finally:
+                release_interview(state, config)
+        return aconduct_interview
+
+    def conduct_interview(state, config):
+        try:
+            with get_interview_scheduler().slot(state.get("priority", 0), state.get("deadline"), state.get("run_id")):
+                # Sync nodes cannot be interrupted; every provider call checks the deadline and is bounded by it
+                with deadline_scope(interview_deadline(state.get("deadline"), config)):
+                    output = interview_graph.invoke(inputs(state), limits(state, config))
+            return folded(state, config, output)
+        except RunDeadlineExceeded as e:
+            return _dropped(state, e)
+        except Exception:
+            failed(state, config)
+            raise
+        finally:
+            release_interview(state, config)
+    return conduct_interview
+
+
+# generate_question, plan_queries, the retrieval step and generate_answer
+STEPS_PER_TURN = 4
+
+
+def build_interview_graph(use_async=False):
+    """ Interview sub-graph; use_async swaps in the ainvoke-based nodes """
+    builder = StateGraph(InterviewState, output=InterviewStateOutput)
+    builder.add_node("generate_question", instrument("generate_question", agenerate_question if use_async else generate_question))
+    builder.add_node("plan_queries", instrument("plan_queries", aplan_queries if use_async else plan_queries))
+    builder.add_node("search_web", instrument("search_web", asearch_web if use_async else search_web))
+    builder.add_node("search_wikipedia", instrument("search_wikipedia", asearch_wikipedia if use_async else search_wikipedia))
+    builder.add_node("retrieve", instrument("retrieve", aretrieve if use_async else retrieve))
+    builder.add_node("generate_answer", instrument("generate_answer", agenerate_answer if use_async else generate_answer))
+    builder.add_node("save_interview", instrument("save_interview", save_interview))
+    builder.add_node("write_section", instrument("write_section", awrite_section if use_async else write_section))
+
+    # Flow
+    builder.add_edge(START, "generate_question")
+    # config["configurable"]["retrieval_mode"]: barrier waits for both searches, pipelined answers on a quorum
+    builder.add_edge("generate_question", "plan_queries")
+    builder.add_conditional_edges("plan_queries", route_retrieval, ["search_web", "search_wikipedia", "retrieve"])
+    builder.add_edge("search_web", "generate_answer")
+    builder.add_edge("search_wikipedia", "generate_answer")
+    builder.add_edge("retrieve", "generate_answer")
+    builder.add_conditional_edges("generate_answer", route_messages,['generate_question','save_interview'])
+    builder.add_edge("save_interview", "write_section")
+    builder.add_edge("write_section", END)
+    return builder
+
+
+interview_builder = build_interview_graph()
+async_interview_builder = build_interview_graph(use_async=True)
 
 # Interview 
 # memory = MemorySaver()
-interview_graph = interview_builder.compile().with_config(run_name="Conduct Interviews")
\ No newline at end of file
+interview_graph = interview_builder.compile().with_config(run_name="Conduct Interviews")
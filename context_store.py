@@ -0,0 +1,96 @@
+import re
+import hashlib
+import logging
+from rate_limiter import estimate_tokens
+from passage_index import PassageConfig, create_index, get_index
+
+logger = logging.getLogger(__name__)
+
+
+class ContextConfig:
+    TOKEN_BUDGET = 6000  # max estimated tokens of source documents sent to generate_answer
+
+
+def _content_hash(text):
+    return hashlib.sha256(" ".join(text.split()).lower().encode("utf-8")).hexdigest()
+
+
+def _paragraphs(text):
+    return [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+
+def make_document(engine, source, content, page=""):
+    """ A retrieved document as stored in InterviewState.context """
+    return {"engine": engine, "source": source, "page": page, "content": content}
+
+
+def merge_documents(left, right):
+    """ Reducer for InterviewState.context: one entry per source, repeated paragraphs dropped.
+
+    Documents from the same URL/source are merged, keeping only paragraphs not seen before anywhere in the
+    context, so repeated searches across turns do not grow the prompt.
+    """
+    merged = [dict(doc) for doc in (left or [])]
+    by_source = {doc["source"]: doc for doc in merged if doc.get("source")}
+    seen = {_content_hash(p) for doc in merged for p in _paragraphs(doc["content"])}
+    for doc in right or []:
+        if isinstance(doc, str):
+            # Pre-formatted blobs from older checkpoints
+            doc = make_document("legacy", None, doc)
+        new_paragraphs = []
+        for paragraph in _paragraphs(doc["content"]):
+            digest = _content_hash(paragraph)
+            if digest not in seen:
+                seen.add(digest)
+                new_paragraphs.append(paragraph)
+        if not new_paragraphs:
+            logger.debug(f"Dropped duplicate document from {doc.get('source')}")
+            continue
+        existing = by_source.get(doc.get("source"))
+        if existing is not None:
+            existing["content"] = existing["content"] + "\n\n" + "\n\n".join(new_paragraphs)
+        else:
+            doc = dict(doc, content="\n\n".join(new_paragraphs))
+            merged.append(doc)
+            if doc.get("source"):
+                by_source[doc["source"]] = doc
+    return merged
+
+
+def format_documents(docs):
+    """ Render documents with the <Document .../> tags the answer and section prompts cite """
+    formatted = []
+    for doc in docs:
+        if doc["engine"] == "tavily":
+            formatted.append(f'<Document href="{doc["source"]}"/>\n{doc["content"]}\n</Document>')
+        elif doc["engine"] == "wikipedia":
+            formatted.append(f'<Document source="{doc["source"]}" page="{doc.get("page", "")}"/>\n{doc["content"]}\n</Document>')
+        else:
+            formatted.append(doc["content"])
+    return "\n\n---\n\n".join(formatted)
+
+
+def select_context(docs, question, token_budget=ContextConfig.TOKEN_BUDGET, retriever=PassageConfig.RETRIEVER,
+                   top_k=PassageConfig.TOP_K, index_key=None):
+    """ Keep the top_k passages most relevant to the question that fit in the token budget.
+
+    Passages come from a per-interview index (index_key) that is updated as the context grows, so documents
+    are only chunked and indexed once across turns.
+    """
+    index = get_index(index_key, retriever) if index_key is not None else create_index(retriever)
+    index.update(docs)
+
+    selected, used = [], 0
+    for score, passage in index.search(question, top_k):
+        cost = estimate_tokens(passage["text"])
+        if used + cost > token_budget:
+            continue
+        selected.append(passage)
+        used += cost
+
+    # Regroup the passages under their documents in original order so citations stay attached
+    kept = {}
+    for passage in sorted(selected, key=lambda p: (p["doc_position"], p["order"])):
+        kept.setdefault(passage["doc_position"], []).append(passage["text"])
+    logger.info(f"Selected {len(selected)}/{len(index)} context passages (~{used} tokens) with {retriever}")
+    return [dict(docs[i], content="\n\n".join(texts)) for i, texts in sorted(kept.items())]
@@ -1,19 +1,15 @@
 import logging
 from langchain_core.messages import HumanMessage, SystemMessage
-from llm_model import get_default_llm, get_creative_llm
+from llm_model import get_default_llm, get_creative_llm, invoke_llm, ainvoke_llm
 from state import GenerateAnalystsState, Perspectives
-from prompts import load_prompt
+from prompts import format_prompt
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-def create_analysts(state: GenerateAnalystsState, config: dict):
-    """ Create analysts """
-    logger.info("Starting to create analysts")
-
+def _analyst_messages(state: GenerateAnalystsState):
     topic = state['topic']
     max_analysts = state['max_analysts']
-    google_api_key = config["configurable"]["google_api_key"]
     logger.debug(f"Topic: {topic}, Max analysts: {max_analysts}")
     
     human_analyst_feedback = state.get('human_analyst_feedback', [])
@@ -24,33 +20,16 @@ def create_analysts(state: GenerateAnalystsState, config: dict):
         logger.debug("No human feedback provided")
         human_analyst_feedback = ""
                 
-    # Enforce structured output
-    # structured_llm = llm.with_structured_output(Perspectives)
-    structured_llm = get_creative_llm(google_api_key).with_structured_output(Perspectives)
-
     # System message
-    analyst_instructions = load_prompt("analyst_instructions")
-    system_message = analyst_instructions.format(topic=topic,
-                                                            human_analyst_feedback=human_analyst_feedback, 
-                                                            max_analysts=max_analysts)
-
-    # Generate analysts
-    logger.info("Generating analysts with LLM")
-    try:
-        analysts = structured_llm.invoke([SystemMessage(content=system_message)]+[HumanMessage(content="Generate the set of analysts.")])
-        logger.info(f"Successfully generated {len(analysts.analysts)} analysts")
-        return {"analysts": analysts.analysts}
-    except Exception as e:
-        logger.error(f"Error generating analysts: {str(e)}", exc_info=True)
-        raise
+    system_message = format_prompt("analyst_instructions",
+                                   topic=topic,
+                                   human_analyst_feedback=human_analyst_feedback,
+                                   max_analysts=max_analysts)
+    return [SystemMessage(content=system_message)]+[HumanMessage(content="Generate the set of analysts.")]
 
-def select_analysts(state: GenerateAnalystsState, config: dict):
-    """ Select analysts """
-    logger.info("Starting to select analysts")
-    
+def _selector_messages(state: GenerateAnalystsState):
     topic = state['topic']
     max_analysts = state['max_analysts']
-    google_api_key = config["configurable"]["google_api_key"]
     logger.debug(f"Topic: {topic}, Max analysts to select: {max_analysts}")
     
     human_analyst_feedback = state.get('human_analyst_feedback', [])
@@ -62,21 +41,61 @@ def select_analysts(state: GenerateAnalystsState, config: dict):
     candidates = "\n\n".join(analyst.persona for analyst in candidates)
     logger.debug(f"Total candidates text length: {len(candidates)} characters")
                 
-    # Enforce structured output
-    structured_llm = get_default_llm(google_api_key).with_structured_output(Perspectives)
-
     # System message
-    selector_instructions = load_prompt("selector_instructions")
-    system_message = selector_instructions.format(topic=topic,
-                                                            human_analyst_feedback=human_analyst_feedback, 
-                                                            max_analysts=max_analysts,
-                                                            candidates=candidates)
+    system_message = format_prompt("selector_instructions",
+                                   topic=topic,
+                                   human_analyst_feedback=human_analyst_feedback,
+                                   max_analysts=max_analysts,
+                                   candidates=candidates)
+    return [SystemMessage(content=system_message)]+[HumanMessage(content=f"Pick the {max_analysts} analysts.")]
+
+def create_analysts(state: GenerateAnalystsState, config: dict):
+    """ Create analysts """
+    logger.info("Starting to create analysts")
+    google_api_key = config["configurable"]["google_api_key"]
+    messages = _analyst_messages(state)
+
+    # Generate analysts
+    logger.info("Generating analysts with LLM")
+    try:
+        # Enforce structured output
+        analysts = invoke_llm(get_creative_llm(google_api_key), messages, schema=Perspectives, node="create_analysts")
+        logger.info(f"Successfully generated {len(analysts.analysts)} analysts")
+        return {"analysts": analysts.analysts}
+    except Exception as e:
+        logger.error(f"Error generating analysts: {str(e)}", exc_info=True)
+        raise
+
+async def acreate_analysts(state: GenerateAnalystsState, config: dict):
+    """ Create analysts (async) """
+    logger.info("Starting to create analysts")
+    google_api_key = config["configurable"]["google_api_key"]
+    messages = _analyst_messages(state)
+    try:
+        analysts = await ainvoke_llm(get_creative_llm(google_api_key), messages, schema=Perspectives, node="create_analysts")
+        logger.info(f"Successfully generated {len(analysts.analysts)} analysts")
+        return {"analysts": analysts.analysts}
+    except Exception as e:
+        logger.error(f"Error generating analysts: {str(e)}", exc_info=True)
+        raise
+
+def select_analysts(state: GenerateAnalystsState, config: dict):
+    """ Select analysts """
+    logger.info("Starting to select analysts")
+    google_api_key = config["configurable"]["google_api_key"]
 
     # Generate question 
-    analysts = structured_llm.invoke([SystemMessage(content=system_message)]+[HumanMessage(content=f"Pick the {max_analysts} analysts.")])
+    analysts = invoke_llm(get_default_llm(google_api_key), _selector_messages(state), schema=Perspectives, node="select_analysts")
     
     # Write the list of analysis to state
-    return {"final_analysts": analysts.analysts[:max_analysts]}
+    return {"final_analysts": analysts.analysts[:state['max_analysts']]}
+
+async def aselect_analysts(state: GenerateAnalystsState, config: dict):
+    """ Select analysts (async) """
+    logger.info("Starting to select analysts")
+    google_api_key = config["configurable"]["google_api_key"]
+    analysts = await ainvoke_llm(get_default_llm(google_api_key), _selector_messages(state), schema=Perspectives, node="select_analysts")
+    return {"final_analysts": analysts.analysts[:state['max_analysts']]}
 
 def human_feedback(state: GenerateAnalystsState):
     """ No-op node that should be interrupted on """
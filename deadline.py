@@ -0,0 +1,130 @@
+import os
+import time
+import inspect
+import logging
+import functools
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineConfig:
+    # Seconds from the start of the interviews to the finished report; 0 runs without a deadline.
+    # config["configurable"]["deadline_seconds"] overrides it per run
+    RUN_SECONDS = float(os.environ.get("RUN_DEADLINE_SECONDS", "0"))
+    # Share of the run budget held back for report synthesis; interviews still running after the rest are dropped
+    SYNTHESIS_SHARE = float(os.environ.get("DEADLINE_SYNTHESIS_SHARE", "0.25"))
+    # Seconds one interview may run once admitted (configurable "interview_timeout"); 0 for no limit
+    INTERVIEW_SECONDS = float(os.environ.get("INTERVIEW_TIMEOUT_SECONDS", "0"))
+    # Seconds a single LLM or search call may take before it is abandoned and retried; 0 for no limit
+    CALL_SECONDS = float(os.environ.get("PROVIDER_CALL_TIMEOUT", "0"))
+
+
+class RunDeadlineExceeded(Exception):
+    """ Raised inside an interview or synthesis node once its deadline has passed; never retried """
+
+
+class CallCancelled(RunDeadlineExceeded):
+    """ Raised at the next provider call of work whose result is no longer wanted, e.g. a late retriever of an
+    interview that has ended; handled like a passed deadline, so it is never retried """
+
+
+# Epoch seconds by which the current interview or synthesis node must end, seen by every provider call it makes
+_deadline = contextvars.ContextVar("deadline", default=None)
+# threading.Event set once the current work has been discarded
+_cancelled = contextvars.ContextVar("cancelled", default=None)
+
+
+def _run_budget(config: dict):
+    return float((config or {}).get("configurable", {}).get("deadline_seconds") or DeadlineConfig.RUN_SECONDS)
+
+
+def run_deadline(config: dict, now=None):
+    """ Epoch seconds by which the report must be written, or None without a run budget """
+    budget = _run_budget(config)
+    return None if budget <= 0 else (now or time.time()) + budget
+
+
+def interviews_deadline(config: dict, now=None):
+    """ Epoch seconds by which all interviews must end so the report lands within the run budget, or None """
+    budget = _run_budget(config)
+    if budget <= 0:
+        return None
+    share = float(config["configurable"].get("synthesis_share", DeadlineConfig.SYNTHESIS_SHARE))
+    return (now or time.time()) + budget * (1 - share)
+
+
+def interview_deadline(deadline, config: dict, now=None):
+    """ Deadline of one interview admitted now: the interviews' deadline or its own timeout, whichever is sooner """
+    timeout = float((config or {}).get("configurable", {}).get("interview_timeout") or DeadlineConfig.INTERVIEW_SECONDS)
+    if timeout <= 0:
+        return deadline
+    own = (now or time.time()) + timeout
+    return own if deadline is None else min(deadline, own)
+
+
+@contextmanager
+def deadline_scope(deadline):
+    """ Make provider calls in this context give up at `deadline` (epoch seconds, None for no limit) """
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def cancel_scope(event):
+    """ Make provider calls in this context raise CallCancelled once `event` (a threading.Event) is set """
+    token = _cancelled.set(event)
+    try:
+        yield
+    finally:
+        _cancelled.reset(token)
+
+
+def within_run_deadline(node):
+    """ Run a synthesis node under the state's run_deadline: its provider calls give up when the run budget is
+    spent, raising RunDeadlineExceeded instead of finishing the report late """
+    if inspect.iscoroutinefunction(node):
+        @functools.wraps(node)
+        async def async_wrapper(state, *args, **kwargs):
+            with deadline_scope(state.get("run_deadline")):
+                return await node(state, *args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(node)
+    def wrapper(state, *args, **kwargs):
+        with deadline_scope(state.get("run_deadline")):
+            return node(state, *args, **kwargs)
+    return wrapper
+
+
+def current_deadline():
+    return _deadline.get()
+
+
+def remaining(deadline=None):
+    """ Seconds left until `deadline` (default: the current scope's), or None without one """
+    deadline = _deadline.get() if deadline is None else deadline
+    return None if deadline is None else deadline - time.time()
+
+
+def check_deadline(what="call"):
+    """ Cooperative cancellation point: raise RunDeadlineExceeded if the current deadline has passed, or
+    CallCancelled if the current work was discarded """
+    cancelled = _cancelled.get()
+    if cancelled is not None and cancelled.is_set():
+        raise CallCancelled(f"Cancelled before {what}")
+    left = remaining()
+    if left is not None and left <= 0:
+        raise RunDeadlineExceeded(f"Deadline passed {-left:.1f}s before {what}")
+
+
+def call_timeout():
+    """ (seconds, bounded_by_deadline) a provider call may take now, or (None, False) without a limit """
+    left = remaining()
+    if DeadlineConfig.CALL_SECONDS > 0 and (left is None or DeadlineConfig.CALL_SECONDS < left):
+        return DeadlineConfig.CALL_SECONDS, False
+    return (None, False) if left is None else (max(left, 0.0), True)
@@ -0,0 +1,220 @@
+import os
+import re
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+import typing
+from pydantic import BaseModel
+from langchain_core.messages import AIMessage
+from langchain_core.documents import Document
+from rate_limiter import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Deterministic, offline stand-ins for Gemini, Tavily and Wikipedia, selected with LLM_BACKEND=fake / SEARCH_BACKEND=fake
+
+class FakeConfig:
+    LLM_LATENCY = float(os.environ.get("FAKE_LLM_LATENCY", "0"))  # seconds per call
+    LLM_LATENCY_PER_1K_TOKENS = float(os.environ.get("FAKE_LLM_LATENCY_PER_1K_TOKENS", "0"))  # plus per 1k prompt tokens
+    SEARCH_LATENCY = float(os.environ.get("FAKE_SEARCH_LATENCY", "0"))
+    WIKIPEDIA_LATENCY = float(os.environ.get("FAKE_WIKIPEDIA_LATENCY", "-1"))  # page loads; negative: SEARCH_LATENCY
+    LATENCY_JITTER = float(os.environ.get("FAKE_LATENCY_JITTER", "0.2"))  # +/- fraction of the latency
+    ERROR_RATE = float(os.environ.get("FAKE_ERROR_RATE", "0"))  # probability a call fails with a retryable 503
+    RESPONSE_WORDS = int(os.environ.get("FAKE_RESPONSE_WORDS", "150"))
+    LIST_ITEMS = 3  # items in structured list fields when the prompt does not ask for a number
+    SEED = int(os.environ.get("FAKE_SEED", "0"))
+
+
+def configure_fakes(llm_latency=None, search_latency=None, latency_jitter=None, error_rate=None,
+                    response_words=None, seed=None, wikipedia_latency=None, llm_latency_per_1k_tokens=None):
+    """ Adjust the fake backends at runtime; None leaves a setting unchanged """
+    for name, value in (("LLM_LATENCY", llm_latency), ("SEARCH_LATENCY", search_latency),
+                        ("LATENCY_JITTER", latency_jitter), ("ERROR_RATE", error_rate),
+                        ("RESPONSE_WORDS", response_words), ("SEED", seed),
+                        ("WIKIPEDIA_LATENCY", wikipedia_latency), ("LLM_LATENCY_PER_1K_TOKENS", llm_latency_per_1k_tokens)):
+        if value is not None:
+            setattr(FakeConfig, name, value)
+    _rng.seed(FakeConfig.SEED)
+
+
+class FakeServiceError(RuntimeError):
+    """ Injected failure; the 503 status makes it retryable like a real overload """
+    def __init__(self, endpoint):
+        super().__init__(f"Injected failure from fake {endpoint}")
+        self.status_code = 503
+
+
+WORDS = ("analysis data growth market policy research model system impact energy network cost risk adoption "
+         "evidence trend capacity demand supply security efficiency deployment standard platform").split()
+
+_rng = random.Random(FakeConfig.SEED)
+_rng_lock = threading.Lock()
+
+
+def _delay(latency):
+    if latency <= 0:
+        return 0.0
+    with _rng_lock:
+        return max(0.0, latency * (1 + _rng.uniform(-FakeConfig.LATENCY_JITTER, FakeConfig.LATENCY_JITTER)))
+
+
+def _wikipedia_latency():
+    return FakeConfig.SEARCH_LATENCY if FakeConfig.WIKIPEDIA_LATENCY < 0 else FakeConfig.WIKIPEDIA_LATENCY
+
+
+def simulated_latency(kind):
+    """ A jittered fake latency for an "llm" or search call, used when replaying cassettes """
+    return _delay(FakeConfig.LLM_LATENCY if kind == "llm" else FakeConfig.SEARCH_LATENCY)
+
+
+def _maybe_fail(endpoint):
+    with _rng_lock:
+        failed = FakeConfig.ERROR_RATE > 0 and _rng.random() < FakeConfig.ERROR_RATE
+    if failed:
+        raise FakeServiceError(endpoint)
+
+
+def _seed(*parts):
+    return int(hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:12], 16)
+
+
+def fake_text(seed, words=None):
+    """ Deterministic filler text for a seed """
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(words or FakeConfig.RESPONSE_WORDS))
+
+
+def _prompt(messages):
+    return "\n".join(str(getattr(m, "content", m)) for m in messages)
+
+
+def _requested_count(prompt):
+    # "Pick the top 3 themes" / "selecting 3 AI analyst personas"
+    match = re.search(r"\b(?:top|selecting|Pick the)\s+(\d+)\b", prompt)
+    return int(match.group(1)) if match else FakeConfig.LIST_ITEMS
+
+
+def fake_structured(schema, prompt, seed):
+    """ Fill every field of a pydantic schema with deterministic values """
+    values = {}
+    for index, (name, field) in enumerate(schema.model_fields.items()):
+        values[name] = _fake_value(field.annotation, name, prompt, _seed(seed, index))
+    return schema(**values)
+
+
+def _fake_value(annotation, name, prompt, seed):
+    origin = typing.get_origin(annotation)
+    args = [a for a in typing.get_args(annotation) if a is not type(None)]
+    if origin is typing.Union:
+        return _fake_value(args[0], name, prompt, seed)
+    if origin in (list, typing.List):
+        item = args[0] if args else str
+        return [_fake_value(item, name, prompt, _seed(seed, i)) for i in range(_requested_count(prompt))]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return fake_structured(annotation, prompt, seed)
+    if annotation is int:
+        return seed % 10
+    if annotation is float:
+        return (seed % 1000) / 1000
+    if annotation is bool:
+        return bool(seed % 2)
+    if name == "name":
+        return f"Analyst {seed % 10000}"
+    # Queries (including QueryPlan's per-engine lists) and short labels get a dozen words
+    return fake_text(seed, words=12 if name in ("search_query", "tavily", "wikipedia", "affiliation", "role") else None)
+
+
+def _fake_message(model, prompt, seed):
+    body = fake_text(seed)
+    content = f"## {fake_text(seed, words=4).title()}\n\n{body}\n\n## Sources\n[1] https://example.com/{seed % 100000}"
+    output_tokens = estimate_tokens(content)
+    return AIMessage(content=content, response_metadata={"model_name": model},
+                     usage_metadata={"input_tokens": estimate_tokens(prompt), "output_tokens": output_tokens,
+                                     "total_tokens": estimate_tokens(prompt) + output_tokens})
+
+
+class FakeChatModel:
+    """ Scripted stand-in for ChatGoogleGenerativeAI.
+
+    Responses are a pure function of the model, schema and prompt, so runs are reproducible. `script` maps a
+    schema name (or "text" for plain replies) to a callable(messages) that overrides the generated response.
+    """
+    def __init__(self, model, temperature=0, google_api_key=None, max_retries=0, script=None, schema=None):
+        self.model = model
+        self.temperature = temperature
+        self.script = script or {}
+        self.schema = schema
+
+    def with_structured_output(self, schema, **kwargs):
+        return FakeChatModel(self.model, self.temperature, script=self.script, schema=schema)
+
+    def _respond(self, messages):
+        _maybe_fail(f"llm/{self.model}")
+        scripted = self.script.get(self.schema.__name__ if self.schema is not None else "text")
+        if scripted is not None:
+            return scripted(messages)
+        prompt = _prompt(messages)
+        seed = _seed(self.model, self.schema.__name__ if self.schema is not None else "", prompt)
+        if self.schema is not None:
+            return fake_structured(self.schema, prompt, seed)
+        return _fake_message(self.model, prompt, seed)
+
+    @staticmethod
+    def _latency(messages):
+        return FakeConfig.LLM_LATENCY + FakeConfig.LLM_LATENCY_PER_1K_TOKENS * estimate_tokens(messages) / 1000
+
+    def invoke(self, messages, config=None, **kwargs):
+        time.sleep(_delay(self._latency(messages)))
+        return self._respond(messages)
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        await asyncio.sleep(_delay(self._latency(messages)))
+        return self._respond(messages)
+
+
+class FakeTavilyAPIWrapper:
+    """ Stand-in for TavilySearchAPIWrapper.results() """
+    def __init__(self, tavily_api_key=None):
+        pass
+
+    def results(self, query, max_results=5, search_depth="advanced", **kwargs):
+        time.sleep(_delay(FakeConfig.SEARCH_LATENCY))
+        _maybe_fail("tavily")
+        return [{"url": f"https://example.com/{_seed(query, i) % 100000}", "content": fake_text(_seed("tavily", query, i))}
+                for i in range(max_results)]
+
+
+class FakeTavilySearch:
+    """ Exposes the attributes search_tavily() reads from TavilySearchResults """
+    def __init__(self, max_results=3, api_wrapper=None, search_depth="advanced"):
+        self.max_results = max_results
+        self.search_depth = search_depth
+        self.api_wrapper = api_wrapper or FakeTavilyAPIWrapper()
+
+
+class FakeWikipediaLoader:
+    """ Stand-in for WikipediaLoader """
+    def __init__(self, query, load_max_docs=2, **kwargs):
+        self.query = query
+        self.load_max_docs = load_max_docs
+
+    def _documents(self):
+        _maybe_fail("wikipedia")
+        docs = []
+        for i in range(self.load_max_docs):
+            title = fake_text(_seed("wikipedia-title", self.query, i), words=3).title()
+            paragraphs = [fake_text(_seed("wikipedia", self.query, i, p)) for p in range(3)]
+            docs.append(Document(page_content="\n\n".join(paragraphs),
+                                 metadata={"source": f"https://en.wikipedia.org/wiki/{title.replace(' ', '_')}", "title": title}))
+        return docs
+
+    def load(self):
+        time.sleep(_delay(_wikipedia_latency()))
+        return self._documents()
+
+    async def aload(self):
+        await asyncio.sleep(_delay(_wikipedia_latency()))
+        return self._documents()
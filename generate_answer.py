@@ -1,119 +1,347 @@
+import os
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-from state import InterviewState, SearchQuery
-from llm_model import get_default_llm, get_versatile_llm, get_creative_llm, get_tavily_search
+from state import InterviewState, SearchQuery, QueryPlan
+from llm_model import (get_default_llm, get_versatile_llm, get_creative_llm, invoke_llm, search_tavily, load_wikipedia,
+                       ainvoke_llm, asearch_tavily, aload_wikipedia)
 from langchain_core.messages import get_buffer_string
-from prompts import load_prompt
-from langchain_community.document_loaders import WikipediaLoader
-import time
+from prompts import format_prompt
+from context_store import ContextConfig, make_document, format_documents, select_context, merge_documents
+from retrieval import (RetrievalMode, get_retrieval_mode, pipelined_settings, gather, agather, collect_late, acollect_late,
+                       discard_late)
+from passage_index import PassageConfig, drop_index
+from novelty import expert_answers, saturated
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class QueryPlanning:
+    SINGLE = "single"  # plan_queries writes the queries of every engine in one structured call
+    PER_ENGINE = "per_engine"  # each search node asks for its own query
+    DEFAULT = os.environ.get("QUERY_PLANNING", SINGLE)
+    ALL = (SINGLE, PER_ENGINE)
+    # Queries per engine in single mode, searched in parallel (config["configurable"]["query_variants"])
+    VARIANTS = int(os.environ.get("SEARCH_QUERY_VARIANTS", "1"))
+
+
+# What each engine in QueryPlan is good for, shown to the query planner
+SEARCH_ENGINES = {
+    "tavily": "tavily: web search for recent news, reports, statistics and expert commentary",
+    "wikipedia": "wikipedia: encyclopedia articles for background, definitions and history",
+}
+
+
+def get_query_planning(config: dict):
+    """ Query planning mode from config["configurable"]["query_planning"] """
+    mode = (config or {}).get("configurable", {}).get("query_planning") or QueryPlanning.DEFAULT
+    if mode not in QueryPlanning.ALL:
+        raise ValueError(f"Unknown query_planning '{mode}', expected one of {QueryPlanning.ALL}")
+    return mode
+
+
+def _query_variants(config: dict):
+    return max(1, int((config or {}).get("configurable", {}).get("query_variants") or QueryPlanning.VARIANTS))
+
+
+def _search_query_messages(state: InterviewState, search_engine: str):
+    """ Messages asking the LLM to turn the last question into a search query """
+    messages = state["messages"]
+    system_message = format_prompt("search_instructions", search_engine=search_engine)
+    human_message = HumanMessage(content=messages[-1].content)
+    return [SystemMessage(content=system_message)] + [human_message]
+
+
+def _query_plan_messages(state: InterviewState, variants: int):
+    engines = "\n".join(f"- {SEARCH_ENGINES[engine]}" for engine in QueryPlan.model_fields)
+    system_message = format_prompt("query_plan_instructions", engines=engines, variants=variants)
+    return [SystemMessage(content=system_message)] + [HumanMessage(content=state["messages"][-1].content)]
+
+
+def _planned(plan: QueryPlan, variants: int):
+    return {engine: [query for query in getattr(plan, engine) if query.strip()][:variants] for engine in QueryPlan.model_fields}
+
+
+def plan_queries(state: InterviewState, config: dict):
+    """ Node to write this turn's search queries for every engine in one structured call """
+    if get_query_planning(config) != QueryPlanning.SINGLE:
+        return {"search_queries": {}}
+    google_api_key = config["configurable"]["google_api_key"]
+    variants = _query_variants(config)
+    plan = invoke_llm(get_versatile_llm(google_api_key), _query_plan_messages(state, variants), schema=QueryPlan, node="plan_queries")
+    logger.info(f"Planned search queries: {plan}")
+    return {"search_queries": _planned(plan, variants)}
+
+
+async def aplan_queries(state: InterviewState, config: dict):
+    """ Node to write this turn's search queries for every engine in one structured call (async) """
+    if get_query_planning(config) != QueryPlanning.SINGLE:
+        return {"search_queries": {}}
+    google_api_key = config["configurable"]["google_api_key"]
+    variants = _query_variants(config)
+    plan = await ainvoke_llm(get_versatile_llm(google_api_key), _query_plan_messages(state, variants), schema=QueryPlan, node="plan_queries")
+    logger.info(f"Planned search queries: {plan}")
+    return {"search_queries": _planned(plan, variants)}
+
+
+def _planned_queries(state: InterviewState, engine: str):
+    # Empty in per_engine mode, or when the planner wrote nothing for this engine
+    return (state.get("search_queries") or {}).get(engine) or []
+
+
+def _fan_out(search, queries):
+    """ search(query) for every query, in parallel, with the results concatenated in query order """
+    if len(queries) == 1:
+        return search(queries[0])
+    with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, search, query) for query in queries]
+        return [result for future in futures for result in future.result()]
+
+
+async def _afan_out(search, queries):
+    results = await asyncio.gather(*(search(query) for query in queries))
+    return [result for batch in results for result in batch]
+
+
+def _retrieval(state: InterviewState, docs):
+    """ Sources retrieved for the question being answered, for the novelty stopping policy """
+    return {"turn": len(expert_answers(state["messages"])), "sources": [doc["source"] for doc in docs if doc.get("source")]}
+
+
+def _web_documents(search_docs):
+    return [make_document("tavily", doc["url"], doc["content"]) for doc in search_docs]
+
+
+def _wikipedia_documents(search_docs):
+    return [
+        make_document("wikipedia", doc.metadata["source"], doc.page_content, page=doc.metadata.get("page", ""))
+        for doc in search_docs
+    ]
+
+
+def _answer_messages(state: InterviewState, config: dict):
+    analyst = state["analyst"]
+    messages = state["messages"]
+    # Only the top-k passages most relevant to this question, within the token budget
+    configurable = config["configurable"]
+    token_budget = configurable.get("context_token_budget", ContextConfig.TOKEN_BUDGET)
+    docs = select_context(state["context"], messages[-1].content, token_budget,
+                          retriever=configurable.get("passage_retriever", PassageConfig.RETRIEVER),
+                          top_k=configurable.get("passage_top_k", PassageConfig.TOP_K),
+                          index_key=_interview_key(state, config))
+    context = format_documents(docs)
+    system_message = format_prompt("answer_instructions", goals=analyst.description, context=context)
+    human_message = HumanMessage(content=messages[-1].content)
+    return [SystemMessage(content=system_message)] + [human_message]
+
+
+def _section_messages(state: InterviewState):
+    interview = state["interview"]
+    analyst = state["analyst"]
+    # Write section using either the gathered source docs from interview (context) or the interview itself (interview)
+    system_message = format_prompt("section_writer_instructions", focus=analyst.description)
+    return [SystemMessage(content=system_message)] + [HumanMessage(content=f"Use this source to write your section: {interview}")]
+
+
 def search_web(state: InterviewState, config: dict):
     """ Retrieve docs from web search """
     logger.info("Entered search_web function.")
     try:
-        time.sleep(15) # to prevent rate limit
-        
-        messages = state["messages"]
         google_api_key = config["configurable"]["google_api_key"]
         tavily_api_key = config["configurable"]["tavily_api_key"]
-        
-        # Search query
-        search_instructions = load_prompt("search_instructions")
-        system_message = search_instructions.format(search_engine="tavily")
-        
-        structured_llm = get_creative_llm(google_api_key).with_structured_output(SearchQuery)
-        human_message = HumanMessage(content=messages[-1].content)
-        search_query = structured_llm.invoke([SystemMessage(content=system_message)] + [human_message])
-        logger.info(f"Generated search query: {search_query.search_query}")
-        
+
+        # Search queries
+        queries = _planned_queries(state, "tavily")
+        if not queries:
+            search_query = invoke_llm(get_creative_llm(google_api_key), _search_query_messages(state, "tavily"),
+                                      schema=SearchQuery, node="search_web")
+            queries = [search_query.search_query]
+        logger.info(f"Search queries: {queries}")
+
         # Search
-        tavily_search = get_tavily_search(tavily_api_key)
-        search_docs = tavily_search.invoke(search_query.search_query)
+        search_docs = _fan_out(lambda query: search_tavily(query, tavily_api_key, node="search_web"), queries)
         logger.info(f"Retrieved {len(search_docs)} documents from Tavily.")
-        
-        # Format
-        formatted_search_docs = "\n\n---\n\n".join(
-            [
-                f'<Document href="{doc["url"]}"/>\n{doc["content"]}\n</Document>'
-                for doc in search_docs
-            ]
-        )
-        logger.info("Formatted search documents.")
-        return {"context": [formatted_search_docs]} 
+
+        docs = _web_documents(search_docs)
+        return {"context": docs, "retrievals": [_retrieval(state, docs)]}
     except Exception as e:
         logger.error(f"Exception in search_web: {e}")
         raise
 
 
+async def asearch_web(state: InterviewState, config: dict):
+    """ Retrieve docs from web search (async) """
+    logger.info("Entered asearch_web function.")
+    try:
+        google_api_key = config["configurable"]["google_api_key"]
+        tavily_api_key = config["configurable"]["tavily_api_key"]
+
+        queries = _planned_queries(state, "tavily")
+        if not queries:
+            search_query = await ainvoke_llm(get_creative_llm(google_api_key), _search_query_messages(state, "tavily"),
+                                             schema=SearchQuery, node="search_web")
+            queries = [search_query.search_query]
+        logger.info(f"Search queries: {queries}")
+
+        search_docs = await _afan_out(lambda query: asearch_tavily(query, tavily_api_key, node="search_web"), queries)
+        logger.info(f"Retrieved {len(search_docs)} documents from Tavily.")
+        docs = _web_documents(search_docs)
+        return {"context": docs, "retrievals": [_retrieval(state, docs)]}
+    except Exception as e:
+        logger.error(f"Exception in asearch_web: {e}")
+        raise
+
+
 def search_wikipedia(state: InterviewState, config: dict):
     """ Retrieve docs from wikipedia """
     logger.info("Entered search_wikipedia function.")
     try:
-        time.sleep(20)  # to prevent rate limit
-
-        messages = state["messages"]
         google_api_key = config["configurable"]["google_api_key"]
-        
-        # Search query
-        search_instructions = load_prompt("search_instructions")
-        system_message = search_instructions.format(search_engine="wikipedia")
-        
-        structured_llm = get_versatile_llm(google_api_key).with_structured_output(SearchQuery)
-        human_message = HumanMessage(content=messages[-1].content)
-        search_query = structured_llm.invoke([SystemMessage(content=system_message)] + [human_message])
-        logger.info(f"Wikipedia search query: {search_query.search_query}")
-        
+
+        # Search queries
+        queries = _planned_queries(state, "wikipedia")
+        if not queries:
+            search_query = invoke_llm(get_versatile_llm(google_api_key), _search_query_messages(state, "wikipedia"),
+                                      schema=SearchQuery, node="search_wikipedia")
+            queries = [search_query.search_query]
+        logger.info(f"Wikipedia search queries: {queries}")
+
         # Search
-        search_docs = WikipediaLoader(query=search_query.search_query, load_max_docs=2).load()
+        search_docs = _fan_out(lambda query: load_wikipedia(query, load_max_docs=2, node="search_wikipedia"), queries)
         logger.info(f"Retrieved {len(search_docs)} Wikipedia documents")
 
-        # Format
-        formatted_search_docs = "\n\n---\n\n".join(
-            [
-                f'<Document source="{doc.metadata["source"]}" page="{doc.metadata.get("page", "")}"/>'
-                f"\n{doc.page_content}\n</Document>"
-                for doc in search_docs
-            ]
-        )
         logger.info("Exiting search_wikipedia function.")
-        return {"context": [formatted_search_docs]}
+        docs = _wikipedia_documents(search_docs)
+        return {"context": docs, "retrievals": [_retrieval(state, docs)]}
     except Exception as e:
         logger.error(f"Exception in search_wikipedia: {e}")
         raise
 
 
+async def asearch_wikipedia(state: InterviewState, config: dict):
+    """ Retrieve docs from wikipedia (async) """
+    logger.info("Entered asearch_wikipedia function.")
+    try:
+        google_api_key = config["configurable"]["google_api_key"]
+
+        queries = _planned_queries(state, "wikipedia")
+        if not queries:
+            search_query = await ainvoke_llm(get_versatile_llm(google_api_key), _search_query_messages(state, "wikipedia"),
+                                             schema=SearchQuery, node="search_wikipedia")
+            queries = [search_query.search_query]
+        logger.info(f"Wikipedia search queries: {queries}")
+
+        search_docs = await _afan_out(lambda query: aload_wikipedia(query, load_max_docs=2, node="search_wikipedia"), queries)
+        logger.info(f"Retrieved {len(search_docs)} Wikipedia documents")
+        docs = _wikipedia_documents(search_docs)
+        return {"context": docs, "retrievals": [_retrieval(state, docs)]}
+    except Exception as e:
+        logger.error(f"Exception in asearch_wikipedia: {e}")
+        raise
+
+
+def _interview_key(state: InterviewState, config: dict):
+    """ Key of this interview's in-process state; interviews checkpointed without an interview_id fall back to
+    their thread and analyst """
+    return state.get("interview_id") or (config["configurable"].get("thread_id"), state["analyst"].name)
+
+
+def release_interview(state: InterviewState, config: dict):
+    """ Forget the in-process state of an interview that finished, failed or was cut off """
+    key = _interview_key(state, config)
+    drop_index(key)
+    discard_late(key)
+
+
+def route_retrieval(state: InterviewState, config: dict):
+    """ Both search nodes in barrier mode, the single retrieve node in pipelined mode """
+    if get_retrieval_mode(config) == RetrievalMode.PIPELINED:
+        return "retrieve"
+    return ["search_web", "search_wikipedia"]
+
+
+def retrieve(state: InterviewState, config: dict):
+    """ Pipelined retrieval: search the web and Wikipedia at once and return as soon as a quorum has answered """
+    logger.info("Entered retrieve function.")
+    quorum, wait_seconds, _, _ = pipelined_settings(config)
+    docs = gather(_interview_key(state, config), {"search_web": lambda: search_web(state, config),
+                                                  "search_wikipedia": lambda: search_wikipedia(state, config)},
+                  quorum, wait_seconds)
+    logger.info(f"Retrieved {len(docs)} documents before answering")
+    return {"context": docs, "retrievals": [_retrieval(state, docs)]}
+
+
+async def aretrieve(state: InterviewState, config: dict):
+    """ Pipelined retrieval (async) """
+    logger.info("Entered aretrieve function.")
+    quorum, wait_seconds, _, _ = pipelined_settings(config)
+    docs = await agather(_interview_key(state, config), {"search_web": lambda: asearch_web(state, config),
+                                                         "search_wikipedia": lambda: asearch_wikipedia(state, config)},
+                         quorum, wait_seconds)
+    logger.info(f"Retrieved {len(docs)} documents before answering")
+    return {"context": docs, "retrievals": [_retrieval(state, docs)]}
+
+
+def _with_documents(state: InterviewState, docs):
+    return dict(state, context=merge_documents(state["context"], docs))
+
+
 def generate_answer(state: InterviewState, config: dict):
     logger.info("Entered generate_answer function.")
     try:
         """ Node to answer a question """
-        # Get state
-        analyst = state["analyst"]
-        messages = state["messages"]
-        context = state["context"]
         google_api_key = config["configurable"]["google_api_key"]
 
         # Answer question
-        answer_instructions = load_prompt("answer_instructions")
-        system_message = answer_instructions.format(goals=analyst.description, context=context)
-        human_message = HumanMessage(content=messages[-1].content)
-        answer = get_default_llm(google_api_key).invoke([SystemMessage(content=system_message)] + [human_message])
-        
+        answer = invoke_llm(get_default_llm(google_api_key), _answer_messages(state, config), node="generate_answer")
+
+        update = {}
+        if get_retrieval_mode(config) == RetrievalMode.PIPELINED:
+            # Documents from retrievers that missed the quorum join the context; optionally answer again with them
+            _, _, refine, refine_wait = pipelined_settings(config)
+            late = collect_late(_interview_key(state, config), refine_wait if refine else 0)
+            if late and refine:
+                answer = invoke_llm(get_default_llm(google_api_key), _answer_messages(_with_documents(state, late), config),
+                                    node="generate_answer")
+            update.update(context=late, retrievals=[_retrieval(state, late)])
+
         # Name the message as coming from the expert
         answer.name = "expert"
-        
+
         # Append it to state
         logger.info("Exiting generate_answer function.")
-        return {"messages": [answer]}
+        return {"messages": [answer], **update}
     except Exception as e:
         logger.error(f"Exception in generate_answer: {e}")
         raise
 
 
-def route_messages(state: InterviewState, 
-                   name: str = "expert"):
+async def agenerate_answer(state: InterviewState, config: dict):
+    """ Node to answer a question (async) """
+    logger.info("Entered agenerate_answer function.")
+    try:
+        google_api_key = config["configurable"]["google_api_key"]
+        answer = await ainvoke_llm(get_default_llm(google_api_key), _answer_messages(state, config), node="generate_answer")
+        update = {}
+        if get_retrieval_mode(config) == RetrievalMode.PIPELINED:
+            _, _, refine, refine_wait = pipelined_settings(config)
+            late = await acollect_late(_interview_key(state, config), refine_wait if refine else 0)
+            if late and refine:
+                answer = await ainvoke_llm(get_default_llm(google_api_key), _answer_messages(_with_documents(state, late), config),
+                                           node="generate_answer")
+            update.update(context=late, retrievals=[_retrieval(state, late)])
+        answer.name = "expert"
+        return {"messages": [answer], **update}
+    except Exception as e:
+        logger.error(f"Exception in agenerate_answer: {e}")
+        raise
+
+
+def route_messages(state: InterviewState,
+                   name: str = "expert",
+                   config: dict = None):
     logger.info(f"Entered route_messages function with name={name}.")
     try:
         """ Route between question and answer """
@@ -121,7 +349,7 @@ def route_messages(state: InterviewState,
         messages = state["messages"]
         max_num_turns = state.get('max_num_turns', 2)
 
-        # Check the number of expert answers 
+        # Check the number of expert answers
         num_responses = len(
             [m for m in messages if isinstance(m, AIMessage) and m.name == name]
         )
@@ -129,25 +357,32 @@ def route_messages(state: InterviewState,
         if num_responses >= max_num_turns:
             logger.info("Max number of turns reached, saving interview")
             return 'save_interview'
-        
+
         # Get the last question asked to check if it signals the end of discussion
         last_question = messages[-2]
         if "Thank you so much for your help" in last_question.content:
             logger.info("Thank you so much for your help found, saving interview")
             return 'save_interview'
-        
+
+        # End once the answers stop adding new text and sources
+        if saturated(state, config, name):
+            logger.info("Answers no longer add new information, saving interview")
+            return 'save_interview'
+
         logger.info("Exiting route_messages function. Returning to generate_question.")
-        time.sleep(30)  # to prevent rate limit
         return "generate_question"
     except Exception as e:
         logger.error(f"Exception in route_messages: {e}")
         raise
 
 
-def save_interview(state: InterviewState):
+def save_interview(state: InterviewState, config: dict):
     logger.info("Entered save_interview function.")
     try:
         """ Save interviews """
+        # Retrievers still running from the last turn can no longer contribute
+        discard_late(_interview_key(state, config))
+
         # Get messages
         messages = state["messages"]
 
@@ -166,21 +401,9 @@ def write_section(state: InterviewState, config: dict):
     logger.info("Entered write_section function.")
     try:
         """ Node to answer a question """
-        time.sleep(20)  # to prevent rate limit
-        
-        # Get state
-        interview = state["interview"]
-        context = state["context"]
-        analyst = state["analyst"]
         google_api_key = config["configurable"]["google_api_key"]
-        
-        # Write section using either the gathered source docs from interview (context) or the interview itself (interview)
-        section_writer_instructions = load_prompt("section_writer_instructions")
-        # system_message = section_writer_instructions.format(focus=analyst["description"])
-        system_message = section_writer_instructions.format(focus=analyst.description)
-        section = get_default_llm(google_api_key).invoke(
-            [SystemMessage(content=system_message)] + [HumanMessage(content=f"Use this source to write your section: {interview}")]
-        )
+
+        section = invoke_llm(get_default_llm(google_api_key), _section_messages(state), node="write_section")
 
         # Append it to state
         logger.info(f"Section written with length {len(section.content)}")
@@ -188,3 +411,16 @@ def write_section(state: InterviewState, config: dict):
     except Exception as e:
         logger.error(f"Exception in write_section: {e}")
         raise
+
+
+async def awrite_section(state: InterviewState, config: dict):
+    """ Node to write a section from the interview (async) """
+    logger.info("Entered awrite_section function.")
+    try:
+        google_api_key = config["configurable"]["google_api_key"]
+        section = await ainvoke_llm(get_default_llm(google_api_key), _section_messages(state), node="write_section")
+        logger.info(f"Section written with length {len(section.content)}")
+        return {"sections": [section.content]}
+    except Exception as e:
+        logger.error(f"Exception in awrite_section: {e}")
+        raise
@@ -1,62 +1,257 @@
-from state import ResearchState
-import time
-from prompts import load_prompt
+import os
+import re
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from state import ResearchState, FinalReport
+from prompts import format_prompt
 from langchain_core.messages import HumanMessage, SystemMessage
-from llm_model import get_default_llm, get_versatile_llm, get_creative_llm
+from llm_model import get_default_llm, get_versatile_llm, get_creative_llm, invoke_llm, ainvoke_llm
+from metrics import run_summary, run_metrics
+from rate_limiter import estimate_tokens
+from report_draft import pop_draft, draft_key
 
+logger = logging.getLogger(__name__)
 
-def write_report(state: ResearchState, config: dict):
-    time.sleep(15)  # to prevent rate limit
 
-    sections = state["sections"]
-    topic = state["topic"]
-    google_api_key = config["configurable"]["google_api_key"]
+class SynthesisMode:
+    FANOUT = "fanout"  # report, introduction and conclusion each written from all sections, in parallel
+    SINGLE = "single"  # one structured call returns introduction, body and conclusion
+    FROM_BODY = "from_body"  # body from the sections, then introduction and conclusion from the body only
+    # Sections merged in parallel batches, level by level, until they fit the token budget; then as from_body
+    HIERARCHICAL = "hierarchical"
+    # Each section is folded into a running draft as its interview ends; after the join only the sections
+    # still pending are folded in, then as from_body
+    INCREMENTAL = "incremental"
+    DEFAULT = FANOUT
+    ALL = (FANOUT, SINGLE, FROM_BODY, HIERARCHICAL, INCREMENTAL)
+
+# The introduction and conclusion are written from the finished body in these modes
+BODY_FIRST = (SynthesisMode.FROM_BODY, SynthesisMode.HIERARCHICAL, SynthesisMode.INCREMENTAL)
+
+
+class ReduceConfig:
+    # Estimated tokens of memos one prompt may hold in hierarchical mode (configurable "synthesis_token_budget")
+    TOKEN_BUDGET = int(os.environ.get("SYNTHESIS_TOKEN_BUDGET", "12000"))
+    MAX_FAN_IN = 8  # memos merged by one call
+    MIN_MEMO_WORDS = 300  # shortest merged memo asked for
+    MAX_LEVELS = 5
+
+
+def get_synthesis_mode(config: dict):
+    """ Synthesis mode from config["configurable"]["synthesis_mode"] """
+    mode = (config or {}).get("configurable", {}).get("synthesis_mode") or SynthesisMode.DEFAULT
+    if mode not in SynthesisMode.ALL:
+        raise ValueError(f"Unknown synthesis_mode '{mode}', expected one of {SynthesisMode.ALL}")
+    return mode
+
+
+def route_synthesis(state: ResearchState, config: dict):
+    """ Pick the synthesis nodes to run once all interviews have joined """
+    mode = get_synthesis_mode(config)
+    logger.info(f"Synthesizing report in {mode} mode from {len(state['sections'])} sections")
+    if mode == SynthesisMode.SINGLE:
+        return ["synthesize_report"]
+    if mode in (SynthesisMode.FROM_BODY, SynthesisMode.INCREMENTAL):
+        return ["write_report"]
+    if mode == SynthesisMode.HIERARCHICAL:
+        return ["reduce_sections"]
+    return ["write_report", "write_introduction", "write_conclusion"]
 
-    # Concat all sections together
-    formatted_str_sections = "\n\n".join([f"{section}" for section in sections])
-    
+
+def route_after_report(state: ResearchState, config: dict):
+    """ In from_body, hierarchical and incremental mode the introduction and conclusion follow the finished body """
+    if get_synthesis_mode(config) in BODY_FIRST:
+        return ["write_introduction", "write_conclusion"]
+    return []
+
+
+def _formatted_sections(state: ResearchState):
+    # Concat all sections together, or the merged memos that replace them in hierarchical mode
+    return "\n\n".join([f"{section}" for section in state.get("reduced_sections") or state["sections"]])
+
+
+def _report_messages(state: ResearchState):
     # Summarize the sections into a final report
-    report_writer_instructions = load_prompt("report_writer_instructions")
-    system_message = report_writer_instructions.format(topic=topic, context=formatted_str_sections)    
-    report = get_default_llm(google_api_key).invoke([SystemMessage(content=system_message)]+[HumanMessage(content=f"Write a report based upon these memos.")]) 
+    system_message = format_prompt("report_writer_instructions", topic=state["topic"], context=_formatted_sections(state))
+    return [SystemMessage(content=system_message)]+[HumanMessage(content=f"Write a report based upon these memos.")]
+
+
+def _intro_conclusion_messages(state: ResearchState, config: dict, request: str):
+    # In from_body mode reflect on the finished body, which is much shorter than the raw sections
+    if get_synthesis_mode(config) in BODY_FIRST:
+        material = state["content"]
+    else:
+        material = _formatted_sections(state)
+    instructions = format_prompt("intro_conclusion_instructions", topic=state["topic"], formatted_str_sections=material)
+    return [instructions]+[HumanMessage(content=request)]
+
+
+def _synthesis_messages(state: ResearchState):
+    system_message = format_prompt("report_synthesis_instructions", topic=state["topic"], context=_formatted_sections(state))
+    return [SystemMessage(content=system_message)]+[HumanMessage(content="Write the introduction, report body and conclusion based upon these memos.")]
+
+
+def _token_budget(config: dict):
+    return int((config or {}).get("configurable", {}).get("synthesis_token_budget") or ReduceConfig.TOKEN_BUDGET)
+
+
+def _words(text):
+    return {word for word in re.findall(r"[a-z]{4,}", text.lower())}
+
+
+def _similarity(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def group_sections(sections, token_budget, max_fan_in=ReduceConfig.MAX_FAN_IN):
+    """ Batches of related sections, one merge call each.
+
+    Sections are chained by word overlap so similar ones sit next to each other, then packed in that order
+    into batches of at most max_fan_in sections and token_budget estimated tokens.
+    """
+    words = [_words(section) for section in sections]
+    order, left = [0], set(range(1, len(sections)))
+    while left:
+        closest = max(sorted(left), key=lambda i: _similarity(words[order[-1]], words[i]))
+        order.append(closest)
+        left.remove(closest)
+    batches, batch, used = [], [], 0
+    for i in order:
+        cost = estimate_tokens(sections[i])
+        if batch and (used + cost > token_budget or len(batch) >= max_fan_in):
+            batches.append(batch)
+            batch, used = [], 0
+        batch.append(sections[i])
+        used += cost
+    return batches + [batch] if batch else batches
+
+
+def _memo_words(token_budget, batches):
+    # Merged memos together should fit the next prompt (~0.75 words per token)
+    return max(ReduceConfig.MIN_MEMO_WORDS, int(token_budget * 0.75 / batches))
+
+
+def _merge_messages(state: ResearchState, batch, words):
+    system_message = format_prompt("section_merge_instructions", topic=state["topic"], words=words, context="\n\n".join(batch))
+    return [SystemMessage(content=system_message)]+[HumanMessage(content="Merge these memos into one memo.")]
+
+
+def _over_budget(memos, token_budget, level):
+    return len(memos) > 1 and level < ReduceConfig.MAX_LEVELS and sum(estimate_tokens(memo) for memo in memos) > token_budget
+
+
+def _unmerged(batch, words):
+    # A lone memo already within the target length is kept as it is
+    return batch[0] if len(batch) == 1 and estimate_tokens(batch[0]) * 0.75 <= words else None
+
+
+def reduce_sections(state: ResearchState, config: dict):
+    """ Merge related sections in parallel batches, level by level, until they fit the report prompt """
+    google_api_key = config["configurable"]["google_api_key"]
+    token_budget = _token_budget(config)
+    memos, level = list(state["sections"]), 0
+    while _over_budget(memos, token_budget, level):
+        level += 1
+        batches = group_sections(memos, token_budget)
+        words = _memo_words(token_budget, len(batches))
+        logger.info(f"Reduce level {level}: {len(memos)} memos in {len(batches)} batches of ~{words} words")
+
+        def merge(batch):
+            kept = _unmerged(batch, words)
+            if kept is not None:
+                return kept
+            return invoke_llm(get_versatile_llm(google_api_key), _merge_messages(state, batch, words), node="reduce_sections").content
+
+        with ThreadPoolExecutor(max_workers=len(batches)) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, merge, batch) for batch in batches]
+            memos = [future.result() for future in futures]
+    return {"reduced_sections": memos}
+
+
+async def areduce_sections(state: ResearchState, config: dict):
+    """ Merge related sections in parallel batches, level by level (async) """
+    google_api_key = config["configurable"]["google_api_key"]
+    token_budget = _token_budget(config)
+    memos, level = list(state["sections"]), 0
+    while _over_budget(memos, token_budget, level):
+        level += 1
+        batches = group_sections(memos, token_budget)
+        words = _memo_words(token_budget, len(batches))
+        logger.info(f"Reduce level {level}: {len(memos)} memos in {len(batches)} batches of ~{words} words")
+
+        async def merge(batch):
+            kept = _unmerged(batch, words)
+            if kept is not None:
+                return kept
+            return (await ainvoke_llm(get_versatile_llm(google_api_key), _merge_messages(state, batch, words), node="reduce_sections")).content
+
+        memos = list(await asyncio.gather(*(merge(batch) for batch in batches)))
+    return {"reduced_sections": memos}
+
+
+def _reconcile_draft(state: ResearchState, config: dict):
+    """ Body and sources of the running draft, once the sections it has not folded in yet are """
+    draft = pop_draft(draft_key(state, config), state["topic"])
+    return {"content": draft.reconcile(state["sections"], config["configurable"]["google_api_key"])}
+
+
+def write_report(state: ResearchState, config: dict):
+    if get_synthesis_mode(config) == SynthesisMode.INCREMENTAL:
+        return _reconcile_draft(state, config)
+    google_api_key = config["configurable"]["google_api_key"]
+    report = invoke_llm(get_default_llm(google_api_key), _report_messages(state), node="write_report")
+    return {"content": report.content}
+
+
+async def awrite_report(state: ResearchState, config: dict):
+    if get_synthesis_mode(config) == SynthesisMode.INCREMENTAL:
+        # Folds run on the draft's threads; waiting for them must not block the event loop
+        return await asyncio.to_thread(_reconcile_draft, state, config)
+    google_api_key = config["configurable"]["google_api_key"]
+    report = await ainvoke_llm(get_default_llm(google_api_key), _report_messages(state), node="write_report")
     return {"content": report.content}
 
 
 def write_introduction(state: ResearchState, config: dict):
-    time.sleep(15)  # to prevent rate limit
-    
-    sections = state["sections"]
-    topic = state["topic"]
     google_api_key = config["configurable"]["google_api_key"]
+    intro = invoke_llm(get_creative_llm(google_api_key), _intro_conclusion_messages(state, config, "Write the report introduction"), node="write_introduction")
+    return {"introduction": intro.content}
 
-    # Concat all sections together
-    formatted_str_sections = "\n\n".join([f"{section}" for section in sections])
-    
-    # Summarize the sections into a final report
-    intro_conclusion_instructions = load_prompt("intro_conclusion_instructions")
-    instructions = intro_conclusion_instructions.format(topic=topic, formatted_str_sections=formatted_str_sections)    
-    intro = get_creative_llm(google_api_key).invoke([instructions]+[HumanMessage(content=f"Write the report introduction")]) 
+
+async def awrite_introduction(state: ResearchState, config: dict):
+    google_api_key = config["configurable"]["google_api_key"]
+    intro = await ainvoke_llm(get_creative_llm(google_api_key), _intro_conclusion_messages(state, config, "Write the report introduction"), node="write_introduction")
     return {"introduction": intro.content}
 
 
 def write_conclusion(state: ResearchState, config: dict):
-    time.sleep(15)  # to prevent rate limit
-    
-    sections = state["sections"]
-    topic = state["topic"]
     google_api_key = config["configurable"]["google_api_key"]
+    conclusion = invoke_llm(get_versatile_llm(google_api_key), _intro_conclusion_messages(state, config, "Write the report conclusion"), node="write_conclusion")
+    return {"conclusion": conclusion.content}
 
-    # Concat all sections together
-    formatted_str_sections = "\n\n".join([f"{section}" for section in sections])
-    
-    # Summarize the sections into a final report
-    intro_conclusion_instructions = load_prompt("intro_conclusion_instructions")
-    instructions = intro_conclusion_instructions.format(topic=topic, formatted_str_sections=formatted_str_sections)    
-    conclusion = get_versatile_llm(google_api_key).invoke([instructions]+[HumanMessage(content=f"Write the report conclusion")]) 
+
+async def awrite_conclusion(state: ResearchState, config: dict):
+    google_api_key = config["configurable"]["google_api_key"]
+    conclusion = await ainvoke_llm(get_versatile_llm(google_api_key), _intro_conclusion_messages(state, config, "Write the report conclusion"), node="write_conclusion")
     return {"conclusion": conclusion.content}
 
 
-def finalize_report(state: ResearchState):
+def synthesize_report(state: ResearchState, config: dict):
+    """ Write introduction, body and conclusion in a single structured call """
+    google_api_key = config["configurable"]["google_api_key"]
+    report = invoke_llm(get_default_llm(google_api_key), _synthesis_messages(state), schema=FinalReport, node="synthesize_report")
+    return {"introduction": report.introduction, "content": report.content, "conclusion": report.conclusion}
+
+
+async def asynthesize_report(state: ResearchState, config: dict):
+    google_api_key = config["configurable"]["google_api_key"]
+    report = await ainvoke_llm(get_default_llm(google_api_key), _synthesis_messages(state), schema=FinalReport, node="synthesize_report")
+    return {"introduction": report.introduction, "content": report.content, "conclusion": report.conclusion}
+
+
+def finalize_report(state: ResearchState, config: dict):
     """ The is the "reduce" step where we gather all the sections, combine them, and reflect on them to write the intro/conclusion """
     # Save full final report
     content = state["content"]
@@ -71,6 +266,14 @@ def finalize_report(state: ResearchState):
         sources = None
 
     final_report = state["introduction"] + "\n\n---\n\n" + content + "\n\n---\n\n" + state["conclusion"]
+    if state.get("dropped_analysts"):
+        # Interviews cut off by the run deadline; the report covers the sections that finished
+        logger.warning(f"{len(state['dropped_analysts'])} interviews missed the deadline: {', '.join(state['dropped_analysts'])}")
+        final_report += (f"\n\n*Not covered: the interviews with {', '.join(state['dropped_analysts'])} "
+                         f"did not finish within the time budget.*")
     if sources is not None:
         final_report += "\n\n## Sources\n" + sources
-    return {"final_report": final_report}
\ No newline at end of file
+    thread_id = config["configurable"].get("thread_id")
+    summary = run_summary(thread_id)
+    run_metrics.retire(thread_id)
+    return {"final_report": final_report, "run_metrics": summary}
\ No newline at end of file
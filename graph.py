@@ -1,34 +1,57 @@
 from langgraph.graph import START, END, StateGraph
 from state import ResearchState
-from create_analysts import create_analysts, human_feedback, select_analysts, should_continue
-from conduct_interviews import interview_builder, initiate_all_interviews
-from generate_report import write_report, write_introduction, write_conclusion, finalize_report
-from langgraph.checkpoint.memory import MemorySaver
+from create_analysts import create_analysts, human_feedback, select_analysts, should_continue, acreate_analysts, aselect_analysts
+from conduct_interviews import interview_builder, async_interview_builder, initiate_all_interviews, interview_node, start_interviews
+from generate_report import (write_report, write_introduction, write_conclusion, finalize_report, synthesize_report,
+                             awrite_report, awrite_introduction, awrite_conclusion, asynthesize_report,
+                             route_synthesis, route_after_report, reduce_sections, areduce_sections)
+from checkpointer import create_checkpointer
+from metrics import instrument
+from deadline import within_run_deadline
+from interview_scheduler import SchedulerConfig
 
-builder = StateGraph(ResearchState)
-builder.add_node("create_analysts", create_analysts)
-builder.add_node("human_feedback", human_feedback)
-builder.add_node("select_analysts", select_analysts)
-builder.add_node("human_conduct_interview", human_feedback)
-builder.add_node("conduct_interview", interview_builder.compile())
-builder.add_node("write_report",write_report)
-builder.add_node("write_introduction",write_introduction)
-builder.add_node("write_conclusion",write_conclusion)
-builder.add_node("finalize_report",finalize_report)
+def build_research_graph(use_async=False):
+    """ Parent research graph; use_async swaps in the ainvoke-based nodes and interview sub-graph """
+    builder = StateGraph(ResearchState)
+    builder.add_node("create_analysts", instrument("create_analysts", acreate_analysts if use_async else create_analysts))
+    builder.add_node("human_feedback", instrument("human_feedback", human_feedback))
+    builder.add_node("select_analysts", instrument("select_analysts", aselect_analysts if use_async else select_analysts))
+    builder.add_node("human_conduct_interview", instrument("human_conduct_interview", start_interviews))
+    interviews = (async_interview_builder if use_async else interview_builder).compile()
+    builder.add_node("conduct_interview", interview_node(interviews, use_async))
 
-# Logic
-builder.add_edge(START, "create_analysts")
-builder.add_edge("create_analysts", "human_feedback")
-builder.add_conditional_edges("human_feedback", should_continue, ["create_analysts", "select_analysts"])
-builder.add_edge("select_analysts", "human_conduct_interview")
-builder.add_conditional_edges("human_conduct_interview", initiate_all_interviews, ["create_analysts", "conduct_interview"])
-builder.add_edge("conduct_interview", "write_report")
-builder.add_edge("conduct_interview", "write_introduction")
-builder.add_edge("conduct_interview", "write_conclusion")
-builder.add_edge(["write_conclusion", "write_report", "write_introduction"], "finalize_report")
-builder.add_edge("finalize_report", END)
+    # Synthesis runs under the rest of the run budget (deadline.py)
+    builder.add_node("write_report", instrument("write_report", within_run_deadline(awrite_report if use_async else write_report)))
+    builder.add_node("write_introduction", instrument("write_introduction", within_run_deadline(awrite_introduction if use_async else write_introduction)))
+    builder.add_node("write_conclusion", instrument("write_conclusion", within_run_deadline(awrite_conclusion if use_async else write_conclusion)))
+    builder.add_node("synthesize_report", instrument("synthesize_report", within_run_deadline(asynthesize_report if use_async else synthesize_report)))
+    builder.add_node("reduce_sections", instrument("reduce_sections", within_run_deadline(areduce_sections if use_async else reduce_sections)))
+    builder.add_node("finalize_report", instrument("finalize_report", finalize_report))
+
+    # Logic
+    builder.add_edge(START, "create_analysts")
+    builder.add_edge("create_analysts", "human_feedback")
+    builder.add_conditional_edges("human_feedback", should_continue, ["create_analysts", "select_analysts"])
+    builder.add_edge("select_analysts", "human_conduct_interview")
+    builder.add_conditional_edges("human_conduct_interview", initiate_all_interviews, ["create_analysts", "conduct_interview"])
+    # Synthesis: config["configurable"]["synthesis_mode"] picks fanout, single, from_body, hierarchical or incremental
+    builder.add_conditional_edges("conduct_interview", route_synthesis, ["write_report", "write_introduction", "write_conclusion", "synthesize_report", "reduce_sections"])
+    builder.add_edge("reduce_sections", "write_report")
+    builder.add_conditional_edges("write_report", route_after_report, ["write_introduction", "write_conclusion"])
+    builder.add_edge(["write_conclusion", "write_report", "write_introduction"], "finalize_report")
+    builder.add_edge("synthesize_report", "finalize_report")
+    builder.add_edge("finalize_report", END)
+    return builder
+
+builder = build_research_graph()
+async_builder = build_research_graph(use_async=True)
 
 # Compile
-memory = MemorySaver()
-graph_memory = builder.compile(interrupt_before=['human_feedback', 'human_conduct_interview'], checkpointer=memory)
-graph = builder.compile(interrupt_before=['human_feedback', 'human_conduct_interview'])
\ No newline at end of file
+# Persistent SQLite checkpointer by default; CHECKPOINTER=memory keeps threads in process memory
+memory = create_checkpointer()
+# Enough worker threads for every interview the scheduler admits (LangGraph defaults to the CPU count + 4)
+concurrency = {"max_concurrency": SchedulerConfig.GRAPH_CONCURRENCY}
+graph_memory = builder.compile(interrupt_before=['human_feedback', 'human_conduct_interview'], checkpointer=memory).with_config(concurrency)
+graph = builder.compile(interrupt_before=['human_feedback', 'human_conduct_interview']).with_config(concurrency)
+# Shares the checkpointer so a thread started on one graph can be resumed on the other
+async_graph_memory = async_builder.compile(interrupt_before=['human_feedback', 'human_conduct_interview'], checkpointer=memory).with_config(concurrency)
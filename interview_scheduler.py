@@ -0,0 +1,166 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from deadline import RunDeadlineExceeded, remaining
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerConfig:
+    # Interviews running at once in this process, across all research threads
+    MAX_IN_FLIGHT = int(os.environ.get("MAX_INFLIGHT_INTERVIEWS", "4"))
+    POLL_SECONDS = 0.05  # async waiters re-check this often
+    # Tasks LangGraph runs at once per step (its max_concurrency). Waiting interviews hold a worker thread, so
+    # this must stay above MAX_IN_FLIGHT; LangGraph's default is the CPU count + 4.
+    GRAPH_CONCURRENCY = int(os.environ.get("GRAPH_CONCURRENCY", "64"))
+
+
+class InterviewScheduler:
+    """ Admits interviews up to max_in_flight at a time, earliest run first, then lowest priority number.
+
+    Each Send branch of the interview map step waits here before its sub-graph starts, so dozens of analysts
+    queue instead of all hitting the rate limiters at once. Runs are served in the order they first queued, so a
+    newer run's first analysts cannot starve the rest of an older one; within a run, priority is the analyst's
+    position in the list select_analysts returned, then arrival order.
+    """
+    def __init__(self, max_in_flight=SchedulerConfig.MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self._in_flight = 0
+        self._waiting = []  # heap of (run arrival, priority, arrival, run)
+        self._arrivals = itertools.count()
+        self._runs = {}  # run -> [run arrival, interviews waiting or in flight]
+        self._run_arrivals = itertools.count()
+        self._condition = threading.Condition()
+        self.stats = {"admitted": 0, "queued": 0, "wait_seconds": 0.0, "max_in_flight": 0}
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    @property
+    def waiting(self):
+        return len(self._waiting)
+
+    def _enqueue(self, priority, run):
+        if run not in self._runs:
+            self._runs[run] = [next(self._run_arrivals), 0]
+        self._runs[run][1] += 1
+        entry = (self._runs[run][0], priority, next(self._arrivals), run)
+        heapq.heappush(self._waiting, entry)
+        return entry
+
+    def _try_admit(self, entry):
+        """ Admit the entry if it is first in line and a slot is free; caller holds the condition """
+        if self._waiting[0] != entry or (self.max_in_flight and self._in_flight >= self.max_in_flight):
+            return False
+        heapq.heappop(self._waiting)
+        self._in_flight += 1
+        return True
+
+    def _admitted(self, waited, queued):
+        self.stats["admitted"] += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self._in_flight)
+        if queued:
+            self.stats["queued"] += 1
+            self.stats["wait_seconds"] += waited
+        # The next in line may also fit
+        self._condition.notify_all()
+
+    def _forget(self, run):
+        """ Drop a run's place in line once none of its interviews is waiting or running """
+        self._runs[run][1] -= 1
+        if not self._runs[run][1]:
+            del self._runs[run]
+
+    def _abandon(self, entry):
+        self._waiting.remove(entry)
+        heapq.heapify(self._waiting)
+        self._forget(entry[3])
+        self._condition.notify_all()
+
+    def _release(self, run):
+        with self._condition:
+            self._in_flight -= 1
+            self._forget(run)
+            self._condition.notify_all()
+
+    @staticmethod
+    def _check_deadline(deadline):
+        left = remaining(deadline)
+        if left is not None and left <= 0:
+            raise RunDeadlineExceeded("Deadline passed while waiting for an interview slot")
+        return left
+
+    @contextmanager
+    def slot(self, priority=0, deadline=None, run=None):
+        """ Block until this interview of `run` may run, and hold its slot for the duration.
+        Raises RunDeadlineExceeded if `deadline` (epoch seconds) passes first. """
+        started = time.monotonic()
+        with self._condition:
+            entry = self._enqueue(priority, run)
+            queued = False
+            try:
+                while not self._try_admit(entry):
+                    queued = True
+                    self._condition.wait(self._check_deadline(deadline))
+            except BaseException:
+                self._abandon(entry)
+                raise
+            self._admitted(time.monotonic() - started, queued)
+        try:
+            yield
+        finally:
+            self._release(run)
+
+    @asynccontextmanager
+    async def aslot(self, priority=0, deadline=None, run=None):
+        """ Async counterpart of slot() that yields to the event loop while waiting """
+        started = time.monotonic()
+        with self._condition:
+            entry = self._enqueue(priority, run)
+        queued = False
+        try:
+            while True:
+                with self._condition:
+                    if self._try_admit(entry):
+                        self._admitted(time.monotonic() - started, queued)
+                        break
+                queued = True
+                self._check_deadline(deadline)
+                await asyncio.sleep(SchedulerConfig.POLL_SECONDS)
+        except BaseException:
+            with self._condition:
+                self._abandon(entry)
+            raise
+        try:
+            yield
+        finally:
+            self._release(run)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def configure_interview_scheduler(max_in_flight=None):
+    """ Replace the process-wide scheduler; max_in_flight 0 admits every interview at once """
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = InterviewScheduler(SchedulerConfig.MAX_IN_FLIGHT if max_in_flight is None else max_in_flight)
+    if not _scheduler.max_in_flight or _scheduler.max_in_flight > SchedulerConfig.GRAPH_CONCURRENCY:
+        logger.warning(f"At most GRAPH_CONCURRENCY={SchedulerConfig.GRAPH_CONCURRENCY} interviews can run at once")
+    logger.info(f"Interview scheduler: {_scheduler.max_in_flight or 'unlimited'} in flight")
+    return _scheduler
+
+
+def get_interview_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = InterviewScheduler()
+        return _scheduler
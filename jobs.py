@@ -0,0 +1,445 @@
+"""
+Background research jobs: a SQLite-backed job store, a pool of worker processes and a small HTTP API.
+
+    python -m jobs --workers 4 --port 8700
+
+Submit (topic, analysts, config) and get a job id; workers run the graph_memory flow with analyst selection
+auto-approved and record progress events that clients poll or watch. Research threads are checkpointed in the
+shared SQLite checkpointer, so a job can also continue an existing thread by id.
+"""
+import os
+import json
+import time
+import uuid
+import atexit
+import sqlite3
+import logging
+import argparse
+import threading
+import multiprocessing
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class JobConfig:
+    # Resolved from this file, like the checkpoints, so the app and every worker share one queue
+    PATH = os.environ.get("JOBS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "jobs.sqlite"))
+    WORKERS = int(os.environ.get("JOB_WORKERS", "2"))  # worker processes
+    # Total concurrent calls per provider across all workers, e.g. "google=8,tavily=8,wikipedia=4";
+    # unset providers keep their rate_limiter budget. Request and token budgets are split evenly between workers.
+    PROVIDER_CONCURRENCY = {provider: int(limit) for provider, _, limit in
+                            (item.partition("=") for item in os.environ.get("JOB_PROVIDER_CONCURRENCY", "").split(",") if item)}
+    PORT = int(os.environ.get("JOBS_PORT", "8700"))
+    # The API has no authentication and takes API keys, so it only listens locally unless JOBS_HOST says otherwise
+    HOST = os.environ.get("JOBS_HOST", "127.0.0.1")
+    URL = os.environ.get("JOBS_URL", "http://127.0.0.1:8700")
+    POLL_SECONDS = 0.5
+    SECRET_KEYS = ("google_api_key", "tavily_api_key")  # passed to workers in memory, never stored
+
+
+TERMINAL = ("completed", "failed", "interrupted")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    owner INTEGER,
+    worker INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    kind TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobStore:
+    """ Job records and their progress events; each process opens its own connection """
+    def __init__(self, path=JobConfig.PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def _execute(self, query, params=()):
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def create(self, spec):
+        job_id = str(uuid.uuid4())
+        self._execute("INSERT INTO jobs (job_id, status, spec, owner, created_at) VALUES (?, 'queued', ?, ?, ?)",
+                      (job_id, json.dumps(spec), os.getpid(), time.time()))
+        self.add_event(job_id, "queued")
+        return job_id
+
+    def start(self, job_id, worker):
+        self._execute("UPDATE jobs SET status='running', worker=?, started_at=? WHERE job_id=?", (worker, time.time(), job_id))
+        self.add_event(job_id, "started", worker=worker)
+        return self.get(job_id)
+
+    def finish(self, job_id, status, result=None, error=None):
+        self._execute("UPDATE jobs SET status=?, result=?, error=?, finished_at=? WHERE job_id=?",
+                      (status, json.dumps(result) if result is not None else None, error, time.time(), job_id))
+        self.add_event(job_id, status, error=error)
+
+    def add_event(self, job_id, kind, **data):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM events WHERE job_id=?", (job_id,)).fetchone()[0]
+                self._conn.execute("INSERT INTO events VALUES (?, ?, ?, ?, ?)",
+                                   (job_id, seq, time.time(), kind, json.dumps(data, default=str)))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get(self, job_id):
+        rows = self._execute("SELECT job_id, status, spec, result, error, worker, created_at, started_at, finished_at "
+                             "FROM jobs WHERE job_id=?", (job_id,))
+        if not rows:
+            return None
+        job_id, status, spec, result, error, worker, created_at, started_at, finished_at = rows[0]
+        return {"job_id": job_id, "status": status, "spec": json.loads(spec), "result": json.loads(result) if result else None,
+                "error": error, "worker": worker, "created_at": created_at, "started_at": started_at,
+                "finished_at": finished_at}
+
+    def events(self, job_id, after=0):
+        return [{"seq": seq, "time": created_at, "kind": kind, **json.loads(data)} for seq, created_at, kind, data in
+                self._execute("SELECT seq, created_at, kind, data FROM events WHERE job_id=? AND seq>? ORDER BY seq",
+                              (job_id, after))]
+
+    def fail_workers(self, workers):
+        """ Mark the running jobs of worker processes that died as failed """
+        failed = [(job_id, worker) for job_id, worker in self._execute("SELECT job_id, worker FROM jobs WHERE status='running'")
+                  if worker in workers]
+        for job_id, worker in failed:
+            self.finish(job_id, "failed", error=f"Worker process {worker} exited before the job finished")
+        return len(failed)
+
+    def interrupt_orphans(self):
+        """ Mark unfinished jobs whose queue process is gone; their threads can be resumed with a new job """
+        orphans = [job_id for job_id, owner in self._execute("SELECT job_id, owner FROM jobs WHERE status IN ('queued', 'running')")
+                   if owner is None or not _alive(owner)]
+        for job_id in orphans:
+            self.finish(job_id, "interrupted", error="The job queue stopped before the job finished")
+        return len(orphans)
+
+
+def run_research(graph, config, topic=None, analysts=3, on_update=None):
+    """ Drive a research thread to its final report, approving the generated analysts.
+
+    analysts is a number of analysts to generate, or a list of Analysts (or dicts) to interview directly.
+    A thread that already has state continues from its last checkpoint. on_update(namespace, update) receives
+    every node update, including those of the interview sub-graphs. Returns the final state values.
+    """
+    from state import Analyst
+
+    def stream(input_data):
+        for namespace, update in graph.stream(input_data, config, subgraphs=True, stream_mode="updates"):
+            if on_update is not None:
+                on_update(namespace, update)
+
+    if not graph.get_state(config).values:
+        if isinstance(analysts, int):
+            stream({"topic": topic, "max_analysts": analysts})
+        else:
+            final = [analyst if isinstance(analyst, Analyst) else Analyst(**analyst) for analyst in analysts]
+            graph.update_state(config, {"topic": topic, "max_analysts": len(final), "analysts": final,
+                                        "final_analysts": final}, as_node="select_analysts")
+    while True:
+        state = graph.get_state(config)
+        if not state.next:
+            return state.values
+        if "human_feedback" in state.next:
+            graph.update_state(config, {"human_analyst_feedback": ["approved"]})
+        stream(None)
+
+
+def _run_job(store, job_id, secrets):
+    from graph import graph_memory
+    from langgraph_client import LangGraphLocalClient
+
+    job = store.start(job_id, os.getpid())
+    spec = job["spec"]
+    config = {"configurable": {**spec["config"], **secrets, "thread_id": spec["thread_id"]}}
+
+    def on_update(namespace, update):
+        for node, values in update.items():
+            if node.startswith("__"):
+                continue
+            text = LangGraphLocalClient._format_stream_update({node: values}) if values else None
+            store.add_event(job_id, "node", node=node, namespace="|".join(namespace), text=text)
+
+    try:
+        values = run_research(graph_memory, config, spec["topic"], spec["analysts"], on_update)
+    except Exception as e:
+        logger.exception(f"Job {job_id} failed")
+        store.finish(job_id, "failed", error=f"{type(e).__name__}: {e}")
+        return
+    store.finish(job_id, "completed", result={"final_report": values.get("final_report"),
+                                              "run_metrics": values.get("run_metrics")})
+
+
+def _worker_main(tasks, path, shares, provider_concurrency):
+    """ Worker process: run jobs from the task queue one at a time """
+    from rate_limiter import partition_rate_limits
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    partition_rate_limits(shares, provider_concurrency)
+    store = JobStore(path)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        _run_job(store, *task)
+
+
+class JobQueue:
+    """ Enqueues jobs for a pool of worker processes and reports their progress """
+    def __init__(self, workers=JobConfig.WORKERS, path=JobConfig.PATH, provider_concurrency=None, share_with_parent=True):
+        """ share_with_parent: this process also calls the providers (e.g. the Streamlit app), so it takes one
+        share of the rate limits alongside the workers instead of keeping the whole budget """
+        from rate_limiter import partition_rate_limits
+
+        self.store = JobStore(path)
+        interrupted = self.store.interrupt_orphans()
+        if interrupted:
+            logger.warning(f"Marked {interrupted} unfinished jobs from a stopped queue as interrupted")
+        provider_concurrency = provider_concurrency or JobConfig.PROVIDER_CONCURRENCY
+        shares = workers + 1 if share_with_parent else workers
+        if share_with_parent:
+            partition_rate_limits(shares, provider_concurrency)
+        # Spawn, not fork: the parent holds threads and SQLite connections a forked child must not inherit
+        self._context = multiprocessing.get_context("spawn")
+        self._tasks = self._context.Queue()
+        self._worker_args = (self._tasks, path, shares, provider_concurrency)
+        self._workers_lock = threading.Lock()
+        self._workers = [self._spawn_worker() for _ in range(workers)]
+        atexit.register(self.shutdown)
+        logger.info(f"Job queue started with {workers} workers")
+
+    def _spawn_worker(self):
+        worker = self._context.Process(target=_worker_main, daemon=True, args=self._worker_args)
+        worker.start()
+        return worker
+
+    def _check_workers(self):
+        """ Fail the jobs of workers that died (crash, OOM kill) and replace those workers """
+        with self._workers_lock:
+            dead = [worker for worker in self._workers if not worker.is_alive()]
+            if not dead:
+                return
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            self._workers += [self._spawn_worker() for _ in dead]
+        failed = self.store.fail_workers({worker.pid for worker in dead})
+        logger.warning(f"Replaced {len(dead)} dead workers (exit codes {[worker.exitcode for worker in dead]}), "
+                       f"failed {failed} of their jobs")
+
+    def submit(self, topic=None, analysts=3, config=None, thread_id=None):
+        """ Queue a research job and return its id; pass thread_id to continue an existing thread instead """
+        from checkpointer import CheckpointConfig
+
+        if thread_id and CheckpointConfig.BACKEND != "sqlite":
+            raise ValueError("Continuing a thread in a worker process needs the sqlite checkpointer")
+        if not thread_id and not topic:
+            raise ValueError("A job needs a topic or the thread_id of an existing thread")
+        config = dict(config or {})
+        secrets = {key: config.pop(key) for key in JobConfig.SECRET_KEYS if key in config}
+        analysts = [getattr(analyst, "to_dict", analyst) for analyst in analysts] if isinstance(analysts, list) else analysts
+        spec = {"topic": topic, "analysts": analysts, "config": config, "thread_id": thread_id or str(uuid.uuid4())}
+        job_id = self.store.create(spec)
+        self._tasks.put((job_id, secrets))
+        logger.info(f"Queued job {job_id} for thread {spec['thread_id']}")
+        return job_id
+
+    def get(self, job_id):
+        self._check_workers()
+        return self.store.get(job_id)
+
+    def events(self, job_id, after=0):
+        self._check_workers()
+        return self.store.events(job_id, after)
+
+    def watch(self, job_id, after=0, poll=JobConfig.POLL_SECONDS):
+        """ Yield the job's events as they are recorded, until it finishes """
+        while True:
+            events = self.events(job_id, after)
+            for event in events:
+                after = event["seq"]
+                yield event
+                if event["kind"] in TERMINAL:
+                    return
+            if not events:
+                time.sleep(poll)
+
+    def wait(self, job_id, timeout=None, poll=JobConfig.POLL_SECONDS):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] in TERMINAL or (deadline is not None and time.monotonic() >= deadline):
+                return job
+            time.sleep(poll)
+
+    def shutdown(self, timeout=5):
+        with self._workers_lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._tasks.put(None)
+        for worker in workers:
+            worker.join(timeout)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """ The process-wide job queue, started on first use """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
+
+
+class _JobHandler(BaseHTTPRequestHandler):
+    def _send_json(self, status, body):
+        payload = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            self.send_error(404)
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            job_id = get_job_queue().submit(body.get("topic"), body.get("analysts", 3), body.get("config"), body.get("thread_id"))
+        except (ValueError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        self._send_json(200, {"job_id": job_id})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) < 2 or parts[0] != "jobs":
+            self.send_error(404)
+            return
+        queue = get_job_queue()
+        job = queue.get(parts[1])
+        if job is None:
+            self._send_json(404, {"error": f"Unknown job {parts[1]}"})
+        elif len(parts) == 2:
+            self._send_json(200, job)
+        elif parts[2] == "events":
+            query = parse_qs(url.query)
+            after = int(query.get("after", ["0"])[0])
+            # Long poll: hold the request up to `wait` seconds for new events
+            deadline = time.monotonic() + min(float(query.get("wait", ["0"])[0]), 30.0)
+            events = queue.events(parts[1], after)
+            while not events and time.monotonic() < deadline and queue.get(parts[1])["status"] not in TERMINAL:
+                time.sleep(JobConfig.POLL_SECONDS)
+                events = queue.events(parts[1], after)
+            self._send_json(200, events)
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_job_server(port=None, host=None):
+    """ Serve the job API from a daemon thread: POST /jobs, GET /jobs/{id}, GET /jobs/{id}/events?after=&wait= """
+    host = host or JobConfig.HOST
+    if host not in ("127.0.0.1", "localhost", "::1"):
+        logger.warning(f"The job API on {host} has no authentication: anyone who can reach it can submit jobs and read reports")
+    server = ThreadingHTTPServer((host, port or JobConfig.PORT), _JobHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving the job API on {host}:{server.server_address[1]}")
+    return server
+
+
+class JobClient:
+    """ HTTP client for a job server started with `python -m jobs` """
+    def __init__(self, base_url=JobConfig.URL):
+        self.base_url = base_url.rstrip("/")
+
+    def submit(self, topic=None, analysts=3, config=None, thread_id=None):
+        response = requests.post(f"{self.base_url}/jobs", json={"topic": topic, "analysts": analysts, "config": config,
+                                                                "thread_id": thread_id})
+        response.raise_for_status()
+        return response.json()["job_id"]
+
+    def get(self, job_id):
+        response = requests.get(f"{self.base_url}/jobs/{job_id}")
+        response.raise_for_status()
+        return response.json()
+
+    def events(self, job_id, after=0, wait=0):
+        response = requests.get(f"{self.base_url}/jobs/{job_id}/events", params={"after": after, "wait": wait},
+                                timeout=wait + 30)
+        response.raise_for_status()
+        return response.json()
+
+    def watch(self, job_id, after=0, wait=20):
+        """ Yield the job's events as they are recorded, until it finishes """
+        while True:
+            for event in self.events(job_id, after, wait):
+                after = event["seq"]
+                yield event
+                if event["kind"] in TERMINAL:
+                    return
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=JobConfig.WORKERS)
+    parser.add_argument("--port", type=int, default=JobConfig.PORT)
+    parser.add_argument("--host", default=JobConfig.HOST, help="interface to listen on; 0.0.0.0 exposes the unauthenticated API")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    global _queue
+    # The server only dispatches; its workers get the whole provider budget
+    _queue = JobQueue(workers=args.workers, share_with_parent=False)
+    server = start_job_server(args.port, args.host)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        _queue.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,78 @@
+import asyncio
 import requests
 import json
 import logging
 import uuid
-from graph import graph_memory
+from contextlib import contextmanager
+from graph import graph_memory, async_graph_memory
+from tracing import run_span, start_span
 
 # Configure logger
 logger = logging.getLogger(__name__)
 
 class LangGraphLocalClient:
-    def __init__(self, google_api_key, tavily_api_key):
+    # Research threads allowed to run at once on one event loop via the async methods
+    MAX_CONCURRENT_RUNS = 8
+    _run_semaphore = None
+
+    def __init__(self, google_api_key, tavily_api_key, thread_id=None):
+        """Pass the thread_id of an existing thread to reattach to it, e.g. after a restart"""
         logger.info(f"Initializing LangGraphLocalClient")
-        self.config = self.create_config(google_api_key, tavily_api_key)
+        self.config = self.create_config(google_api_key, tavily_api_key, thread_id)
         logger.debug(f"Client initialized with thread: {self.config}")
         
-    def create_config(self, google_api_key, tavily_api_key):
+    def create_config(self, google_api_key, tavily_api_key, thread_id=None):
         """Create a new thread with configurable parameters"""
         return {"configurable": 
                     {
-                        "thread_id": str(uuid.uuid4()),
+                        "thread_id": thread_id or str(uuid.uuid4()),
                         "google_api_key": google_api_key,
                         "tavily_api_key": tavily_api_key,
                     }
                 }
+
+    @property
+    def thread_id(self):
+        return self.config["configurable"]["thread_id"]
+
+    @classmethod
+    def _semaphore(cls):
+        if cls._run_semaphore is None:
+            cls._run_semaphore = asyncio.Semaphore(cls.MAX_CONCURRENT_RUNS)
+        return cls._run_semaphore
+
+    @staticmethod
+    def _format_stream_update(data):
+        """Turn a node update from the stream into display text, or None if it is not shown"""
+        if data.get('generate_question', ''):
+            question = data.get('generate_question', '')["messages"][0].content
+            logger.info(f"Question: {question}")
+            return question + "\n\n --- \n\n"
+        if data.get('generate_answer', ''):
+            answer = data.get('generate_answer', '')["messages"][0].content
+            logger.info(f"Answer: {answer}")
+            return answer + "\n\n --- \n\n"
+        if data.get('write_section', ''):
+            section = data.get('write_section', '')["sections"][0]
+            logger.info(f"Section: {section}")
+            return section + "\n\n --- \n\n"
+        return None
     
     def run_graph(self, input_data):
         """Run the graph with input data"""
         logger.info("Starting graph execution")
         logger.debug(f"Thread: {self.config}")
         logger.debug(f"Input data: {json.dumps(input_data, indent=2)}")
-        response = graph_memory.invoke(input_data, self.config)
+        with run_span(self.thread_id, "run_graph"):
+            response = graph_memory.invoke(input_data, self.config)
         return response
+
+    async def arun_graph(self, input_data):
+        """Run the graph with input data on the event loop"""
+        logger.info("Starting async graph execution")
+        async with self._semaphore():
+            with run_span(self.thread_id, "run_graph"):
+                return await async_graph_memory.ainvoke(input_data, self.config)
     
     def run_graph_resume(self, input_data):
         """Resume graph execution with updated input data"""
@@ -37,35 +80,51 @@ class LangGraphLocalClient:
         logger.debug(f"Thread: {self.config}")
         logger.debug(f"Resume data: {json.dumps(input_data, indent=2)}")
         
-        graph_memory.update_state(self.config, input_data)
-        response = graph_memory.invoke(None, self.config)
+        with run_span(self.thread_id, "run_graph_resume"):
+            graph_memory.update_state(self.config, input_data)
+            response = graph_memory.invoke(None, self.config)
         return response
 
+    async def arun_graph_resume(self, input_data):
+        """Resume graph execution with updated input data on the event loop"""
+        logger.info("Resuming async graph execution with updated input")
+        async with self._semaphore():
+            with run_span(self.thread_id, "run_graph_resume"):
+                await async_graph_memory.aupdate_state(self.config, input_data)
+                return await async_graph_memory.ainvoke(None, self.config)
+
     def run_graph_stream(self, input_data):
         """Run graph and stream the results"""
         logger.info("Starting graph stream execution")
         logger.debug(f"Thread: {self.config}")
         logger.debug(f"Input data: {json.dumps(input_data, indent=2)}")
         
-        for event in graph_memory.stream(None, self.config, subgraphs=True, stream_mode="updates"):
-            _, data = event  # event[1] → data
-            if data.get('generate_question', ''):
-                question = data.get('generate_question', '')["messages"][0].content
-                logger.info(f"Question: {question}")
-                yield question + "\n\n --- \n\n"
-            if data.get('generate_answer', ''):
-                answer = data.get('generate_answer', '')["messages"][0].content
-                logger.info(f"Answer: {answer}")
-                yield answer + "\n\n --- \n\n"
-            if data.get('write_section', ''):
-                section = data.get('write_section', '')["sections"][0]
-                logger.info(f"Section: {section}")
-                yield section + "\n\n --- \n\n"
+        with run_span(self.thread_id, "run_graph_stream"):
+            for event in graph_memory.stream(None, self.config, subgraphs=True, stream_mode="updates"):
+                _, data = event  # event[1] → data
+                text = self._format_stream_update(data)
+                if text is not None:
+                    yield text
+
+    async def arun_graph_stream(self, input_data):
+        """Run graph on the event loop and stream the results"""
+        logger.info("Starting async graph stream execution")
+        async with self._semaphore():
+            with run_span(self.thread_id, "run_graph_stream"):
+                async for _, data in async_graph_memory.astream(None, self.config, subgraphs=True, stream_mode="updates"):
+                    text = self._format_stream_update(data)
+                    if text is not None:
+                        yield text
 
     def get_state(self):
         """Get the current state of the thread"""
         state_data = graph_memory.get_state(self.config)[0]
         return state_data
+
+    async def aget_state(self):
+        """Get the current state of the thread"""
+        state_data = (await async_graph_memory.aget_state(self.config))[0]
+        return state_data
         
 
 class LangGraphClient:
@@ -75,6 +134,12 @@ class LangGraphClient:
         self.thread_id = self.create_thread()
         self.assistant_id = None
         logger.debug(f"Client initialized with thread_id: {self.thread_id}")
+
+    @contextmanager
+    def _traced_request(self, name):
+        """Client span for one request; yields headers carrying its traceparent so the server joins the thread's trace"""
+        with start_span(name, {"thread_id": self.thread_id}, thread_id=self.thread_id, kind="client") as span:
+            yield {"Content-Type": "application/json", "traceparent": span.traceparent}
     
     def create_thread(self):
         """Create a new thread"""
@@ -138,15 +203,16 @@ class LangGraphClient:
         logger.debug(f"Input data: {json.dumps(input_data, indent=2)}")
         
         try:
-            response = requests.post(
-                f"{self.base_url}/threads/{self.thread_id}/runs/wait",
-                headers={"Content-Type": "application/json"},
-                json={
-                    "assistant_id": f"{self.assistant_id}",
-                    "input": input_data,
-                },
-            )
-            response.raise_for_status()
+            with self._traced_request("run_graph") as headers:
+                response = requests.post(
+                    f"{self.base_url}/threads/{self.thread_id}/runs/wait",
+                    headers=headers,
+                    json={
+                        "assistant_id": f"{self.assistant_id}",
+                        "input": input_data,
+                    },
+                )
+                response.raise_for_status()
             
             logger.info("Graph execution completed successfully")
             return response.json()
@@ -165,18 +231,19 @@ class LangGraphClient:
         logger.debug(f"Resume data: {json.dumps(input_data, indent=2)}")
         
         try:
-            response = requests.post(
-                f"{self.base_url}/threads/{self.thread_id}/runs/wait",
-                headers={"Content-Type": "application/json"},
-                json={
-                    "assistant_id": f"{self.assistant_id}",
-                    "command": {
-                        "update": input_data,
-                        "resume": input_data,
-                    }
-                },
-            )
-            response.raise_for_status()
+            with self._traced_request("run_graph_resume") as headers:
+                response = requests.post(
+                    f"{self.base_url}/threads/{self.thread_id}/runs/wait",
+                    headers=headers,
+                    json={
+                        "assistant_id": f"{self.assistant_id}",
+                        "command": {
+                            "update": input_data,
+                            "resume": input_data,
+                        }
+                    },
+                )
+                response.raise_for_status()
             
             logger.info("Graph resume completed successfully")
             return response.json()
@@ -194,7 +261,6 @@ class LangGraphClient:
         logger.info("Starting graph stream execution")
         logger.debug(f"Stream URL: {url}")
         
-        headers = {"Content-Type": "application/json"}
         payload = {
             "assistant_id": self.assistant_id,
             "input": input_data,
@@ -204,7 +270,8 @@ class LangGraphClient:
         }
 
         try:
-            with requests.post(url, headers=headers, json=payload, stream=True) as response:
+            with self._traced_request("run_graph_stream") as headers, \
+                    requests.post(url, headers=headers, json=payload, stream=True) as response:
                 if response.status_code != 200:
                     error_msg = f"Stream request failed: {response.status_code} - {response.text}"
                     logger.error(error_msg)
@@ -253,8 +320,9 @@ class LangGraphClient:
         logger.debug(f"Fetching state from URL: {url}")
         
         try:
-            response = requests.get(url)
-            response.raise_for_status()
+            with self._traced_request("get_state") as headers:
+                response = requests.get(url, headers=headers)
+                response.raise_for_status()
             state_data = response.json()
             logger.debug("Successfully retrieved thread state")
             return state_data.get("values", {})
@@ -1,25 +1,685 @@
 import os
+import re
+import asyncio
+import random
+import hashlib
+import threading
+import time
+import logging
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, asynccontextmanager
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_community.tools.tavily_search import TavilySearchResults
+from langchain_community.utilities.tavily_search import TavilySearchAPIWrapper
+from langchain_community.document_loaders import WikipediaLoader
+from langchain_core.documents import Document
+from rate_limiter import get_limiter, estimate_tokens, model_id
+from cache import get_retrieval_cache, get_response_cache, serialize_response, deserialize_response
+from cassette import get_cassette, request_key, ReplayedError
+from metrics import record_throttle, record_llm_call, record_search
+from tracing import traced, set_span_attributes, add_span_event
+from deadline import RunDeadlineExceeded, check_deadline, call_timeout, remaining
+from fake_backends import FakeChatModel, FakeTavilySearch, FakeTavilyAPIWrapper, FakeWikipediaLoader
+
+logger = logging.getLogger(__name__)
 
 class LLMConfig:
     DEFAULT = "gemini-2.0-flash"
     VERSATILE = "gemini-2.0-flash-lite"
     CREATIVE = "gemini-2.0-flash-lite"
+    CLIENT_POOL_SIZE = 32  # clients kept warm across node invocations
+    BACKEND = os.environ.get("LLM_BACKEND", "google")  # "google" or "fake" (offline, see fake_backends.py)
+    # Interchangeable models. When the preferred model's rate limiter would hold a call for more than STEAL_AFTER
+    # seconds and the alternate's would hold it for less, the call goes to the alternate (0 disables this)
+    ALTERNATES = {"gemini-2.0-flash": "gemini-2.0-flash-lite", "gemini-2.0-flash-lite": "gemini-2.0-flash"}
+    STEAL_AFTER = float(os.environ.get("LLM_STEAL_AFTER", "1.0"))
+
+class SearchConfig:
+    BACKEND = os.environ.get("SEARCH_BACKEND", "live")  # "live" or "fake"
+
+class RetryConfig:
+    MAX_ATTEMPTS = 5
+    BASE_DELAY = 1.0  # seconds, doubled on every attempt
+    MAX_DELAY = 60.0
+    FAILURE_THRESHOLD = 5  # consecutive failures before the circuit opens
+    RECOVERY_TIMEOUT = 30.0  # seconds the circuit stays open before a trial call
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "GoogleRateLimitError", "GoogleAPIError",
+    "ServerError", "ConnectionError", "ConnectTimeout", "ReadTimeout", "Timeout", "TimeoutError",
+}
+
+
+class ClientPool:
+    """ Thread-safe, size-bounded LRU of reusable clients so their HTTP transports stay warm """
+    def __init__(self, max_size=LLMConfig.CLIENT_POOL_SIZE):
+        self.max_size = max_size
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key, factory):
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                self.stats["hits"] += 1
+                return client
+            self.stats["misses"] += 1
+        # Build outside the lock; if two threads race, the first client stored wins
+        client = factory()
+        with self._lock:
+            client = self._clients.setdefault(key, client)
+            self._clients.move_to_end(key)
+            while len(self._clients) > self.max_size:
+                evicted_key, _ = self._clients.popitem(last=False)
+                self.stats["evictions"] += 1
+                logger.debug(f"Evicted pooled client {evicted_key[:3]}")
+        return client
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self):
+        return len(self._clients)
+
+
+client_pool = ClientPool()
+
+def _credential_id(api_key):
+    # Pool keys hold a digest rather than the raw credential
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16] if api_key else None
+
+def _replaying():
+    cassette = get_cassette()
+    return cassette is not None and cassette.replaying
 
 def create_llm(model_name="gemini-2.0-flash", temperature=0, google_api_key=None):
-    return ChatGoogleGenerativeAI(model=model_name, temperature=temperature, google_api_key=google_api_key)
+    # A replayed run never reaches the provider, so it needs no real client or credentials
+    backend = "replay" if _replaying() else LLMConfig.BACKEND
+    chat_model = ChatGoogleGenerativeAI if backend == "google" else FakeChatModel
+    key = (backend, model_name, temperature, _credential_id(google_api_key))
+    # Retries are handled by call_with_resilience so they are counted and share the circuit breaker
+    return client_pool.get(key, lambda: chat_model(
+        model=model_name, temperature=temperature, google_api_key=google_api_key, max_retries=0))
+
+def pick_model(model_name):
+    """ The model to call now: model_name, or its alternate when only model_name's quota is exhausted """
+    # The same limiter keys the calls themselves acquire, whichever form of the name the client reports
+    model_name = model_id(model_name)
+    alternate = LLMConfig.ALTERNATES.get(model_name)
+    # Replays must request the recorded models
+    if not alternate or not LLMConfig.STEAL_AFTER or _replaying():
+        return model_name
+    wait = get_limiter("google", model_name).estimated_wait()
+    if wait > LLMConfig.STEAL_AFTER and get_limiter("google", alternate).estimated_wait() < wait:
+        logger.debug(f"{model_name} quota exhausted for {wait:.1f}s, using {alternate}")
+        return alternate
+    return model_name
 
 def get_default_llm(google_api_key):
-    return create_llm(LLMConfig.DEFAULT, temperature=0, google_api_key=google_api_key)
+    return create_llm(pick_model(LLMConfig.DEFAULT), temperature=0, google_api_key=google_api_key)
 
 def get_versatile_llm(google_api_key):
-    return create_llm(LLMConfig.VERSATILE, temperature=0.5, google_api_key=google_api_key)
+    return create_llm(pick_model(LLMConfig.VERSATILE), temperature=0.5, google_api_key=google_api_key)
 
 def get_creative_llm(google_api_key):
-    return create_llm(LLMConfig.CREATIVE, temperature=1.0, google_api_key=google_api_key)
+    return create_llm(pick_model(LLMConfig.CREATIVE), temperature=1.0, google_api_key=google_api_key)
 
 def get_tavily_search(tavily_api_key):
-    os.environ["TAVILY_API_KEY"] = tavily_api_key
-    return TavilySearchResults(max_results=3)
-    
\ No newline at end of file
+    # The key goes to the API wrapper directly; setting os.environ would race between parallel users
+    backend = "replay" if _replaying() else SearchConfig.BACKEND
+    key = ("tavily", backend, None, _credential_id(tavily_api_key))
+    if backend != "live":
+        return client_pool.get(key, lambda: FakeTavilySearch(
+            max_results=3, api_wrapper=FakeTavilyAPIWrapper(tavily_api_key=tavily_api_key)))
+    return client_pool.get(key, lambda: TavilySearchResults(
+        max_results=3, api_wrapper=TavilySearchAPIWrapper(tavily_api_key=tavily_api_key)))
+
+def get_wikipedia_loader(query, load_max_docs=2):
+    loader = FakeWikipediaLoader if SearchConfig.BACKEND == "fake" else WikipediaLoader
+    return loader(query=query, load_max_docs=load_max_docs)
+
+
+class CircuitOpenError(RuntimeError):
+    """ Raised when an endpoint's circuit breaker is open and calls are short-circuited """
+    def __init__(self, endpoint, retry_in):
+        super().__init__(f"Circuit open for {endpoint}, retry in {retry_in:.1f}s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """ Per-endpoint breaker: opens after repeated failures, lets one trial call through after a cooldown """
+    def __init__(self, endpoint, failure_threshold=RetryConfig.FAILURE_THRESHOLD, recovery_timeout=RetryConfig.RECOVERY_TIMEOUT):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """ Raise CircuitOpenError unless the call may go ahead; True if it is the half-open trial call """
+        with self._lock:
+            if self.state == "closed":
+                return False
+            retry_in = self.opened_at + self.recovery_timeout - time.monotonic()
+            if self.state == "open" and retry_in <= 0:
+                logger.info(f"Circuit for {self.endpoint} half-open, allowing a trial call")
+                self.state = "half_open"
+                return True
+            # Open, or half-open with the trial call still in flight
+            raise CircuitOpenError(self.endpoint, max(retry_in, RetryConfig.BASE_DELAY))
+
+    def release_trial(self):
+        """ End a trial call that gave no verdict (deadline, cancellation) so the next call becomes the trial """
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"Circuit for {self.endpoint} closed")
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"Circuit for {self.endpoint} opened after {self.failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+_circuit_breakers = {}
+_resilience_metrics = {}
+_resilience_lock = threading.Lock()
+
+def get_circuit_breaker(endpoint):
+    with _resilience_lock:
+        breaker = _circuit_breakers.get(endpoint)
+        if breaker is None:
+            breaker = _circuit_breakers[endpoint] = CircuitBreaker(endpoint)
+        return breaker
+
+def _iter_error_chain(error):
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+def _status_code(error):
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+def is_retryable(error):
+    """ True for rate limits, transient server errors and connection problems """
+    if isinstance(error, RunDeadlineExceeded):
+        return False
+    if isinstance(error, CircuitOpenError):
+        return True
+    if isinstance(error, ReplayedError):
+        return error.retryable
+    for err in _iter_error_chain(error):
+        status_code = _status_code(err)
+        if status_code is not None:
+            return status_code in RETRYABLE_STATUS_CODES
+        if any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(err).__mro__):
+            return True
+    return False
+
+def retry_after(error):
+    """ Server-suggested delay in seconds (Retry-After header or Gemini retryDelay), if any """
+    if isinstance(error, CircuitOpenError):
+        return error.retry_in
+    for err in _iter_error_chain(error):
+        headers = getattr(getattr(err, "response", None), "headers", None) or {}
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+        match = re.search(r"retry(?:Delay'?\"?:\s*['\"]|\s+in\s+)(\d+(?:\.\d+)?)s", str(err))
+        if match:
+            return float(match.group(1))
+    return None
+
+def _backoff_delay(attempt):
+    # Full jitter keeps parallel interviews from retrying in lockstep
+    return random.uniform(0, min(RetryConfig.MAX_DELAY, RetryConfig.BASE_DELAY * 2 ** attempt))
+
+def _record_call(node, retries, added_latency, failed):
+    with _resilience_lock:
+        stats = _resilience_metrics.setdefault(node or "unknown", {
+            "calls": 0, "retries": 0, "failures": 0, "added_latency_seconds": 0.0,
+        })
+        stats["calls"] += 1
+        stats["retries"] += retries
+        stats["added_latency_seconds"] += added_latency
+        if failed:
+            stats["failures"] += 1
+
+def _attempt_failed(breaker, error):
+    if isinstance(error, (RunDeadlineExceeded, TimeoutError)):
+        return  # abandoned by us or slow, which says nothing about whether the endpoint is down
+    # A non-retryable error (bad request, auth) still means the endpoint answered
+    if is_retryable(error):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+def _retry_delay(error, attempt, endpoint, node):
+    """ Seconds to wait before the next attempt, or None if the error should be raised """
+    if not is_retryable(error) or attempt == RetryConfig.MAX_ATTEMPTS - 1:
+        return None
+    delay = min(RetryConfig.MAX_DELAY, max(retry_after(error) or 0.0, _backoff_delay(attempt)))
+    logger.warning(f"Retryable error in {node or endpoint} (attempt {attempt + 1}/{RetryConfig.MAX_ATTEMPTS}), "
+                   f"retrying in {delay:.1f}s: {error}")
+    add_span_event("retry", attempt=attempt + 1, delay_seconds=round(delay, 3), error=str(error)[:200])
+    return delay
+
+def _outlasts_deadline(delay):
+    left = remaining()
+    return left is not None and delay >= left
+
+# Runs calls that have a timeout; a call that overruns is abandoned here and finishes in the background
+_bounded_pool = ThreadPoolExecutor(max_workers=64, thread_name_prefix="provider-call")
+
+# Rate limiters whose slot the current provider call holds (see _throttled)
+_held_limiters = contextvars.ContextVar("held_limiters", default=())
+
+def _hold_until_done(future):
+    """ Keep the current call's limiter slots taken until an abandoned future actually finishes, so
+    max_concurrent still bounds the requests in flight at the provider """
+    for limiter in _held_limiters.get():
+        future.add_done_callback(lambda _, release=limiter.hold(): release())
+
+async def _in_thread(fn):
+    """ Await fn() run in the provider pool; if cancelled, the thread's limiter slots stay held until it returns """
+    future = _bounded_pool.submit(contextvars.copy_context().run, fn)
+    try:
+        return await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        _hold_until_done(future)
+        raise
+
+def _bounded(fn, what):
+    """ fn() within the call timeout and the current deadline (see deadline.py). Called once the rate limiter
+    has granted a slot, so time spent queued for it is neither timed out nor retried. """
+    check_deadline(what)
+    timeout, by_deadline = call_timeout()
+    if timeout is None:
+        return fn()
+    future = _bounded_pool.submit(contextvars.copy_context().run, fn)
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        if future.done():
+            raise  # fn itself timed out
+        if not future.cancel():
+            _hold_until_done(future)
+    if by_deadline:
+        raise RunDeadlineExceeded(f"{what} still running at the deadline")
+    raise TimeoutError(f"{what} took longer than {timeout:.1f}s")
+
+async def _abounded(afn, what):
+    """ Async counterpart of _bounded(); an overrunning call is cancelled """
+    check_deadline(what)
+    timeout, by_deadline = call_timeout()
+    if timeout is None:
+        return await afn()
+    task = asyncio.ensure_future(afn())
+    try:
+        done, _ = await asyncio.wait({task}, timeout=timeout)
+    finally:
+        if not task.done():
+            task.cancel()
+            _hold_until_done(task)
+    if done:
+        return task.result()
+    if by_deadline:
+        raise RunDeadlineExceeded(f"{what} still running at the deadline")
+    raise TimeoutError(f"{what} took longer than {timeout:.1f}s")
+
+def call_with_resilience(endpoint, fn, node=None):
+    """ Call fn() with jittered exponential backoff and the endpoint's circuit breaker """
+    breaker = get_circuit_breaker(endpoint)
+    started = time.monotonic()
+    for attempt in range(RetryConfig.MAX_ATTEMPTS):
+        last_attempt = time.monotonic()
+        try:
+            check_deadline(node or endpoint[0])
+            trial = breaker.before_call()
+            try:
+                result = fn()
+                breaker.record_success()
+            except Exception as e:
+                _attempt_failed(breaker, e)
+                raise
+            finally:
+                if trial:
+                    breaker.release_trial()
+        except Exception as e:
+            delay = _retry_delay(e, attempt, endpoint, node)
+            if delay is None:
+                _record_call(node, attempt, time.monotonic() - started, failed=True)
+                raise
+            if _outlasts_deadline(delay):
+                _record_call(node, attempt, time.monotonic() - started, failed=True)
+                raise RunDeadlineExceeded(f"{node or endpoint[0]} would retry after the deadline") from e
+            time.sleep(delay)
+            continue
+        # Added latency: everything before the attempt that finally succeeded
+        _record_call(node, attempt, last_attempt - started, failed=False)
+        return result
+
+async def acall_with_resilience(endpoint, afn, node=None):
+    """ Async counterpart of call_with_resilience() for a coroutine function """
+    breaker = get_circuit_breaker(endpoint)
+    started = time.monotonic()
+    for attempt in range(RetryConfig.MAX_ATTEMPTS):
+        last_attempt = time.monotonic()
+        try:
+            check_deadline(node or endpoint[0])
+            trial = breaker.before_call()
+            try:
+                result = await afn()
+                breaker.record_success()
+            except Exception as e:
+                _attempt_failed(breaker, e)
+                raise
+            finally:
+                if trial:
+                    breaker.release_trial()
+        except Exception as e:
+            delay = _retry_delay(e, attempt, endpoint, node)
+            if delay is None:
+                _record_call(node, attempt, time.monotonic() - started, failed=True)
+                raise
+            if _outlasts_deadline(delay):
+                _record_call(node, attempt, time.monotonic() - started, failed=True)
+                raise RunDeadlineExceeded(f"{node or endpoint[0]} would retry after the deadline") from e
+            await asyncio.sleep(delay)
+            continue
+        _record_call(node, attempt, last_attempt - started, failed=False)
+        return result
+
+def resilience_metrics():
+    """ Retry counts and added latency per node """
+    with _resilience_lock:
+        return {node: dict(stats) for node, stats in _resilience_metrics.items()}
+
+def circuit_states():
+    with _resilience_lock:
+        return {f"{endpoint[0]}/{endpoint[1] or '*'}": breaker.state for endpoint, breaker in _circuit_breakers.items()}
+
+
+def _error_entry(error):
+    return {"type": type(error).__name__, "message": str(error)[:500], "status_code": _status_code(error),
+            "retryable": is_retryable(error)}
+
+def _replayed(entry, decode):
+    if "error" in entry:
+        error = entry["error"]
+        raise ReplayedError(error["message"], error["type"], error["status_code"], error["retryable"])
+    return decode(entry["response"])
+
+def _through_cassette(kind, key, fn, encode=lambda value: value, decode=lambda value: value):
+    """ Run a provider call, recording it to or replaying it from the active cassette """
+    cassette = get_cassette()
+    if cassette is None:
+        return fn()
+    if cassette.replaying:
+        entry = cassette.replay(kind, key)
+        time.sleep(cassette.delay(entry))
+        return _replayed(entry, decode)
+    started = time.perf_counter()
+    try:
+        result = fn()
+    except Exception as e:
+        cassette.record(kind, key, time.perf_counter() - started, error=_error_entry(e))
+        raise
+    cassette.record(kind, key, time.perf_counter() - started, response=encode(result))
+    return result
+
+async def _athrough_cassette(kind, key, afn, encode=lambda value: value, decode=lambda value: value):
+    """ Async counterpart of _through_cassette() """
+    cassette = get_cassette()
+    if cassette is None:
+        return await afn()
+    if cassette.replaying:
+        entry = cassette.replay(kind, key)
+        await asyncio.sleep(cassette.delay(entry))
+        return _replayed(entry, decode)
+    started = time.perf_counter()
+    try:
+        result = await afn()
+    except Exception as e:
+        cassette.record(kind, key, time.perf_counter() - started, error=_error_entry(e))
+        raise
+    cassette.record(kind, key, time.perf_counter() - started, response=encode(result))
+    return result
+
+def _llm_request_key(llm, messages, schema):
+    # Normalized so a call recorded on the live client ("models/<name>", 0.0) matches its replay client ("<name>", 0)
+    temperature = getattr(llm, "temperature", None)
+    return request_key("llm", model_id(llm.model), float(temperature) if temperature is not None else None,
+                       schema.__name__ if schema is not None else None,
+                       [[getattr(m, "type", "human"), getattr(m, "content", m)] for m in messages])
+
+@contextmanager
+def _throttled(limiter, node, tokens=0):
+    """ Hold a rate limiter slot, recording the wait for it as throttled time """
+    check_deadline(node or limiter.key[0])  # don't queue for a slot a cancelled or overdue call won't use
+    started = time.perf_counter()
+    with limiter.acquire(tokens=tokens):
+        record_throttle(time.perf_counter() - started, node)
+        held = _held_limiters.set(_held_limiters.get() + (limiter,))
+        try:
+            yield
+        finally:
+            _held_limiters.reset(held)
+
+@asynccontextmanager
+async def _athrottled(limiter, node, tokens=0):
+    check_deadline(node or limiter.key[0])
+    started = time.perf_counter()
+    async with limiter.acquire_async(tokens=tokens):
+        record_throttle(time.perf_counter() - started, node)
+        held = _held_limiters.set(_held_limiters.get() + (limiter,))
+        try:
+            yield
+        finally:
+            _held_limiters.reset(held)
+
+def _record_llm_usage(limiter, llm, messages, response, node):
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        limiter.record_usage(usage.get("output_tokens", 0))
+        input_tokens, output_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    else:
+        # Structured output returns the parsed model without usage metadata, so estimate both sides
+        input_tokens = estimate_tokens(messages)
+        output_tokens = estimate_tokens(response.model_dump_json()) if hasattr(response, "model_dump_json") else 0
+    record_llm_call(llm.model, input_tokens, output_tokens, node=node)
+    set_span_attributes({"llm.input_tokens": input_tokens, "llm.output_tokens": output_tokens})
+
+def _record_search(engine, query, results, size_bytes, cached, node):
+    record_search(engine, results, size_bytes, cached, node=node)
+    set_span_attributes({"search.engine": engine, "search.query": query, "search.results": results,
+                         "search.bytes": size_bytes, "cache.hit": cached})
+
+def _record_tavily(query, results, cached, node):
+    _record_search("tavily", query, len(results), sum(len(r.get("content", "").encode("utf-8")) for r in results), cached, node)
+
+def _record_wikipedia(query, docs, cached, node):
+    _record_search("wikipedia", query, len(docs), sum(len(doc.page_content.encode("utf-8")) for doc in docs), cached, node)
+
+def _cached_response(llm, messages, schema, node):
+    """ Response cache lookup for deterministic calls; returns (cache, response or None) """
+    cache = get_response_cache()
+    if cache is None or not cache.accepts(llm):
+        return None, None
+    return cache, cache.get(llm, messages, schema, node=node)
+
+@traced("llm.invoke")
+def invoke_llm(llm, messages, schema=None, node=None):
+    """ Invoke a chat model, optionally with structured output, through the response cache, rate limiter and retry policy """
+    cache, cached = _cached_response(llm, messages, schema, node)
+    set_span_attributes({"llm.model": llm.model, "llm.temperature": getattr(llm, "temperature", None),
+                         "llm.schema": schema.__name__ if schema is not None else None, "cache.hit": cached is not None})
+    if cached is not None:
+        return cached
+
+    runnable = llm.with_structured_output(schema) if schema is not None else llm
+    model = model_id(llm.model)
+    limiter = get_limiter("google", model)
+
+    key = _llm_request_key(llm, messages, schema)
+
+    def call():
+        with _throttled(limiter, node, tokens=estimate_tokens(messages)):
+            return _through_cassette("llm", key, lambda: _bounded(lambda: runnable.invoke(messages), node or "llm"),
+                                     serialize_response, lambda value: deserialize_response(value, schema))
+
+    response = call_with_resilience(("google", model), call, node=node)
+    _record_llm_usage(limiter, llm, messages, response, node)
+    if cache is not None:
+        cache.set(llm, messages, response, schema=schema)
+    return response
+
+def _wikipedia_to_cache(docs):
+    return [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+
+def _wikipedia_from_cache(entries):
+    return [Document(page_content=entry["page_content"], metadata=entry["metadata"]) for entry in entries]
+
+@traced("search.tavily")
+def search_tavily(query, tavily_api_key, node=None):
+    """ Run a Tavily web search through the retrieval cache, rate limiter and retry policy """
+    tavily_search = get_tavily_search(tavily_api_key)
+    cache = get_retrieval_cache()
+    params = {"max_results": tavily_search.max_results, "search_depth": tavily_search.search_depth}
+    if cache is not None and (cached := cache.get("tavily", query, **params)) is not None:
+        _record_tavily(query, cached, True, node)
+        return cached
+
+    def call():
+        with _throttled(get_limiter("tavily"), node):
+            # Go through the API wrapper: the tool itself swallows HTTP errors into a string result
+            return _through_cassette("tavily", request_key("tavily", query, params),
+                                     lambda: _bounded(lambda: tavily_search.api_wrapper.results(query, **params), node or "tavily"))
+
+    results = call_with_resilience(("tavily", None), call, node=node)
+    _record_tavily(query, results, False, node)
+    if cache is not None:
+        cache.set("tavily", query, results, **params)
+    return results
+
+@traced("search.wikipedia")
+def load_wikipedia(query, load_max_docs=2, node=None):
+    """ Load Wikipedia pages through the retrieval cache, rate limiter and retry policy """
+    cache = get_retrieval_cache()
+    if cache is not None and (cached := cache.get("wikipedia", query, load_max_docs=load_max_docs)) is not None:
+        docs = _wikipedia_from_cache(cached)
+        _record_wikipedia(query, docs, True, node)
+        return docs
+
+    def call():
+        with _throttled(get_limiter("wikipedia"), node):
+            return _through_cassette("wikipedia", request_key("wikipedia", query, load_max_docs),
+                                     lambda: _bounded(get_wikipedia_loader(query, load_max_docs).load, node or "wikipedia"),
+                                     _wikipedia_to_cache, _wikipedia_from_cache)
+
+    docs = call_with_resilience(("wikipedia", None), call, node=node)
+    _record_wikipedia(query, docs, False, node)
+    if cache is not None:
+        cache.set("wikipedia", query, _wikipedia_to_cache(docs), load_max_docs=load_max_docs)
+    return docs
+
+@traced("llm.invoke")
+async def ainvoke_llm(llm, messages, schema=None, node=None):
+    """ Async counterpart of invoke_llm() """
+    cache, cached = _cached_response(llm, messages, schema, node)
+    set_span_attributes({"llm.model": llm.model, "llm.temperature": getattr(llm, "temperature", None),
+                         "llm.schema": schema.__name__ if schema is not None else None, "cache.hit": cached is not None})
+    if cached is not None:
+        return cached
+
+    runnable = llm.with_structured_output(schema) if schema is not None else llm
+    model = model_id(llm.model)
+    limiter = get_limiter("google", model)
+
+    key = _llm_request_key(llm, messages, schema)
+
+    async def call():
+        async with _athrottled(limiter, node, tokens=estimate_tokens(messages)):
+            return await _athrough_cassette("llm", key, lambda: _abounded(lambda: runnable.ainvoke(messages), node or "llm"),
+                                            serialize_response, lambda value: deserialize_response(value, schema))
+
+    response = await acall_with_resilience(("google", model), call, node=node)
+    _record_llm_usage(limiter, llm, messages, response, node)
+    if cache is not None:
+        cache.set(llm, messages, response, schema=schema)
+    return response
+
+@traced("search.tavily")
+async def asearch_tavily(query, tavily_api_key, node=None):
+    """ Async counterpart of search_tavily() """
+    tavily_search = get_tavily_search(tavily_api_key)
+    cache = get_retrieval_cache()
+    params = {"max_results": tavily_search.max_results, "search_depth": tavily_search.search_depth}
+    if cache is not None and (cached := cache.get("tavily", query, **params)) is not None:
+        _record_tavily(query, cached, True, node)
+        return cached
+
+    async def call():
+        async with _athrottled(get_limiter("tavily"), node):
+            # The wrapper's own async path loses the HTTP status, so run the sync request in a worker thread
+            return await _athrough_cassette("tavily", request_key("tavily", query, params),
+                                            lambda: _abounded(lambda: _in_thread(lambda: tavily_search.api_wrapper.results(query, **params)),
+                                                              node or "tavily"))
+
+    results = await acall_with_resilience(("tavily", None), call, node=node)
+    _record_tavily(query, results, False, node)
+    if cache is not None:
+        cache.set("tavily", query, results, **params)
+    return results
+
+@traced("search.wikipedia")
+async def aload_wikipedia(query, load_max_docs=2, node=None):
+    """ Async counterpart of load_wikipedia() """
+    cache = get_retrieval_cache()
+    if cache is not None and (cached := cache.get("wikipedia", query, load_max_docs=load_max_docs)) is not None:
+        docs = _wikipedia_from_cache(cached)
+        _record_wikipedia(query, docs, True, node)
+        return docs
+
+    async def call():
+        async with _athrottled(get_limiter("wikipedia"), node):
+            return await _athrough_cassette("wikipedia", request_key("wikipedia", query, load_max_docs),
+                                            lambda: _abounded(lambda: _in_thread(get_wikipedia_loader(query, load_max_docs).load), node or "wikipedia"),
+                                            _wikipedia_to_cache, _wikipedia_from_cache)
+
+    docs = await acall_with_resilience(("wikipedia", None), call, node=node)
+    _record_wikipedia(query, docs, False, node)
+    if cache is not None:
+        cache.set("wikipedia", query, _wikipedia_to_cache(docs), load_max_docs=load_max_docs)
+    return docs
@@ -0,0 +1,235 @@
+import os
+import time
+import inspect
+import logging
+import threading
+import functools
+import contextvars
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_core.runnables.config import ensure_config
+from tracing import node_span
+from rate_limiter import model_id
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsConfig:
+    PORT = int(os.environ.get("METRICS_PORT", "0"))  # serve /metrics on this port when set
+    HOST = os.environ.get("METRICS_HOST", "127.0.0.1")  # local only unless set, e.g. 0.0.0.0 for a remote scraper
+    # USD per 1M input / output tokens, and per search request (Tavily advanced search = 2 credits)
+    LLM_PRICES = {
+        "gemini-2.0-flash": (0.10, 0.40),
+        "gemini-2.0-flash-lite": (0.075, 0.30),
+    }
+    SEARCH_PRICES = {"tavily": 0.016, "wikipedia": 0.0}
+
+
+COUNTERS = ("runs", "errors", "wall_seconds", "throttled_seconds", "llm_calls", "input_tokens", "output_tokens",
+            "search_calls", "search_results", "search_bytes", "cost_usd")
+
+# (thread_id, analyst, node) of the node currently running in this context
+_scope = contextvars.ContextVar("metrics_scope", default=None)
+
+
+class RunMetrics:
+    """ Thread-safe counters keyed by (thread_id, analyst, node) """
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, **values):
+        with self._lock:
+            counters = self._counters.setdefault(key, dict.fromkeys(COUNTERS, 0))
+            for name, value in values.items():
+                counters[name] += value
+
+    def items(self, thread_id=None):
+        with self._lock:
+            return [(key, dict(values)) for key, values in self._counters.items()
+                    if thread_id is None or key[0] == thread_id]
+
+    def clear(self, thread_id=None):
+        with self._lock:
+            for key in [key for key in self._counters if thread_id is None or key[0] == thread_id]:
+                del self._counters[key]
+
+    def retire(self, thread_id):
+        """ Fold a finished run's counters into the per-node totals of finished runs (thread_id None), so a
+        long-running process keeps one set of counters per node rather than one per thread """
+        if thread_id is None:
+            return
+        with self._lock:
+            for key in [key for key in self._counters if key[0] == thread_id]:
+                totals = self._counters.setdefault((None, "", key[2]), dict.fromkeys(COUNTERS, 0))
+                for name, value in self._counters.pop(key).items():
+                    totals[name] += value
+
+
+run_metrics = RunMetrics()
+
+
+def _current_key(node=None):
+    scope = _scope.get()
+    if scope is not None:
+        return scope
+    return (None, "", node or "unknown")
+
+
+def _analyst_name(state):
+    analyst = state.get("analyst") if isinstance(state, dict) else None
+    return getattr(analyst, "name", "") or ""
+
+
+def instrument(node, fn):
+    """ Wrap a graph node so its wall time and the calls it makes are recorded under its thread, analyst and node,
+    inside a tracing span for the node """
+    def scope_for(state):
+        configurable = ensure_config().get("configurable", {})
+        return (configurable.get("thread_id"), _analyst_name(state), node), configurable.get("checkpoint_ns", "")
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(state, *args, **kwargs):
+            key, namespace = scope_for(state)
+            token = _scope.set(key)
+            started = time.perf_counter()
+            failed = False
+            try:
+                with node_span(node, key[0], key[1], namespace):
+                    return await fn(state, *args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                _scope.reset(token)
+                run_metrics.add(key, runs=1, errors=int(failed), wall_seconds=time.perf_counter() - started)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(state, *args, **kwargs):
+        key, namespace = scope_for(state)
+        token = _scope.set(key)
+        started = time.perf_counter()
+        failed = False
+        try:
+            with node_span(node, key[0], key[1], namespace):
+                return fn(state, *args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            _scope.reset(token)
+            run_metrics.add(key, runs=1, errors=int(failed), wall_seconds=time.perf_counter() - started)
+    return wrapper
+
+
+def record_throttle(seconds, node=None):
+    """ Time spent waiting for a rate limiter slot """
+    run_metrics.add(_current_key(node), throttled_seconds=seconds)
+
+
+def record_llm_call(model, input_tokens, output_tokens, node=None):
+    input_price, output_price = MetricsConfig.LLM_PRICES.get(model_id(model), (0.0, 0.0))
+    cost = (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+    run_metrics.add(_current_key(node), llm_calls=1, input_tokens=input_tokens, output_tokens=output_tokens, cost_usd=cost)
+
+
+def record_search(engine, results, size_bytes, cached=False, node=None):
+    """ Results returned by a search; cache hits count results but not billed calls """
+    values = {"search_results": results, "search_bytes": size_bytes}
+    if not cached:
+        values.update(search_calls=1, cost_usd=MetricsConfig.SEARCH_PRICES.get(engine, 0.0))
+    run_metrics.add(_current_key(node), **values)
+
+
+def run_summary(thread_id):
+    """ Totals, per-node and per-analyst breakdown for one research thread; empty for a run without a thread_id,
+    whose counters cannot be told apart from those of other runs """
+    totals = dict.fromkeys(COUNTERS, 0)
+    by_node, by_analyst = {}, {}
+    for (_, analyst, node), values in (run_metrics.items(thread_id) if thread_id is not None else []):
+        for target in (totals, by_node.setdefault(node, dict.fromkeys(COUNTERS, 0)),
+                       by_analyst.setdefault(analyst or "(run)", dict.fromkeys(COUNTERS, 0))):
+            for name, value in values.items():
+                target[name] += value
+    return {"thread_id": thread_id, "totals": totals, "by_node": by_node, "by_analyst": by_analyst}
+
+
+def _escape(value):
+    return str(value if value is not None else "").replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text():
+    """ All counters in the Prometheus text exposition format """
+    from rate_limiter import rate_limit_metrics
+    from interview_scheduler import get_interview_scheduler
+
+    lines = []
+    items = run_metrics.items()
+    for name in COUNTERS:
+        metric = f"research_node_{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        for (thread_id, analyst, node), values in items:
+            lines.append(f'{metric}{{thread_id="{_escape(thread_id)}",analyst="{_escape(analyst)}",node="{_escape(node)}"}} {values[name]}')
+    limiter_stats = rate_limit_metrics()
+    for name in ("acquired", "throttled", "wait_seconds", "tokens"):
+        metric = f"research_rate_limit_{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        for key, stats in limiter_stats.items():
+            lines.append(f'{metric}{{limiter="{_escape(key)}"}} {stats[name]}')
+    from cache import get_retrieval_cache, get_response_cache
+    retrieval_cache, response_cache = get_retrieval_cache(), get_response_cache()
+    caches = []
+    if retrieval_cache is not None:
+        caches.append(({"cache": "retrieval"}, retrieval_cache.metrics()))
+    if response_cache is not None:
+        caches += [({"cache": "response", "node": node}, stats) for node, stats in response_cache.metrics().items()]
+    for name, kind in (("hits", "counter"), ("semantic_hits", "counter"), ("misses", "counter"), ("hit_rate", "gauge")):
+        metric = f"research_cache_{name}_total" if kind == "counter" else f"research_cache_{name}"
+        lines.append(f"# TYPE {metric} {kind}")
+        for labels, stats in caches:
+            if name in stats:
+                label_text = ",".join(f'{label}="{_escape(value)}"' for label, value in labels.items())
+                lines.append(f"{metric}{{{label_text}}} {stats[name]}")
+    scheduler = get_interview_scheduler()
+    for name, kind, value in (("in_flight", "gauge", scheduler.in_flight), ("waiting", "gauge", scheduler.waiting),
+                              ("admitted_total", "counter", scheduler.stats["admitted"]),
+                              ("wait_seconds_total", "counter", scheduler.stats["wait_seconds"])):
+        lines.append(f"# TYPE research_interviews_{name} {kind}")
+        lines.append(f"research_interviews_{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None, host=None):
+    """ Serve /metrics from a daemon thread; returns the server, or None when no port is configured """
+    global _server
+    port = port if port is not None else MetricsConfig.PORT
+    host = host or MetricsConfig.HOST
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+            logger.info(f"Serving Prometheus metrics on {host}:{port}/metrics")
+        return _server
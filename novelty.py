@@ -0,0 +1,77 @@
+import os
+import re
+import hashlib
+import logging
+from langchain_core.messages import AIMessage
+
+logger = logging.getLogger(__name__)
+
+
+class NoveltyConfig:
+    # An interview stops once an expert answer scores below this (config["configurable"]["novelty_threshold"]);
+    # 0 keeps every interview to max_num_turns
+    STOP_BELOW = float(os.environ.get("INTERVIEW_NOVELTY_THRESHOLD", "0.25"))
+    NGRAM = 3  # words per shingle
+    SOURCE_WEIGHT = 0.5  # weight of the new-source ratio against the new-text ratio
+    MIN_ANSWERS = 2  # the first answer is all new, so judge from the second on
+
+
+def _shingles(text, n=NoveltyConfig.NGRAM):
+    """ Hashed word n-grams of a text """
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < n:
+        words = words + [""] * (n - len(words))
+    return {hashlib.blake2b(" ".join(words[i:i + n]).encode("utf-8"), digest_size=8).digest()
+            for i in range(len(words) - n + 1)}
+
+
+def text_novelty(answer, previous):
+    """ Share of the answer's n-grams that no previous answer contained """
+    shingles = _shingles(answer)
+    seen = set().union(*(_shingles(text) for text in previous))
+    return len(shingles - seen) / len(shingles)
+
+
+def source_novelty(sources, previous):
+    """ Share of this turn's retrieved sources not retrieved in earlier turns, None if nothing was retrieved """
+    sources = set(sources)
+    if not sources:
+        return None
+    return len(sources - set(previous)) / len(sources)
+
+
+def expert_answers(messages, name="expert"):
+    return [m for m in messages if isinstance(m, AIMessage) and m.name == name]
+
+
+def answer_novelty(state, name="expert"):
+    """ How much the latest expert answer and its retrieval round added: (score, text, sources) in [0, 1],
+    or None before there is anything to compare """
+    answers = expert_answers(state["messages"], name)
+    if len(answers) < NoveltyConfig.MIN_ANSWERS:
+        return None
+    turn = len(answers) - 1
+    text = text_novelty(answers[-1].content, [answer.content for answer in answers[:-1]])
+    retrievals = state.get("retrievals") or []
+    sources = source_novelty([s for r in retrievals if r["turn"] == turn for s in r["sources"]],
+                             [s for r in retrievals if r["turn"] < turn for s in r["sources"]])
+    if sources is None:
+        return text, text, None
+    return (1 - NoveltyConfig.SOURCE_WEIGHT) * text + NoveltyConfig.SOURCE_WEIGHT * sources, text, sources
+
+
+def novelty_threshold(config):
+    return float((config or {}).get("configurable", {}).get("novelty_threshold", NoveltyConfig.STOP_BELOW))
+
+
+def saturated(state, config=None, name="expert"):
+    """ True once the latest answer added too little new text and sources to keep interviewing """
+    threshold = novelty_threshold(config)
+    if threshold <= 0:
+        return False
+    novelty = answer_novelty(state, name)
+    if novelty is None:
+        return False
+    score, text, sources = novelty
+    logger.info(f"Answer novelty {score:.2f} (text {text:.2f}, sources {'-' if sources is None else f'{sources:.2f}'})")
+    return score < threshold
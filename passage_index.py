@@ -0,0 +1,203 @@
+import re
+import abc
+import math
+import hashlib
+import logging
+import threading
+from collections import Counter, OrderedDict
+from cache import hashed_embedding
+
+try:
+    import numpy as np
+except ImportError:  # the vector index is optional
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+class PassageConfig:
+    RETRIEVER = "bm25"  # "bm25" or "vector"
+    TOP_K = 8  # passages handed to generate_answer
+    CHUNK_WORDS = 200
+    CHUNK_OVERLAP = 30  # words repeated between windows of a long paragraph
+    MAX_INDEXES = 64  # per-interview indexes kept in memory
+
+
+def _terms(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def chunk_text(text, chunk_words=PassageConfig.CHUNK_WORDS, overlap=PassageConfig.CHUNK_OVERLAP):
+    """ Pack paragraphs into ~chunk_words windows; paragraphs longer than that are split with overlap """
+    chunks, current = [], []
+    for paragraph in [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]:
+        words = paragraph.split()
+        if len(words) > chunk_words:
+            if current:
+                chunks.append("\n\n".join(current))
+                current = []
+            step = max(1, chunk_words - overlap)
+            for start in range(0, len(words), step):
+                chunks.append(" ".join(words[start:start + chunk_words]))
+                if start + chunk_words >= len(words):
+                    break
+            continue
+        if current and sum(len(p.split()) for p in current) + len(words) > chunk_words:
+            chunks.append("\n\n".join(current))
+            current = []
+        current.append(paragraph)
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+class PassageIndex(abc.ABC):
+    """ Chunks documents into passages that keep their source attribution; subclasses rank them """
+    def __init__(self):
+        self.passages = {}  # passage id -> passage dict
+        self._doc_hashes = {}  # document key -> content hash
+        self._doc_passages = {}  # document key -> passage ids
+        self._next_id = 0
+
+    def update(self, docs):
+        """ Index new documents and re-chunk those whose content grew; unchanged documents are skipped """
+        keys = [doc.get("source") or f"doc-{position}" for position, doc in enumerate(docs)]
+        for key in set(self._doc_passages) - set(keys):
+            for passage_id in self._doc_passages.pop(key):
+                self._remove(passage_id)
+            del self._doc_hashes[key]
+        for position, (key, doc) in enumerate(zip(keys, docs)):
+            digest = hashlib.sha256(doc["content"].encode("utf-8")).hexdigest()
+            if self._doc_hashes.get(key) == digest:
+                for passage_id in self._doc_passages[key]:
+                    self.passages[passage_id]["doc_position"] = position
+                continue
+            for passage_id in self._doc_passages.pop(key, []):
+                self._remove(passage_id)
+            self._doc_hashes[key] = digest
+            ids = []
+            for order, text in enumerate(chunk_text(doc["content"])):
+                passage = {"engine": doc["engine"], "source": doc.get("source"), "page": doc.get("page", ""),
+                           "text": text, "doc_position": position, "order": order}
+                ids.append(self._add(passage))
+            self._doc_passages[key] = ids
+
+    def _add(self, passage):
+        passage_id = self._next_id
+        self._next_id += 1
+        self.passages[passage_id] = passage
+        return passage_id
+
+    def _remove(self, passage_id):
+        del self.passages[passage_id]
+
+    @abc.abstractmethod
+    def search(self, query, top_k):
+        """ Best passages for the query as (score, passage), highest first """
+
+    def __len__(self):
+        return len(self.passages)
+
+
+class BM25Index(PassageIndex):
+    """ Pure-Python Okapi BM25 """
+    def __init__(self, k1=1.5, b=0.75):
+        super().__init__()
+        self.k1 = k1
+        self.b = b
+        self._term_freqs = {}
+        self._lengths = {}
+        self._doc_freq = Counter()
+
+    def _add(self, passage):
+        passage_id = super()._add(passage)
+        term_freqs = Counter(_terms(passage["text"]))
+        self._term_freqs[passage_id] = term_freqs
+        self._lengths[passage_id] = sum(term_freqs.values())
+        self._doc_freq.update(term_freqs.keys())
+        return passage_id
+
+    def _remove(self, passage_id):
+        super()._remove(passage_id)
+        self._doc_freq.subtract(self._term_freqs.pop(passage_id).keys())
+        del self._lengths[passage_id]
+
+    def search(self, query, top_k):
+        if not self.passages:
+            return []
+        total = len(self.passages)
+        avg_length = sum(self._lengths.values()) / total or 1.0
+        query_terms = set(_terms(query))
+        idf = {t: math.log(1 + (total - self._doc_freq[t] + 0.5) / (self._doc_freq[t] + 0.5)) for t in query_terms}
+        scored = []
+        for passage_id, term_freqs in self._term_freqs.items():
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[passage_id] / avg_length)
+            score = sum(idf[t] * term_freqs[t] * (self.k1 + 1) / (term_freqs[t] + norm) for t in query_terms if t in term_freqs)
+            scored.append((score, passage_id))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [(score, self.passages[passage_id]) for score, passage_id in scored[:top_k]]
+
+
+class VectorIndex(PassageIndex):
+    """ Cosine similarity over embeddings held in a NumPy matrix; embed_fn maps text to a vector """
+    def __init__(self, embed_fn=hashed_embedding):
+        if np is None:
+            raise ImportError("The vector passage index requires numpy")
+        super().__init__()
+        self.embed_fn = embed_fn
+        self._vectors = {}
+
+    def _add(self, passage):
+        passage_id = super()._add(passage)
+        vector = np.asarray(self.embed_fn(passage["text"]), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        self._vectors[passage_id] = vector / norm if norm else vector
+        return passage_id
+
+    def _remove(self, passage_id):
+        super()._remove(passage_id)
+        del self._vectors[passage_id]
+
+    def search(self, query, top_k):
+        if not self.passages:
+            return []
+        ids = list(self._vectors)
+        query_vector = np.asarray(self.embed_fn(query), dtype=np.float32)
+        norm = np.linalg.norm(query_vector)
+        if norm:
+            query_vector = query_vector / norm
+        scores = np.stack([self._vectors[i] for i in ids]) @ query_vector
+        best = np.argsort(-scores, kind="stable")[:top_k]
+        return [(float(scores[i]), self.passages[ids[i]]) for i in best]
+
+
+def create_index(retriever):
+    if retriever == "bm25":
+        return BM25Index()
+    if retriever == "vector":
+        return VectorIndex()
+    raise ValueError(f"Unknown passage retriever: {retriever}")
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_index(key, retriever=PassageConfig.RETRIEVER):
+    """ The in-memory index for one interview (key), created on first use and kept in a small LRU """
+    key = (key, retriever)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = create_index(retriever)
+        _indexes.move_to_end(key)
+        while len(_indexes) > PassageConfig.MAX_INDEXES:
+            _indexes.popitem(last=False)
+        return index
+
+
+def drop_index(key):
+    """ Forget every index built for an interview """
+    with _indexes_lock:
+        for index_key in [k for k in _indexes if k[0] == key]:
+            del _indexes[index_key]
@@ -1,5 +1,111 @@
 import os
+import string
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Resolved from this file so prompts load regardless of the working directory
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+
+# Fields each caller passes to format(); checked against the prompt files when they load
+PROMPT_FIELDS = {
+    "analyst_instructions": {"topic", "human_analyst_feedback", "max_analysts"},
+    "selector_instructions": {"topic", "human_analyst_feedback", "max_analysts", "candidates"},
+    "question_instructions": {"name", "role", "affiliation", "description"},
+    "search_instructions": {"search_engine"},
+    "query_plan_instructions": {"engines", "variants"},
+    "answer_instructions": {"goals", "context"},
+    "section_writer_instructions": {"focus"},
+    "report_writer_instructions": {"topic", "context"},
+    "section_merge_instructions": {"topic", "words", "context"},
+    "draft_update_instructions": {"topic", "outline", "draft", "context"},
+    "intro_conclusion_instructions": {"topic", "formatted_str_sections"},
+    "report_synthesis_instructions": {"topic", "context"},
+}
+
+
+class Prompt:
+    """ A prompt template with its str.format fields parsed once at load time """
+    def __init__(self, name, path, template, mtime):
+        self.name = name
+        self.path = path
+        self.template = template
+        self.mtime = mtime
+        self.fields = frozenset(
+            field.split(".")[0].split("[")[0]
+            for _, field, _, _ in string.Formatter().parse(template)
+            if field
+        )
+
+    def format(self, **kwargs):
+        missing = self.fields - kwargs.keys()
+        if missing:
+            raise KeyError(f"Prompt '{self.name}' is missing values for: {', '.join(sorted(missing))}")
+        return self.template.format(**kwargs)
+
+
+class PromptRegistry:
+    """ Loads every prompts/*.txt once; optionally reloads a prompt when its file changes (dev only) """
+    def __init__(self, directory=PROMPTS_DIR, hot_reload=False):
+        self.directory = directory
+        self.hot_reload = hot_reload
+        self._prompts = {}
+        self._lock = threading.Lock()
+        self.load_all()
+
+    def _read(self, name):
+        path = os.path.join(self.directory, f"{name}.txt")
+        with open(path, "r", encoding="utf-8") as f:
+            template = f.read()
+        return Prompt(name, path, template, os.path.getmtime(path))
+
+    def load_all(self):
+        prompts = {}
+        for filename in sorted(os.listdir(self.directory)):
+            if filename.endswith(".txt"):
+                name = filename[:-len(".txt")]
+                prompts[name] = self._read(name)
+        with self._lock:
+            self._prompts = prompts
+        logger.debug(f"Loaded {len(prompts)} prompts from {self.directory}")
+
+    def validate(self, expected=PROMPT_FIELDS):
+        """ Fail fast if a prompt is missing or uses a field its caller does not pass """
+        for name, fields in expected.items():
+            prompt = self._prompts.get(name)
+            if prompt is None:
+                raise ValueError(f"Prompt file '{name}.txt' not found in {self.directory}")
+            unknown = prompt.fields - fields
+            if unknown:
+                raise ValueError(f"Prompt '{name}' uses fields not supplied by its caller: {', '.join(sorted(unknown))}")
+            unused = fields - prompt.fields
+            if unused:
+                logger.warning(f"Prompt '{name}' ignores fields: {', '.join(sorted(unused))}")
+
+    def get(self, name):
+        prompt = self._prompts.get(name)
+        if prompt is None:
+            raise KeyError(f"Unknown prompt: {name}")
+        if self.hot_reload and os.path.getmtime(prompt.path) != prompt.mtime:
+            logger.info(f"Reloading prompt '{name}' after file change")
+            prompt = self._read(name)
+            with self._lock:
+                self._prompts[name] = prompt
+        return prompt
+
+    def names(self):
+        return sorted(self._prompts)
+
+
+registry = PromptRegistry(hot_reload=os.environ.get("PROMPTS_HOT_RELOAD", "").lower() in ("1", "true"))
+registry.validate()
+
 
 def load_prompt(name):
-    with open(os.path.join("prompts", f"{name}.txt"), "r", encoding="utf-8") as f:
-        return f.read()
+    return registry.get(name).template
+
+
+def format_prompt(prompt_name, /, **kwargs):
+    # Positional-only so templates can use a {name} field
+    return registry.get(prompt_name).format(**kwargs)
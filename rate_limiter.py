@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+# How long to wait before re-checking when every concurrent slot is taken
+CONCURRENCY_POLL_SECONDS = 0.05
+
+
+class RateLimit:
+    """ Budget for a provider or model. None means unlimited. """
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_concurrent=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrent = max_concurrent
+
+    def __repr__(self):
+        return (f"RateLimit(requests_per_minute={self.requests_per_minute}, "
+                f"tokens_per_minute={self.tokens_per_minute}, max_concurrent={self.max_concurrent})")
+
+
+# Keyed by (provider, model). A model of None is the provider-wide fallback.
+# The defaults follow the free Gemini/Tavily tiers; paid tiers should raise them with configure_rate_limit().
+DEFAULT_RATE_LIMITS = {
+    ("google", None): RateLimit(requests_per_minute=15, tokens_per_minute=1_000_000, max_concurrent=8),
+    ("google", "gemini-2.0-flash"): RateLimit(requests_per_minute=15, tokens_per_minute=1_000_000, max_concurrent=8),
+    ("google", "gemini-2.0-flash-lite"): RateLimit(requests_per_minute=30, tokens_per_minute=1_000_000, max_concurrent=8),
+    ("tavily", None): RateLimit(requests_per_minute=100, max_concurrent=8),
+    ("wikipedia", None): RateLimit(requests_per_minute=200, max_concurrent=4),
+}
+
+
+def model_id(model):
+    """ Bare model name: the Gemini client reports its model as "models/<name>", the budgets use "<name>" """
+    return model[len("models/"):] if isinstance(model, str) and model.startswith("models/") else model
+
+
+class TokenBucket:
+    """ Classic token bucket refilled continuously at `refill_per_second` up to `capacity` """
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """ Seconds until `amount` can be taken (0 if available now) """
+        self._refill(now)
+        # A single request larger than the bucket can never fit, so it only waits for a full bucket
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.refill_per_second
+
+    def consume(self, amount):
+        # Level may go negative when usage is charged after the fact; later callers then wait it off
+        self.level -= amount
+
+
+class Limiter:
+    """ Rate limiter for one (provider, model) key. Only blocks when a budget is exhausted. """
+    def __init__(self, key, limit):
+        self.key = key
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._requests = self._bucket(limit.requests_per_minute)
+        self._tokens = self._bucket(limit.tokens_per_minute)
+        self._in_flight = 0
+        self.stats = {
+            "acquired": 0,
+            "throttled": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "tokens": 0,
+        }
+
+    @staticmethod
+    def _bucket(per_minute):
+        if not per_minute:
+            return None
+        return TokenBucket(per_minute, per_minute / 60.0)
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def estimated_wait(self, tokens=0):
+        """ Seconds a caller would currently wait, without acquiring anything """
+        with self._lock:
+            return self._wait_time(tokens, time.monotonic())
+
+    def _wait_time(self, tokens, now):
+        if self.limit.max_concurrent and self._in_flight >= self.limit.max_concurrent:
+            return CONCURRENCY_POLL_SECONDS
+        wait = 0.0
+        if self._requests is not None:
+            wait = max(wait, self._requests.wait_time(1, now))
+        if self._tokens is not None and tokens:
+            wait = max(wait, self._tokens.wait_time(tokens, now))
+        return wait
+
+    def _try_acquire(self, tokens):
+        """ Take a slot and budget if available, otherwise return how long to wait """
+        with self._lock:
+            wait = self._wait_time(tokens, time.monotonic())
+            if wait > 0:
+                return wait
+            if self._requests is not None:
+                self._requests.consume(1)
+            if self._tokens is not None and tokens:
+                self._tokens.consume(tokens)
+            self._in_flight += 1
+            self.stats["tokens"] += tokens
+            return 0.0
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def hold(self):
+        """ Take one more concurrent slot, whatever the budget, for a call that outlives its acquire();
+        returns the function that releases it """
+        with self._lock:
+            self._in_flight += 1
+        return self._release
+
+    def _record_wait(self, waited):
+        with self._lock:
+            self.stats["acquired"] += 1
+            if waited > 0:
+                self.stats["throttled"] += 1
+                self.stats["wait_seconds"] += waited
+                self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], waited)
+        if waited > 0:
+            logger.info(f"Throttled {self.key[0]}/{self.key[1] or '*'} for {waited:.2f}s")
+
+    def record_usage(self, tokens):
+        """ Charge tokens that were only known after the call (e.g. output tokens) """
+        if not tokens:
+            return
+        with self._lock:
+            if self._tokens is not None:
+                self._tokens.consume(tokens)
+            self.stats["tokens"] += tokens
+
+    @contextmanager
+    def acquire(self, tokens=0):
+        """ Block until a request (and `tokens` of budget) may proceed, and hold a concurrent slot """
+        started = time.monotonic()
+        waited = False
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                break
+            waited = True
+            time.sleep(wait)
+        self._record_wait(time.monotonic() - started if waited else 0.0)
+        try:
+            yield self
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def acquire_async(self, tokens=0):
+        """ Async counterpart of acquire() that yields to the event loop while waiting """
+        started = time.monotonic()
+        waited = False
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                break
+            waited = True
+            await asyncio.sleep(wait)
+        self._record_wait(time.monotonic() - started if waited else 0.0)
+        try:
+            yield self
+        finally:
+            self._release()
+
+
+_rate_limits = dict(DEFAULT_RATE_LIMITS)
+_limiters = {}
+_registry_lock = threading.Lock()
+
+
+def configure_rate_limit(provider, model=None, requests_per_minute=None, tokens_per_minute=None, max_concurrent=None):
+    """ Set the budget for a provider (model=None) or for a single model of that provider """
+    limit = RateLimit(requests_per_minute, tokens_per_minute, max_concurrent)
+    model = model_id(model)
+    with _registry_lock:
+        _rate_limits[(provider, model)] = limit
+        # Drop existing limiters so the new budget applies on the next acquire
+        for key in [key for key in _limiters if key[0] == provider and (model is None or key[1] == model)]:
+            del _limiters[key]
+    logger.info(f"Configured rate limit for {provider}/{model or '*'}: {limit}")
+    return limit
+
+
+def get_limiter(provider, model=None):
+    """ Return the process-wide limiter for (provider, model) """
+    key = (provider, model_id(model))
+    with _registry_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limit = _rate_limits.get(key) or _rate_limits.get((provider, None)) or RateLimit()
+            limiter = _limiters[key] = Limiter(key, limit)
+        return limiter
+
+
+def _share(value, shares):
+    return None if value is None else max(1, value // shares) if isinstance(value, int) else value / shares
+
+
+def partition_rate_limits(shares, max_concurrent=None):
+    """ Give this process 1/shares of every budget, for `shares` processes drawing on one quota.
+    max_concurrent optionally sets a provider's total concurrent calls (across all shares) first. """
+    with _registry_lock:
+        for (provider, model), limit in list(_rate_limits.items()):
+            concurrent = (max_concurrent or {}).get(provider, limit.max_concurrent)
+            _rate_limits[(provider, model)] = RateLimit(_share(limit.requests_per_minute, shares),
+                                                        _share(limit.tokens_per_minute, shares),
+                                                        _share(concurrent, shares))
+        _limiters.clear()
+    logger.info(f"Rate limits partitioned into {shares} shares")
+
+
+def rate_limit_metrics():
+    """ Wait-time metrics for every limiter used so far, keyed by "provider/model" """
+    with _registry_lock:
+        limiters = list(_limiters.values())
+    metrics = {}
+    for limiter in limiters:
+        provider, model = limiter.key
+        stats = dict(limiter.stats)
+        stats["in_flight"] = limiter.in_flight
+        metrics[f"{provider}/{model or '*'}"] = stats
+    return metrics
+
+
+def reset_rate_limits():
+    """ Restore default budgets and forget all limiter state """
+    with _registry_lock:
+        _rate_limits.clear()
+        _rate_limits.update(DEFAULT_RATE_LIMITS)
+        _limiters.clear()
+
+
+def estimate_tokens(messages):
+    """ Rough token estimate (~4 characters per token) for a prompt or list of messages """
+    if isinstance(messages, str):
+        return max(1, len(messages) // 4)
+    total = 0
+    for message in messages:
+        content = message if isinstance(message, str) else getattr(message, "content", "")
+        total += len(content if isinstance(content, str) else str(content))
+    return max(1, total // 4)
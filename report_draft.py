@@ -0,0 +1,183 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.messages import HumanMessage, SystemMessage
+from llm_model import get_default_llm, invoke_llm
+from prompts import format_prompt
+from deadline import RunDeadlineExceeded, deadline_scope, remaining
+
+logger = logging.getLogger(__name__)
+
+_SOURCES_HEADER = re.compile(r"^#{2,3}\s*Sources\s*$", re.MULTILINE)
+_SOURCE_LINE = re.compile(r"^\s*\[(\d+)\]\s*(.+?)\s*$")
+_CITATION = re.compile(r"([ \t]*)\[(\d+)\]")  # with the space before it, dropped along with a dangling citation
+_TITLE = re.compile(r"^##\s+(.+?)\s*$", re.MULTILINE)
+
+
+class DraftConfig:
+    # Drafts of runs that were abandoned without failing (client gone, process stopping) are dropped once
+    # untouched for this long
+    TTL_SECONDS = float(os.environ.get("REPORT_DRAFT_TTL_SECONDS", "3600"))
+
+
+def _split_sources(section):
+    """ (text, {local number: source}) of a section memo with a ## or ### Sources list """
+    match = _SOURCES_HEADER.search(section)
+    if match is None:
+        return section.strip(), {}
+    sources = {}
+    for line in section[match.end():].splitlines():
+        found = _SOURCE_LINE.match(line)
+        if found:
+            sources[found.group(1)] = found.group(2)
+    return section[:match.start()].strip(), sources
+
+
+class ReportDraft:
+    """ Running report of one research thread, built up as interview sections arrive.
+
+    Each section's citations are renumbered into one list of unique sources, its title goes into the outline,
+    and the body is rewritten with the new memos by folds that run in the background, one at a time. Memos that
+    arrive while a fold runs are taken together by the next one.
+    """
+    def __init__(self, topic):
+        self.topic = topic
+        self.sources = {}  # source -> global citation number
+        self.outline = []
+        self.body = ""
+        self.pending = []  # renumbered memos not in the body yet
+        self.folds = 0
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._folding = None
+        self.touched = time.monotonic()
+
+    def add(self, section):
+        """ Renumber a section into the draft, dropping citations its Sources list lacks; False if it was already added """
+        digest = hashlib.sha256(section.encode("utf-8")).hexdigest()
+        with self._lock:
+            if digest in self._seen:
+                return False
+            self._seen.add(digest)
+            text, local = _split_sources(section)
+            numbers = {number: self.sources.setdefault(source, len(self.sources) + 1) for number, source in local.items()}
+            # A citation missing from the section's Sources has no source to point to, and its old number would
+            # collide with another section's, so it is dropped
+            text = _CITATION.sub(lambda m: f"{m.group(1)}[{numbers[m.group(2)]}]" if m.group(2) in numbers else "", text)
+            title = _TITLE.search(text)
+            self.outline.append(title.group(1) if title else f"Section {len(self.outline) + 1}")
+            self.pending.append(text)
+            return True
+
+    def _messages(self, memos):
+        outline = "\n".join(f"- {title}" for title in self.outline)
+        system_message = format_prompt("draft_update_instructions", topic=self.topic, outline=outline,
+                                       draft=self.body or "(empty: this is the first update)", context="\n\n".join(memos))
+        return [SystemMessage(content=system_message)]+[HumanMessage(content="Update the report draft with these memos.")]
+
+    def fold(self, google_api_key):
+        """ Fold every pending memo into the body; callers serialise folds """
+        with self._lock:
+            memos, self.pending = self.pending, []
+        if not memos:
+            return
+        try:
+            body = invoke_llm(get_default_llm(google_api_key), self._messages(memos), node="fold_sections").content
+        except Exception:
+            with self._lock:
+                self.pending = memos + self.pending
+            raise
+        with self._lock:
+            self.body = body
+            self.folds += 1
+        logger.info(f"Folded {len(memos)} sections into the draft ({len(self.outline)} so far)")
+
+    def _fold_pending(self, google_api_key):
+        # The fold outlives the interview that triggered it, so it must not inherit that interview's deadline
+        with deadline_scope(None):
+            self._fold_loop(google_api_key)
+
+    def _fold_loop(self, google_api_key):
+        while True:
+            with self._lock:
+                if not self.pending:
+                    self._folding = None
+                    return
+            try:
+                self.fold(google_api_key)
+            except Exception as e:
+                # Left pending for the final pass, which raises if it fails again
+                logger.warning(f"Background fold failed: {e}")
+                with self._lock:
+                    self._folding = None
+                return
+
+    def schedule(self, google_api_key):
+        """ Start folding in the background unless a fold is already running """
+        with self._lock:
+            if self._folding is not None or not self.pending:
+                return
+            self._folding = _pool.submit(contextvars.copy_context().run, self._fold_pending, google_api_key)
+
+    def reconcile(self, sections, google_api_key):
+        """ The finished body and sources: add sections the draft missed, wait for the running fold, fold the rest """
+        for section in sections:
+            self.add(section)
+        with self._lock:
+            folding = self._folding
+        if folding is not None:
+            # The background fold has no deadline of its own; the reconciling node's run deadline bounds the wait
+            try:
+                folding.result(timeout=remaining())
+            except TimeoutError:
+                raise RunDeadlineExceeded("Background fold still running at the deadline") from None
+        self.fold(google_api_key)
+        sources = "\n".join(f"[{number}] {source}" for source, number in sorted(self.sources.items(), key=lambda item: item[1]))
+        logger.info(f"Draft reconciled after {self.folds} folds, {len(self.sources)} sources")
+        return self.body.strip() + ("\n\n## Sources\n" + sources if sources else "")
+
+
+_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="report-draft")
+_drafts = {}  # run id -> ReportDraft
+_drafts_lock = threading.Lock()
+
+
+def draft_key(state, config):
+    """ Key of the run's draft: its run_id; runs checkpointed before run ids existed fall back to their thread """
+    return state.get("run_id") or config["configurable"]["thread_id"]
+
+
+def get_draft(run_id, topic):
+    now = time.monotonic()
+    with _drafts_lock:
+        for stale in [key for key, draft in _drafts.items() if now - draft.touched > DraftConfig.TTL_SECONDS]:
+            logger.warning(f"Dropping the report draft of run {stale}, untouched for {DraftConfig.TTL_SECONDS:.0f}s")
+            del _drafts[stale]
+        draft = _drafts.get(run_id)
+        if draft is None:
+            draft = _drafts[run_id] = ReportDraft(topic)
+        draft.touched = now
+        return draft
+
+
+def add_sections(run_id, topic, sections, google_api_key):
+    """ Fold freshly written interview sections into the run's draft in the background """
+    draft = get_draft(run_id, topic)
+    if any([draft.add(section) for section in sections]):
+        draft.schedule(google_api_key)
+
+
+def pop_draft(run_id, topic):
+    with _drafts_lock:
+        return _drafts.pop(run_id, None) or ReportDraft(topic)
+
+
+def discard_draft(run_id):
+    """ Forget the draft of a run that failed before its report was written """
+    with _drafts_lock:
+        _drafts.pop(run_id, None)
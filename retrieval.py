@@ -0,0 +1,200 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from deadline import cancel_scope
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalMode:
+    BARRIER = "barrier"  # the answer waits for every retriever (search_web and search_wikipedia nodes)
+    PIPELINED = "pipelined"  # one retrieve node answers on a quorum or timeout; late documents join afterwards
+    DEFAULT = os.environ.get("RETRIEVAL_MODE", BARRIER)
+    ALL = (BARRIER, PIPELINED)
+
+
+class RetrievalConfig:
+    # Pipelined mode only; config["configurable"] overrides each as retrieval_<name in lower case>
+    QUORUM = int(os.environ.get("RETRIEVAL_QUORUM", "1"))  # retrievers with documents before answering
+    WAIT_SECONDS = float(os.environ.get("RETRIEVAL_WAIT_SECONDS", "2.0"))  # then answer with what has arrived
+    # Re-answer when late documents land while the first answer is written, waiting up to REFINE_WAIT_SECONDS
+    REFINE = os.environ.get("RETRIEVAL_REFINE", "0") == "1"
+    REFINE_WAIT_SECONDS = float(os.environ.get("RETRIEVAL_REFINE_WAIT_SECONDS", "0"))
+    WORKERS = 32  # threads shared by the sync retrievers of all interviews
+
+
+def get_retrieval_mode(config: dict):
+    """ Retrieval mode from config["configurable"]["retrieval_mode"] """
+    mode = (config or {}).get("configurable", {}).get("retrieval_mode") or RetrievalMode.DEFAULT
+    if mode not in RetrievalMode.ALL:
+        raise ValueError(f"Unknown retrieval_mode '{mode}', expected one of {RetrievalMode.ALL}")
+    return mode
+
+
+def pipelined_settings(config: dict):
+    """ (quorum, wait_seconds, refine, refine_wait_seconds) for this run """
+    configurable = (config or {}).get("configurable", {})
+    refine = configurable.get("retrieval_refine", RetrievalConfig.REFINE)
+    return (int(configurable.get("retrieval_quorum", RetrievalConfig.QUORUM)),
+            float(configurable.get("retrieval_wait_seconds", RetrievalConfig.WAIT_SECONDS)),
+            refine in (True, "1", "true"),
+            float(configurable.get("retrieval_refine_wait_seconds", RetrievalConfig.REFINE_WAIT_SECONDS)))
+
+
+_pool = ThreadPoolExecutor(max_workers=RetrievalConfig.WORKERS, thread_name_prefix="retriever")
+# Retrievers still running after their interview turn answered: key -> {future or task: retriever name}
+_late = {}
+# Cancellation flags of the retrievers started for an interview: key -> [threading.Event]
+_cancels = {}
+_late_lock = threading.Lock()
+
+
+def _documents(name, future):
+    """ Context documents of a finished retriever; a failed retriever contributes none """
+    try:
+        return future.result()["context"], None
+    except Exception as e:
+        logger.warning(f"Retriever {name} failed: {e}")
+        return [], e
+
+
+class _Quorum:
+    """ Documents gathered from the retrievers finished so far """
+    def __init__(self, quorum, wait_seconds):
+        self.quorum = quorum
+        self.deadline = time.monotonic() + wait_seconds
+        self.documents = []
+        self.useful = 0
+        self.errors = []
+
+    def add(self, name, future):
+        documents, error = _documents(name, future)
+        self.documents += documents
+        self.useful += bool(documents)
+        if error is not None:
+            self.errors.append(error)
+
+    def reached(self):
+        return self.useful >= self.quorum
+
+    def timeout(self):
+        """ Seconds to wait for the next retriever; None until one has brought documents """
+        return max(self.deadline - time.monotonic(), 0) if self.documents else None
+
+    def result(self, pending):
+        if not self.documents and self.errors and not pending:
+            raise self.errors[0]
+        return self.documents
+
+
+def _cancellable(key, retrievers, use_async=False):
+    """ The retrievers, each run under a cancel scope that discard_late(key) sets """
+    cancelled = threading.Event()
+    with _late_lock:
+        _cancels.setdefault(key, []).append(cancelled)
+
+    def scoped(fn):
+        def run():
+            with cancel_scope(cancelled):
+                return fn()
+
+        async def arun():
+            with cancel_scope(cancelled):
+                return await fn()
+        return arun if use_async else run
+
+    return {name: scoped(fn) for name, fn in retrievers.items()}
+
+
+def _park(key, pending):
+    if pending:
+        logger.info(f"Answering before {', '.join(pending.values())} returned")
+        with _late_lock:
+            _late.setdefault(key, {}).update(pending)
+
+
+def gather(key, retrievers, quorum, wait_seconds):
+    """ Start every retriever ({name: fn()}) and return their documents once `quorum` of them brought some,
+    or `wait_seconds` after the first did; the rest keep running and are picked up by collect_late(key) """
+    futures = {_pool.submit(contextvars.copy_context().run, fn): name for name, fn in _cancellable(key, retrievers).items()}
+    state = _Quorum(quorum, wait_seconds)
+    pending = set(futures)
+    while pending and not state.reached():
+        done, pending = wait(pending, timeout=state.timeout(), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            state.add(futures[future], future)
+    _park(key, {future: futures[future] for future in pending})
+    return state.result(pending)
+
+
+async def agather(key, retrievers, quorum, wait_seconds):
+    """ Async counterpart of gather() for {name: coroutine function} """
+    tasks = {asyncio.ensure_future(afn()): name for name, afn in _cancellable(key, retrievers, use_async=True).items()}
+    state = _Quorum(quorum, wait_seconds)
+    pending = set(tasks)
+    try:
+        while pending and not state.reached():
+            done, pending = await asyncio.wait(pending, timeout=state.timeout(), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                state.add(tasks[task], task)
+    except BaseException:
+        for task in pending:
+            task.cancel()
+        raise
+    _park(key, {task: tasks[task] for task in pending})
+    return state.result(pending)
+
+
+def _take_finished(key):
+    documents = []
+    with _late_lock:
+        late = _late.get(key, {})
+        for future in [future for future in late if future.done()]:
+            documents += _documents(late.pop(future), future)[0]
+        if not late:
+            _late.pop(key, None)
+    if documents:
+        logger.info(f"{len(documents)} late documents arrived")
+    return documents
+
+
+def _waiting(key):
+    with _late_lock:
+        return list(_late.get(key, {}))
+
+
+def collect_late(key, wait_seconds=0):
+    """ Documents of late retrievers that have finished, waiting up to wait_seconds for the rest """
+    pending = _waiting(key)
+    if pending and wait_seconds > 0:
+        wait(pending, timeout=wait_seconds)
+    return _take_finished(key)
+
+
+async def acollect_late(key, wait_seconds=0):
+    pending = _waiting(key)
+    if pending and wait_seconds > 0:
+        await asyncio.wait(pending, timeout=wait_seconds)
+    return _take_finished(key)
+
+
+def discard_late(key):
+    """ Forget retrievers still running when the interview ends. Running ones stop at their next provider call
+    (CallCancelled); the call in progress keeps its rate limiter slot until it returns. """
+    with _late_lock:
+        late = _late.pop(key, {})
+        cancels = _cancels.pop(key, [])
+    for cancelled in cancels:
+        cancelled.set()
+    for future in late:
+        future.cancel()
+    if late:
+        logger.info(f"Cancelled {len(late)} late retrievers")
@@ -3,6 +3,7 @@ from langgraph.graph import MessagesState
 from typing import List, Annotated
 from typing_extensions import TypedDict
 from operator import add
+from context_store import merge_documents
 
 class Analyst(BaseModel):
     affiliation: str = Field(
@@ -47,9 +48,12 @@ class GenerateAnalystsState(TypedDict):
 class InterviewState(MessagesState):
     topic: str # Research topic
     max_num_turns: int # Number turns of conversation
-    context: Annotated[list, add] # Source docs
+    context: Annotated[list, merge_documents] # Source docs, deduplicated by source and paragraph
     analyst: Analyst # Analyst asking questions
+    interview_id: str # Unique per interview, even across runs without a thread_id; keys its in-process state
     interview: str # Interview transcript
+    search_queries: dict # Queries plan_queries wrote for this turn, by search engine
+    retrievals: Annotated[list, add] # {"turn", "sources"} of every retrieval round, for the novelty stopping policy
     # sections: list # Final key we duplicate in outer state for Send() API
 
 class InterviewStateOutput(MessagesState):
@@ -58,6 +62,26 @@ class InterviewStateOutput(MessagesState):
 class SearchQuery(BaseModel):
     search_query: str = Field(None, description="Search query for retrieval.")
 
+class QueryPlan(BaseModel):
+    # One field per search engine; a new source adds its field here and its retriever in generate_answer.py
+    tavily: List[str] = Field(
+        description="Queries for Tavily web search, most useful first.",
+    )
+    wikipedia: List[str] = Field(
+        description="Queries for Wikipedia search, most useful first.",
+    )
+
+class FinalReport(BaseModel):
+    introduction: str = Field(
+        description="Report introduction: a # title followed by a ## Introduction section.",
+    )
+    content: str = Field(
+        description="Report body starting with ## Insights and ending with a ## Sources section.",
+    )
+    conclusion: str = Field(
+        description="Report conclusion under a ## Conclusion header.",
+    )
+
 class ResearchState(MessagesState):
     topic: str # Research topic
     max_analysts: int # Number of analysts
@@ -65,7 +89,13 @@ class ResearchState(MessagesState):
     analysts: Annotated[List[Analyst], add] 
     final_analysts: List[Analyst]
     sections: Annotated[list, add]
+    reduced_sections: list # Sections merged to fit the report prompt (hierarchical synthesis)
+    interviews_deadline: float # Epoch seconds by which interviews must end, None without a run budget
+    run_deadline: float # Epoch seconds by which the report must be written, None without a run budget
+    run_id: str # Unique per research run, even without a thread_id; keys its in-process report draft
+    dropped_analysts: Annotated[list, add] # Analysts whose interviews were cut off by the deadline
     introduction: str # Introduction for the final report
     content: str # Content for the final report
     conclusion: str # Conclusion for the final report
-    final_report: str # Final report
\ No newline at end of file
+    final_report: str # Final report
+    run_metrics: dict # Latency, token and cost summary of the run (metrics.run_summary)
\ No newline at end of file
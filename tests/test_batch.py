@@ -0,0 +1,32 @@
+import os
+import pytest
+from batch import read_topics, safe_id
+
+
+def test_csv_topics_with_ids_and_analysts(tmp_path):
+    path = tmp_path / "topics.csv"
+    path.write_text("id,topic,analysts\nsolar,Solar power,2\n,Wind power,\n", encoding="utf-8")
+    solar, wind = read_topics(str(path), default_analysts=3)
+    assert solar == {"id": "solar", "topic": "Solar power", "analysts": 2}
+    assert wind["id"].startswith("wind-power-") and wind["analysts"] == 3
+
+
+@pytest.mark.parametrize("content", ["", "\n"])
+def test_csv_without_header_is_rejected(tmp_path, content):
+    path = tmp_path / "topics.csv"
+    path.write_text(content, encoding="utf-8")
+    with pytest.raises(ValueError, match="no header row"):
+        read_topics(str(path))
+
+
+@pytest.mark.parametrize("topic_id", ["../escape", "/etc/passwd", "a/b", "..", ".hidden", "a\\b"])
+def test_unsafe_ids_stay_in_the_output_directory(tmp_path, topic_id):
+    name = safe_id(topic_id)
+    assert os.sep not in name and "/" not in name and not name.startswith(".")
+    assert os.path.dirname(os.path.abspath(os.path.join(tmp_path, f"{name}.md"))) == str(tmp_path)
+    assert safe_id(topic_id) != safe_id(topic_id + "x")
+
+
+def test_safe_ids_are_kept():
+    assert safe_id("topic-1.v2") == "topic-1.v2"
+    assert safe_id(42) == "42"
@@ -0,0 +1,28 @@
+import threading
+import cache
+from cache import normalize_query
+
+
+def test_normalize_query_ignores_case_and_whitespace_only():
+    assert normalize_query("  Python   vs\tRust ") == "python vs rust"
+    assert normalize_query("python vs rust") != normalize_query("rust vs python")
+    assert normalize_query("not X but Y") != normalize_query("not Y but X")
+    assert normalize_query("new new york") != normalize_query("new york")
+
+
+def test_concurrent_first_use_builds_one_response_cache(monkeypatch):
+    monkeypatch.setattr(cache, "_response_cache", None)
+    monkeypatch.setattr(cache, "_response_cache_configured", False)
+    start = threading.Barrier(8)
+    caches = []
+
+    def use():
+        start.wait()
+        caches.append(cache.get_response_cache())
+
+    threads = [threading.Thread(target=use) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(c) for c in caches}) == 1
@@ -0,0 +1,27 @@
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_google_genai import ChatGoogleGenerativeAI
+from cache import configure_response_cache
+from cassette import configure_cassette
+from llm_model import LLMConfig, create_llm, invoke_llm
+
+
+def test_call_recorded_on_the_live_client_replays(tmp_path, monkeypatch):
+    path = str(tmp_path / "cassette.jsonl.gz")
+    messages = [HumanMessage(content="What is solar power?")]
+    monkeypatch.setattr(LLMConfig, "BACKEND", "google")
+    # The live client, minus the network request
+    monkeypatch.setattr(ChatGoogleGenerativeAI, "invoke", lambda self, messages, *args, **kwargs: AIMessage(content="recorded answer"))
+    configure_response_cache("none")
+    try:
+        configure_cassette("record", path)
+        live = create_llm("gemini-2.0-flash", temperature=0, google_api_key="test")
+        assert isinstance(live, ChatGoogleGenerativeAI) and live.model == "models/gemini-2.0-flash"
+        assert invoke_llm(live, messages).content == "recorded answer"
+
+        configure_cassette("replay", path, latency="none")
+        replay = create_llm("gemini-2.0-flash", temperature=0, google_api_key="test")
+        assert not isinstance(replay, ChatGoogleGenerativeAI)
+        assert invoke_llm(replay, messages).content == "recorded answer"
+    finally:
+        configure_cassette("off")
+        configure_response_cache()
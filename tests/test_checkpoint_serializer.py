@@ -0,0 +1,49 @@
+import pytest
+from langchain_core.messages import AIMessage
+from checkpointer import CheckpointSerializer, MemoryTextStore
+from state import Analyst
+
+LONG = "Solar power is growing quickly. " * 40  # above TEXT_MIN_BYTES and COMPRESS_MIN_BYTES
+
+
+@pytest.mark.parametrize("compression", ["zlib", "none"])
+def test_round_trip_stores_shared_strings_once(compression):
+    store = MemoryTextStore()
+    serde = CheckpointSerializer(store=store, compression=compression)
+    value = {"context": [LONG, LONG], "sections": [LONG + "!"], "short": "kept inline", "n": 3, "none": None}
+    typed = serde.dumps_typed(value)
+    assert typed[0].startswith("cas")
+    assert len(store._texts) == 2  # LONG and LONG + "!"
+    assert len(typed[1]) < len(LONG)  # the payload holds references, not the texts
+    assert serde.loads_typed(typed) == value
+    # A fresh serializer (empty text cache) reads the texts back from the store
+    assert CheckpointSerializer(store=store).loads_typed(typed) == value
+
+
+def test_later_versions_reuse_stored_texts():
+    store = MemoryTextStore()
+    serde = CheckpointSerializer(store=store)
+    first, first_texts = serde.dumps_with_texts({"context": [LONG]})
+    second, second_texts = serde.dumps_with_texts({"context": [LONG, LONG + "!"]})
+    assert set(first_texts) < set(second_texts)
+    store.save_texts(first_texts)
+    store.save_texts(second_texts)
+    assert serde.loads_typed(second) == {"context": [LONG, LONG + "!"]}
+
+
+def test_models_and_messages_keep_their_types():
+    serde = CheckpointSerializer(store=MemoryTextStore())
+    analyst = Analyst(affiliation="Lab", name="Ada", role="Engineer", description=LONG)
+    message = AIMessage(content=LONG, name="expert")
+    restored = serde.loads_typed(serde.dumps_typed({"analysts": [analyst], "messages": [message]}))
+    assert restored["analysts"] == [analyst]
+    assert isinstance(restored["messages"][0], AIMessage)
+    assert restored["messages"][0].content == LONG and restored["messages"][0].name == "expert"
+
+
+def test_bytes_and_disabled_texts_use_the_wrapped_serializer():
+    store = MemoryTextStore()
+    serde = CheckpointSerializer(store=store, text_min_bytes=0, compression="none")
+    assert serde.loads_typed(serde.dumps_typed({"context": [LONG]})) == {"context": [LONG]}
+    assert serde.loads_typed(serde.dumps_typed(b"raw")) == b"raw"
+    assert store._texts == {}
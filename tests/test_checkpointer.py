@@ -0,0 +1,100 @@
+import os
+from typing import TypedDict
+from langgraph.graph import END, START, StateGraph
+from checkpointer import SQLiteSaver
+
+LONG = "Solar power is growing quickly. " * 40  # well above TEXT_MIN_BYTES, so stored once in `texts`
+
+
+class State(TypedDict):
+    topic: str
+    context: str
+    final_report: str
+
+
+def build(saver):
+    builder = StateGraph(State)
+    builder.add_node("search", lambda state: {"context": LONG})
+    builder.add_node("write", lambda state: {"final_report": f"Report on {state['topic']}"})
+    builder.add_edge(START, "search")
+    builder.add_edge("search", "write")
+    builder.add_edge("write", END)
+    return builder.compile(checkpointer=saver)
+
+
+def run(saver, thread_id, interrupt=False):
+    config = {"configurable": {"thread_id": thread_id}}
+    build(saver).invoke({"topic": "solar"}, config, interrupt_before=["write"] if interrupt else None)
+    return config
+
+
+def count(saver, table):
+    return saver._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_database_is_opened_on_first_use(tmp_path):
+    path = tmp_path / "checkpoints.sqlite"
+    saver = SQLiteSaver(str(path))
+    assert not path.exists()
+    assert saver.get_tuple({"configurable": {"thread_id": "missing"}}) is None
+    assert path.exists()
+    saver.close()
+
+
+def test_checkpoint_survives_put_get_list_and_reopen(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    saver = SQLiteSaver(path)
+    config = run(saver, "t1")
+    saver.close()
+
+    reopened = SQLiteSaver(path)
+    latest = reopened.get_tuple(config)
+    assert latest.checkpoint["channel_values"]["final_report"] == "Report on solar"
+    assert latest.checkpoint["channel_values"]["context"] == LONG
+    # Compacted to the latest snapshot of the thread
+    assert [t.config for t in reopened.list(config)] == [latest.config]
+    assert list(reopened.list({"configurable": {"thread_id": "other"}})) == []
+    reopened.close()
+
+
+def test_keep_history_lists_every_step(tmp_path):
+    saver = SQLiteSaver(str(tmp_path / "checkpoints.sqlite"), keep_history=True)
+    config = run(saver, "t1")
+    history = list(saver.list(config))
+    assert len(history) > 2
+    assert history[0].config == saver.get_tuple(config).config
+    assert len(list(saver.list(config, limit=2))) == 2
+    assert [t.metadata["step"] for t in saver.list(config, before=history[0].config)] == [t.metadata["step"] for t in history[1:]]
+
+    saver.compact("t1")
+    assert [t.config for t in saver.list(config)] == [history[0].config]
+    assert saver.get_tuple(config).checkpoint["channel_values"]["final_report"] == "Report on solar"
+    saver.close()
+
+
+def test_interrupted_thread_resumes(tmp_path):
+    saver = SQLiteSaver(str(tmp_path / "checkpoints.sqlite"))
+    config = run(saver, "t1", interrupt=True)
+    assert saver.get_tuple(config).checkpoint["channel_values"].get("final_report") is None
+    state = build(saver).invoke(None, config)
+    assert state["final_report"] == "Report on solar"
+    saver.close()
+
+
+def test_prune_drops_finished_threads_and_frees_their_texts(tmp_path):
+    saver = SQLiteSaver(str(tmp_path / "checkpoints.sqlite"), finished_ttl=3600, idle_ttl=0)
+    finished = run(saver, "finished")
+    unfinished = run(saver, "unfinished", interrupt=True)
+    assert saver.prune() == 0
+    assert count(saver, "texts") == 1  # the same context string, shared by both threads
+
+    assert saver.prune(finished_ttl=-1) == 1
+    assert saver.get_tuple(finished) is None
+    assert saver.get_tuple(unfinished).checkpoint["channel_values"]["context"] == LONG
+    assert count(saver, "texts") == 1  # still referenced by the unfinished thread
+
+    saver.delete_thread("unfinished")
+    assert count(saver, "texts") == 0
+    assert count(saver, "blobs") == 0
+    saver.close()
+
@@ -0,0 +1,54 @@
+import time
+import asyncio
+import threading
+from interview_scheduler import InterviewScheduler
+
+
+def wait_for(condition, timeout=5.0):
+    stop = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < stop
+        time.sleep(0.005)
+
+
+def test_older_run_finishes_before_newer_run_starts():
+    scheduler = InterviewScheduler(max_in_flight=1)
+    order = []
+
+    def interview(run, priority):
+        with scheduler.slot(priority, run=run):
+            order.append((run, priority))
+
+    threads = []
+    with scheduler.slot(run="busy"):
+        # The old run's later analysts queue first, then a newer run's first analyst
+        for run, priority in [("old", 2), ("old", 1), ("new", 0), ("old", 0), ("new", 1)]:
+            threads.append(threading.Thread(target=interview, args=(run, priority)))
+            threads[-1].start()
+            wait_for(lambda: scheduler.waiting == len(threads))
+    for thread in threads:
+        thread.join()
+    assert order == [("old", 0), ("old", 1), ("old", 2), ("new", 0), ("new", 1)]
+    assert scheduler._runs == {}
+
+
+def test_async_slots_follow_run_order():
+    scheduler = InterviewScheduler(max_in_flight=1)
+    order = []
+
+    async def interview(run, priority):
+        async with scheduler.aslot(priority, run=run):
+            order.append((run, priority))
+            await asyncio.sleep(0)
+
+    async def run():
+        async with scheduler.aslot(run="busy"):
+            tasks = []
+            for run_id, priority in [("old", 1), ("new", 0), ("old", 0)]:
+                tasks.append(asyncio.ensure_future(interview(run_id, priority)))
+                await asyncio.sleep(0.01)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == [("old", 0), ("old", 1), ("new", 0)]
+    assert scheduler._runs == {} and scheduler.in_flight == 0
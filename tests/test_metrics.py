@@ -0,0 +1,25 @@
+from metrics import COUNTERS, run_metrics, run_summary
+
+
+def test_summary_is_scoped_to_its_thread():
+    run_metrics.add(("metrics-a", "Ann", "generate_answer"), llm_calls=2)
+    run_metrics.add(("metrics-b", "Bob", "generate_answer"), llm_calls=5)
+    try:
+        summary = run_summary("metrics-a")
+        assert summary["totals"]["llm_calls"] == 2
+        assert list(summary["by_analyst"]) == ["Ann"]
+    finally:
+        run_metrics.clear("metrics-a")
+        run_metrics.clear("metrics-b")
+
+
+def test_run_without_thread_gets_no_process_totals():
+    run_metrics.add(("metrics-c", "Cid", "write_report"), llm_calls=3)
+    run_metrics.add((None, "", "write_report"), llm_calls=7)
+    run_metrics.retire("metrics-c")
+    try:
+        summary = run_summary(None)
+        assert summary["totals"] == dict.fromkeys(COUNTERS, 0)
+        assert summary["by_node"] == {} and summary["by_analyst"] == {}
+    finally:
+        run_metrics.clear(None)
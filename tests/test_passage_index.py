@@ -0,0 +1,61 @@
+import pytest
+from passage_index import BM25Index, VectorIndex, PassageIndex, chunk_text, drop_index, get_index
+
+DOCS = [
+    {"engine": "tavily", "source": "https://a.example", "content": "Solar panels convert sunlight into electricity.\n\n"
+                                                                  "Panel efficiency has improved every year."},
+    {"engine": "wikipedia", "source": "https://b.example", "content": "Wind turbines generate power from moving air.\n\n"
+                                                                     "Offshore wind farms are growing quickly."},
+]
+
+
+@pytest.mark.parametrize("index_class", [BM25Index, VectorIndex])
+def test_ranks_the_matching_passage_first(index_class):
+    if index_class is VectorIndex:
+        pytest.importorskip("numpy")
+    index = index_class()
+    index.update(DOCS)
+    (score, best), *_ = index.search("offshore wind turbines", top_k=2)
+    assert best["source"] == "https://b.example"
+    assert score > 0
+
+
+def test_reindexing_the_same_documents_adds_no_duplicates():
+    index = BM25Index()
+    index.update(DOCS)
+    passages = len(index)
+    index.update(DOCS)
+    index.update(list(reversed(DOCS)))
+    assert len(index) == passages
+    assert len({p["text"] for _, p in index.search("wind solar", top_k=10)}) == len(index.search("wind solar", top_k=10))
+
+
+def test_grown_document_is_rechunked_and_dropped_document_removed():
+    index = BM25Index()
+    index.update(DOCS)
+    grown = dict(DOCS[0], content=DOCS[0]["content"] + "\n\nPerovskite cells promise higher efficiency.")
+    index.update([grown])
+    assert {p["source"] for p in index.passages.values()} == {"https://a.example"}
+    assert index.search("perovskite", top_k=1)[0][1]["source"] == "https://a.example"
+    assert index.search("offshore", top_k=5)[0][0] == 0
+
+
+def test_long_paragraph_is_split_with_overlap():
+    words = [f"w{i}" for i in range(50)]
+    chunks = chunk_text(" ".join(words), chunk_words=20, overlap=5)
+    assert chunks[0].split() == words[:20]
+    assert chunks[1].split()[:5] == words[15:20]
+    assert chunks[-1].split()[-1] == "w49"
+
+
+def test_index_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        PassageIndex()
+
+
+def test_drop_index_forgets_the_interview():
+    index = get_index(("thread", "analyst"))
+    assert get_index(("thread", "analyst")) is index
+    drop_index(("thread", "analyst"))
+    assert get_index(("thread", "analyst")) is not index
+    drop_index(("thread", "analyst"))
@@ -0,0 +1,85 @@
+import time
+import asyncio
+import threading
+import pytest
+from langchain_google_genai import ChatGoogleGenerativeAI
+from deadline import DeadlineConfig
+from llm_model import _abounded, _athrottled, _bounded, _in_thread, _throttled, pick_model
+from rate_limiter import (DEFAULT_RATE_LIMITS, Limiter, RateLimit, configure_rate_limit, get_limiter, model_id,
+                          reset_rate_limits)
+
+
+def test_real_gemini_client_gets_its_model_limiter():
+    # The client reports "models/gemini-2.0-flash-lite"; no request is made
+    llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash-lite", google_api_key="test", max_retries=0)
+    assert llm.model.startswith("models/")
+    reset_rate_limits()
+    limiter = get_limiter("google", llm.model)
+    assert limiter.key == ("google", "gemini-2.0-flash-lite")
+    assert limiter.limit is DEFAULT_RATE_LIMITS[("google", "gemini-2.0-flash-lite")]
+    assert limiter is get_limiter("google", "gemini-2.0-flash-lite")
+
+
+def test_configured_model_budget_applies_to_real_client():
+    llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key="test", max_retries=0)
+    reset_rate_limits()
+    try:
+        configure_rate_limit("google", "gemini-2.0-flash", requests_per_minute=1000)
+        assert get_limiter("google", llm.model).limit.requests_per_minute == 1000
+    finally:
+        reset_rate_limits()
+
+
+def test_model_id():
+    assert model_id("models/gemini-2.0-flash") == "gemini-2.0-flash"
+    assert model_id("gemini-2.0-flash") == "gemini-2.0-flash"
+    assert model_id(None) is None
+
+
+def test_exhausted_real_client_limiter_steals_to_alternate():
+    llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key="test", max_retries=0)
+    reset_rate_limits()
+    try:
+        # Drain the budget real calls to this client acquire
+        limiter = get_limiter("google", llm.model)
+        limiter._requests.consume(limiter.limit.requests_per_minute)
+        assert pick_model("gemini-2.0-flash") == "gemini-2.0-flash-lite"
+        assert pick_model(llm.model) == "gemini-2.0-flash-lite"
+    finally:
+        reset_rate_limits()
+
+
+def test_timed_out_call_keeps_its_slot_until_it_returns(monkeypatch):
+    monkeypatch.setattr(DeadlineConfig, "CALL_SECONDS", 0.05)
+    limiter = Limiter(("test", None), RateLimit(max_concurrent=1))
+    finish = threading.Event()
+    with pytest.raises(TimeoutError):
+        with _throttled(limiter, None):
+            _bounded(finish.wait, "slow call")
+    # Abandoned, but still running at the provider: no new call may start
+    assert limiter.in_flight == 1
+    finish.set()
+    _wait_for(lambda: limiter.in_flight == 0)
+
+
+def test_cancelled_async_thread_call_keeps_its_slot_until_it_returns(monkeypatch):
+    monkeypatch.setattr(DeadlineConfig, "CALL_SECONDS", 0.05)
+    limiter = Limiter(("test", None), RateLimit(max_concurrent=1))
+    finish = threading.Event()
+
+    async def run():
+        async with _athrottled(limiter, None):
+            await _abounded(lambda: _in_thread(finish.wait), "slow call")
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(run())
+    assert limiter.in_flight == 1
+    finish.set()
+    _wait_for(lambda: limiter.in_flight == 0)
+
+
+def _wait_for(condition, timeout=5.0):
+    stop = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < stop
+        time.sleep(0.005)
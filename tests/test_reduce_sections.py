@@ -0,0 +1,59 @@
+import asyncio
+import re
+from langchain_core.messages import AIMessage
+import generate_report
+from generate_report import ReduceConfig, areduce_sections, group_sections, reduce_sections
+
+SECTIONS = [f"## Section {i}\n" + " ".join(f"topic{i % 5} detail{i}-{n}" for n in range(150)) for i in range(25)]
+
+
+def _fake_merge(merged):
+    def invoke(llm, messages, schema=None, node=None):
+        batch = re.findall(r"## Section (\d+)", messages[0].content)
+        merged.append(batch)
+        return AIMessage(content=f"Merged memo of {len(batch)} sections")
+    return invoke
+
+
+def test_group_sections_respects_fan_in_and_budget():
+    batches = group_sections(SECTIONS, token_budget=10 ** 6, max_fan_in=8)
+    assert all(len(batch) <= 8 for batch in batches)
+    assert sorted(section for batch in batches for section in batch) == sorted(SECTIONS)
+    small = group_sections(SECTIONS, token_budget=1000, max_fan_in=8)
+    assert len(small) > len(batches)
+
+
+def test_reduce_merges_more_sections_than_the_fan_in(monkeypatch):
+    merged = []
+    monkeypatch.setattr(generate_report, "get_versatile_llm", lambda api_key: None)
+    monkeypatch.setattr(generate_report, "invoke_llm", _fake_merge(merged))
+    state = {"topic": "Energy", "sections": SECTIONS}
+    config = {"configurable": {"google_api_key": "test", "synthesis_token_budget": 4000}}
+    memos = reduce_sections(state, config)["reduced_sections"]
+    assert len(SECTIONS) > ReduceConfig.MAX_FAN_IN
+    assert 1 < len(memos) < len(SECTIONS)
+    assert all(memo.startswith("Merged memo") for memo in memos)
+    assert all(1 < len(batch) <= ReduceConfig.MAX_FAN_IN for batch in merged)
+    assert sorted(int(i) for batch in merged for i in batch) == list(range(len(SECTIONS)))
+
+
+def test_async_reduce_matches(monkeypatch):
+    merged = []
+    fake = _fake_merge(merged)
+
+    async def ainvoke(llm, messages, schema=None, node=None):
+        return fake(llm, messages, schema, node)
+
+    monkeypatch.setattr(generate_report, "get_versatile_llm", lambda api_key: None)
+    monkeypatch.setattr(generate_report, "ainvoke_llm", ainvoke)
+    state = {"topic": "Energy", "sections": SECTIONS}
+    config = {"configurable": {"google_api_key": "test", "synthesis_token_budget": 4000}}
+    memos = asyncio.run(areduce_sections(state, config))["reduced_sections"]
+    assert len(memos) == len(merged) and all(len(batch) <= ReduceConfig.MAX_FAN_IN for batch in merged)
+
+
+def test_sections_within_budget_are_not_merged(monkeypatch):
+    monkeypatch.setattr(generate_report, "invoke_llm", _fake_merge([]))
+    state = {"topic": "Energy", "sections": SECTIONS[:3]}
+    config = {"configurable": {"google_api_key": "test", "synthesis_token_budget": 10 ** 6}}
+    assert reduce_sections(state, config)["reduced_sections"] == SECTIONS[:3]
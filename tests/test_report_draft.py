@@ -0,0 +1,54 @@
+import re
+from langchain_core.messages import AIMessage
+import report_draft
+from report_draft import ReportDraft
+
+SOLAR = """## Solar
+Panels got cheaper [1]. Storage is the bottleneck [2]. Grids adapt slowly [3].
+
+### Sources
+[1] https://a.example
+[2] https://b.example
+"""
+
+WIND = """## Wind
+Storage is the bottleneck [1]. Offshore farms grow [2][1].
+
+### Sources
+[1] https://b.example
+[2] https://c.example
+"""
+
+
+def test_merged_sections_share_one_citation_list():
+    draft = ReportDraft("Energy")
+    assert draft.add(SOLAR) and draft.add(WIND)
+    assert not draft.add(WIND)
+    solar, wind = draft.pending
+    assert draft.sources == {"https://a.example": 1, "https://b.example": 2, "https://c.example": 3}
+    # [3] is not in the Solar sources: dropped rather than left to collide with Wind's c.example
+    assert "Panels got cheaper [1]. Storage is the bottleneck [2]. Grids adapt slowly." in solar
+    assert "Storage is the bottleneck [2]. Offshore farms grow [3][2]." in wind
+    assert draft.outline == ["Solar", "Wind"]
+
+
+def test_reconciled_citations_all_resolve(monkeypatch):
+    monkeypatch.setattr(report_draft, "get_default_llm", lambda api_key: None)
+    # The fold echoes the memos it was given
+    monkeypatch.setattr(report_draft, "invoke_llm", lambda llm, messages, node=None:
+                        AIMessage(content=messages[0].content.rpartition("Here are the new memos:")[2]))
+    draft = ReportDraft("Energy")
+    draft.add(SOLAR)
+    report = draft.reconcile([SOLAR, WIND], "test")
+    body, _, sources = report.partition("## Sources\n")
+    listed = {number for number in re.findall(r"^\[(\d+)\]", sources, re.MULTILINE)}
+    assert listed == {"1", "2", "3"}
+    assert set(re.findall(r"\[(\d+)\]", body)) == listed
+    assert "Grids adapt slowly." in body and "Offshore farms grow [3][2]." in body
+
+
+def test_section_without_sources_keeps_no_citations():
+    draft = ReportDraft("Energy")
+    draft.add("## Hydro\nDams store energy [4].")
+    assert draft.pending == ["## Hydro\nDams store energy."]
+    assert draft.sources == {}
@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+from llm_model import (CircuitBreaker, CircuitOpenError, RetryConfig, acall_with_resilience, call_with_resilience,
+                       get_circuit_breaker)
+
+
+class ServiceUnavailable(Exception):
+    """ Named like the Google error, so is_retryable() treats it as transient """
+
+
+def test_breaker_opens_after_threshold_then_half_opens():
+    breaker = CircuitBreaker(("test", "opens"), failure_threshold=2, recovery_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    # Cooldown over: exactly one trial call goes through, the rest are short-circuited while it runs
+    assert breaker.before_call() is True
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.before_call() is False
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker(("test", "reopens"), failure_threshold=1, recovery_timeout=60.0)
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.recovery_timeout = 0.0
+    assert breaker.before_call() is True
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_released_trial_lets_the_next_call_try():
+    breaker = CircuitBreaker(("test", "release"), failure_threshold=1, recovery_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.before_call() is True
+    breaker.release_trial()
+    assert breaker.state == "open"
+    assert breaker.before_call() is True
+
+
+def test_cancelled_trial_does_not_wedge_the_breaker():
+    endpoint = ("test", "cancelled")
+    breaker = get_circuit_breaker(endpoint)
+    breaker.failure_threshold, breaker.recovery_timeout = 1, 0.0
+    breaker.record_failure()
+
+    async def hang():
+        await asyncio.sleep(10)
+
+    async def ok():
+        return "ok"
+
+    async def run():
+        task = asyncio.ensure_future(acall_with_resilience(endpoint, hang))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await acall_with_resilience(endpoint, ok)
+
+    assert asyncio.run(run()) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_retries_transient_errors(monkeypatch):
+    monkeypatch.setattr(RetryConfig, "BASE_DELAY", 0.001)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ServiceUnavailable("try again")
+        return "done"
+
+    assert call_with_resilience(("test", "flaky"), flaky) == "done"
+    assert len(attempts) == 3
+
+
+def test_does_not_retry_permanent_errors():
+    attempts = []
+
+    def bad_request():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        call_with_resilience(("test", "permanent"), bad_request)
+    assert len(attempts) == 1
+    assert get_circuit_breaker(("test", "permanent")).state == "closed"
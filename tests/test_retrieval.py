@@ -0,0 +1,54 @@
+import threading
+from deadline import CallCancelled, check_deadline
+from llm_model import _throttled
+from rate_limiter import Limiter, RateLimit
+import retrieval
+from retrieval import collect_late, discard_late, gather
+
+
+def test_quorum_answers_first_and_late_retriever_joins_later():
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return {"context": ["late"]}
+
+    key = ("thread", "quorum")
+    assert gather(key, {"fast": lambda: {"context": ["doc"]}, "slow": slow}, quorum=1, wait_seconds=0) == ["doc"]
+    release.set()
+    assert collect_late(key, wait_seconds=5) == ["late"]
+    discard_late(key)
+    assert key not in retrieval._late and key not in retrieval._cancels
+
+
+def test_discarded_retriever_makes_no_further_provider_calls():
+    limiter = Limiter(("test", None), RateLimit(max_concurrent=1))
+    release, finished = threading.Event(), threading.Event()
+    outcome = []
+
+    def slow():
+        release.wait(5)
+        try:
+            with _throttled(limiter, "search_web"):
+                outcome.append("called")
+        except CallCancelled:
+            outcome.append("cancelled")
+            raise
+        finally:
+            finished.set()
+
+    key = ("thread", "discarded")
+    gather(key, {"fast": lambda: {"context": ["doc"]}, "slow": slow}, quorum=1, wait_seconds=0)
+    discard_late(key)
+    release.set()
+    assert finished.wait(5)
+    assert outcome == ["cancelled"]
+    assert limiter.stats["acquired"] == 0
+    assert key not in retrieval._cancels
+
+
+def test_cancel_scope_only_applies_to_the_retrievers():
+    key = ("thread", "scope")
+    gather(key, {"fast": lambda: {"context": ["doc"]}}, quorum=1, wait_seconds=0)
+    discard_late(key)
+    check_deadline("the next node")  # the interview's own calls are unaffected
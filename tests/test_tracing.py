@@ -0,0 +1,43 @@
+import contextvars
+import tracing
+from tracing import node_span, run_span
+
+
+def test_branches_of_a_run_without_thread_end_with_its_root_span():
+    with run_span(None, "run_graph") as root:
+        with node_span("generate_question", None, "Ann", "conduct_interview:1|generate_question:2") as node:
+            branch = tracing._branches[(root.trace_id, "conduct_interview:1")]
+            assert node.parent_id == branch.span_id and node.trace_id == root.trace_id
+    assert branch.end_ns is not None
+    assert not [key for key in tracing._branches if key[0] == root.trace_id]
+
+
+def test_fan_in_closes_only_its_own_runs_branches():
+    # Two runs without thread ids, interleaved in separate contexts as on two worker threads
+    a_context, b_context = contextvars.Context(), contextvars.Context()
+    a_run, b_run = run_span(None, "run_graph"), run_span(None, "run_graph")
+    a, b = a_context.run(a_run.__enter__), b_context.run(b_run.__enter__)
+
+    def branch_node(analyst):
+        with node_span("generate_question", None, analyst, "conduct_interview:1|generate_question:2"):
+            pass
+    a_context.run(branch_node, "Ann")
+    b_context.run(branch_node, "Bob")
+    branch_a = tracing._branches[(a.trace_id, "conduct_interview:1")]
+    branch_b = tracing._branches[(b.trace_id, "conduct_interview:1")]
+
+    def fan_in():
+        with node_span("write_report", None):
+            pass
+    b_context.run(fan_in)
+    assert branch_b.end_ns is not None and branch_a.end_ns is None
+    a_context.run(a_run.__exit__, None, None, None)
+    b_context.run(b_run.__exit__, None, None, None)
+    assert branch_a.end_ns is not None
+
+
+def test_branch_nodes_without_root_or_thread_are_not_tracked():
+    before = dict(tracing._branches)
+    with node_span("generate_question", None, "Ann", "conduct_interview:1|generate_question:2") as node:
+        assert node.parent_id is None
+    assert tracing._branches == before
@@ -0,0 +1,361 @@
+import os
+import json
+import time
+import queue
+import atexit
+import hashlib
+import inspect
+import logging
+import functools
+import secrets
+import threading
+import contextvars
+from contextlib import contextmanager
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class TracingConfig:
+    # "auto" (OTLP when an endpoint is set, else off), "otlp", "jsonl" or "off". Spans hold raw search queries,
+    # so nothing is written to disk unless asked for with "jsonl" (or as the fallback of a failing "otlp")
+    EXPORTER = os.environ.get("TRACING", "auto")
+    OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "")  # e.g. http://localhost:4318
+    # Resolved from this file so traces land in one place regardless of the working directory
+    FILE = os.environ.get("TRACE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "traces.jsonl"))
+    # The file is rotated to FILE + ".1" once it reaches this size, so at most twice this is kept
+    FILE_MAX_BYTES = int(os.environ.get("TRACE_FILE_MAX_BYTES", str(50 * 2**20)))
+    SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "research-assistant")
+    BATCH_SIZE = 64
+    FLUSH_INTERVAL = 2.0  # seconds
+
+
+def trace_id_for(thread_id):
+    """ A research thread is one trace: its id is derived from the thread id, so every client sees the same one """
+    if not thread_id:
+        return secrets.token_hex(16)
+    return hashlib.sha256(str(thread_id).encode("utf-8")).hexdigest()[:32]
+
+
+class Span:
+    """ A timed operation with attributes, in the OpenTelemetry data model """
+    def __init__(self, name, trace_id, parent_id=None, attributes=None, kind="internal"):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.status = "ok"
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.last_child_end_ns = self.start_ns
+        self.child_runs = {}
+
+    def set_attribute(self, key, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def add_event(self, name, **attributes):
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes})
+
+    def record_error(self, error):
+        self.status = "error"
+        self.status_message = f"{type(error).__name__}: {error}"[:500]
+
+    def end(self, end_ns=None):
+        if self.end_ns is None:
+            self.end_ns = end_ns or time.time_ns()
+            _processor().submit(self)
+
+    @property
+    def traceparent(self):
+        """ W3C trace context header value pointing at this span """
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self):
+        return {"trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id, "name": self.name,
+                "kind": self.kind, "start_ns": self.start_ns, "end_ns": self.end_ns,
+                "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3), "status": self.status,
+                "status_message": self.status_message, "attributes": self.attributes, "events": self.events}
+
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span():
+    return _current_span.get()
+
+
+@contextmanager
+def start_span(name, attributes=None, thread_id=None, parent=None, kind="internal"):
+    """ Run the block in a child span of `parent` (default: the current span), or a new root of the thread's trace """
+    parent = parent or _current_span.get()
+    if parent is not None:
+        span = Span(name, parent.trace_id, parent.span_id, attributes, kind)
+    else:
+        span = Span(name, trace_id_for(thread_id), None, attributes, kind)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+        if parent is not None:
+            parent.last_child_end_ns = max(parent.last_child_end_ns, span.end_ns)
+
+
+def set_span_attributes(attributes):
+    span = _current_span.get()
+    if span is not None:
+        for key, value in attributes.items():
+            span.set_attribute(key, value)
+
+
+def traced(name, kind="client"):
+    """ Decorator running a function (sync or async) in a child span of the current span """
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(name, {"node": kwargs.get("node")}, kind=kind):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with start_span(name, {"node": kwargs.get("node")}, kind=kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def add_span_event(name, **attributes):
+    span = _current_span.get()
+    if span is not None:
+        span.add_event(name, **attributes)
+
+
+# Open Send-branch spans by (trace_id, branch namespace). A branch has no single call to wrap, so its span
+# starts with its first node and ends at the fan-in: the next parent-graph node or the end of the root span.
+_branches = {}
+_branches_lock = threading.Lock()
+
+
+def _run_trace_id(thread_id):
+    """ Trace of the run the current node belongs to, or None for a run with neither a root span nor a thread id """
+    parent = _current_span.get()
+    if parent is not None:
+        return parent.trace_id
+    return trace_id_for(thread_id) if thread_id else None
+
+
+def _branch_span(thread_id, namespace, analyst):
+    trace_id = _run_trace_id(thread_id)
+    if trace_id is None:
+        # Nothing would ever close it: its nodes become roots of their own instead
+        return None
+    with _branches_lock:
+        span = _branches.get((trace_id, namespace))
+        if span is None:
+            parent = _current_span.get()
+            name = namespace.split(":")[0]
+            attributes = {"langgraph.branch": namespace, "analyst": analyst}
+            span = Span(name, trace_id, parent.span_id if parent else None, attributes)
+            _branches[(trace_id, namespace)] = span
+        return span
+
+
+def close_branches(trace_id):
+    """ End every open Send-branch span of a trace at the time its last node finished """
+    if trace_id is None:
+        return
+    with _branches_lock:
+        spans = [_branches.pop(key) for key in [key for key in _branches if key[0] == trace_id]]
+    for span in spans:
+        span.end(span.last_child_end_ns)
+
+
+@contextmanager
+def node_span(node, thread_id, analyst="", namespace=""):
+    """ Span for one node run; nodes of a Send branch (checkpoint namespace "branch:id|node:id") nest under it """
+    branch_namespace = namespace.split("|")[0] if "|" in namespace else None
+    if branch_namespace is None:
+        # A parent-graph node starting means any fanned-out branches have joined
+        close_branches(_run_trace_id(thread_id))
+        parent = _current_span.get()
+    else:
+        parent = _branch_span(thread_id, branch_namespace, analyst)
+    attributes = {"langgraph.node": node, "thread_id": thread_id, "analyst": analyst or None}
+    if parent is not None:
+        run = parent.child_runs[node] = parent.child_runs.get(node, 0) + 1
+        attributes["langgraph.node.run"] = run  # for generate_question this is the interview turn
+    with start_span(node, attributes, thread_id=thread_id, parent=parent) as span:
+        yield span
+
+
+@contextmanager
+def run_span(thread_id, name, **attributes):
+    """ Root span for one client call (start, resume or stream) on a research thread """
+    with start_span(name, dict(attributes, thread_id=thread_id), thread_id=thread_id, kind="server") as span:
+        try:
+            yield span
+        finally:
+            close_branches(span.trace_id)
+
+
+class JsonlExporter:
+    def __init__(self, path, max_bytes=TracingConfig.FILE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _rotate(self):
+        try:
+            if self.max_bytes and os.path.getsize(self.path) >= self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+        except FileNotFoundError:
+            pass
+
+    def export(self, spans):
+        self._rotate()
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), default=str, separators=(",", ":")) + "\n")
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+_OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+class OTLPHttpExporter:
+    """ OTLP/HTTP with JSON encoding, so no collector SDK is needed """
+    def __init__(self, endpoint, service_name=TracingConfig.SERVICE_NAME, timeout=5):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.timeout = timeout
+
+    def export(self, spans):
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+            "scopeSpans": [{"scope": {"name": "research-assistant"}, "spans": [{
+                "traceId": span.trace_id, "spanId": span.span_id, "parentSpanId": span.parent_id or "",
+                "name": span.name, "kind": _OTLP_KINDS.get(span.kind, 1),
+                "startTimeUnixNano": str(span.start_ns), "endTimeUnixNano": str(span.end_ns),
+                "attributes": _otlp_attributes(span.attributes),
+                "events": [{"name": e["name"], "timeUnixNano": str(e["time_ns"]), "attributes": _otlp_attributes(e["attributes"])}
+                           for e in span.events],
+                "status": {"code": 2 if span.status == "error" else 1, "message": span.status_message},
+            } for span in spans]}],
+        }]}
+        response = requests.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class BatchSpanProcessor:
+    """ Hands finished spans to the exporter from a daemon thread; falls back to JSON lines if OTLP fails """
+    def __init__(self, exporter, fallback=None):
+        self.exporter = exporter
+        self.fallback = fallback
+        self._queue = queue.Queue()
+        self._flushed = threading.Condition()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+        atexit.register(self.flush)
+
+    def submit(self, span):
+        self._queue.put(span)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + TracingConfig.FLUSH_INTERVAL
+            while len(batch) < TracingConfig.BATCH_SIZE and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            spans = [span for span in batch if span is not None]
+            if spans:
+                self._export(spans)
+            for _ in range(len(batch) - len(spans)):
+                with self._flushed:
+                    self._flushed.notify_all()
+
+    def _export(self, spans):
+        try:
+            self.exporter.export(spans)
+        except Exception as e:
+            if self.fallback is None:
+                logger.warning(f"Dropped {len(spans)} spans: {e}")
+                return
+            logger.warning(f"Span export failed ({e}), writing {len(spans)} spans to {self.fallback.path}")
+            self.fallback.export(spans)
+
+    def flush(self, timeout=5.0):
+        """ Block until every span submitted so far is exported """
+        with self._flushed:
+            self._queue.put(None)
+            self._flushed.wait(timeout)
+
+
+class _NoopProcessor:
+    def submit(self, span):
+        pass
+
+    def flush(self, timeout=None):
+        pass
+
+
+_span_processor = None
+_processor_lock = threading.RLock()
+
+
+def configure_tracing(exporter=None, endpoint=None, path=None):
+    """ (Re)build the span exporter: "auto", "otlp", "jsonl" or "off" """
+    global _span_processor
+    exporter = exporter or TracingConfig.EXPORTER
+    endpoint = endpoint or TracingConfig.OTLP_ENDPOINT
+    if exporter == "auto":
+        exporter = "otlp" if endpoint else "off"
+    jsonl = JsonlExporter(path or TracingConfig.FILE) if exporter != "off" else None
+    with _processor_lock:
+        if _span_processor is not None:
+            _span_processor.flush()
+        if exporter == "off":
+            _span_processor = _NoopProcessor()
+        elif exporter == "otlp":
+            _span_processor = BatchSpanProcessor(OTLPHttpExporter(endpoint or "http://localhost:4318"), fallback=jsonl)
+        else:
+            _span_processor = BatchSpanProcessor(jsonl)
+    logger.info(f"Tracing exporter: {exporter}")
+    return _span_processor
+
+
+def _processor():
+    with _processor_lock:
+        if _span_processor is None:
+            configure_tracing()
+        return _span_processor
+
+
+def flush_tracing():
+    _processor().flush()